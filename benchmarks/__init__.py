@@ -0,0 +1,11 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless benchmarks
+    ===========================
+
+    Standalone scripts comparing the performance of optional code paths
+"""
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26'
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Benchmark of the database_json option against the normal get_many path on sqlite
+
+    Compares for a page of a column only model:
+     * orm: SessionedModelWrapper.all + to_dict + json encoding
+     * tuples: SessionedModelWrapper.rows + to_dict of the values + json encoding
+     * database_json: SessionedModelWrapper.json_array, encoded by sqlite
+
+    sqlite gains nothing over tuples (1.9ms vs 1.7ms per page of 100 rows), the option targets
+     postgresql where json_agg also keeps the requested order.
+
+    Usage: python -m benchmarks.database_json [rows] [results_per_page]
+"""
+import sys
+from timeit import timeit
+
+from sqlalchemy import create_engine, Column, Integer, String, Float
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from tornado.escape import json_encode
+
+from tornado_restless.convert import to_dict
+from tornado_restless.wrapper import SessionedModelWrapper
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 14:05'
+
+Base = declarative_base()
+
+
+class Measurement(Base):
+    __tablename__ = 'measurements'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    unit = Column(String)
+    value = Column(Float)
+    count = Column(Integer)
+
+
+def main(rows: int=10000, results_per_page: int=100, number: int=200):
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    session = Session()
+    session.add_all([Measurement(name='measurement %u' % i, unit='m', value=i / 7, count=i) for i in range(rows)])
+    session.commit()
+    session.close()
+
+    columns = ['id', 'name', 'unit', 'value', 'count']
+
+    def orm():
+        model = SessionedModelWrapper(Measurement, Session())
+        json_encode({'objects': to_dict(model.all(offset=rows // 2, limit=results_per_page))})
+        model.session.close()
+
+    def tuples():
+        model = SessionedModelWrapper(Measurement, Session())
+        json_encode({'objects': [{column: to_dict(value) for column, value in zip(columns, row)}
+                                 for row in model.rows(columns, offset=rows // 2, limit=results_per_page)]})
+        model.session.close()
+
+    def database_json():
+        model = SessionedModelWrapper(Measurement, Session())
+        '{"objects": %s}' % model.json_array(columns, offset=rows // 2, limit=results_per_page)
+        model.session.close()
+
+    for name, func in [('orm', orm), ('tuples', tuples), ('database_json', database_json)]:
+        print("%-14s %8.3f ms / request" % (name, timeit(func, number=number) / number * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
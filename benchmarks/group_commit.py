@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Benchmark of group commit (ApiManager.create_write_coalescer) on a file backed sqlite database
+
+    Sends concurrent single POST requests and reports the writes per second
+     * single: every request commits its own transaction
+     * group: requests within the window share one transaction
+
+    Usage: python -m benchmarks.group_commit [requests] [concurrency]
+"""
+import os
+import sys
+from tempfile import mkdtemp
+from time import perf_counter
+
+from sqlalchemy import create_engine, event, Column, Integer, String, Float
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, scoped_session
+from tornado import gen
+from tornado.escape import json_encode
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.web import Application
+from tornado.httpserver import HTTPServer
+
+from tornado_restless import ApiManager
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 20:30'
+
+Base = declarative_base()
+
+
+class Measurement(Base):
+    __tablename__ = 'measurements'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    value = Column(Float)
+
+
+def create_engine_with_savepoints(path: str):
+    """
+        File backed sqlite engine, with the pysqlite workaround needed for SAVEPOINT
+    """
+    engine = create_engine('sqlite:///%s' % path)
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute("PRAGMA synchronous = FULL")
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.execute("BEGIN")
+
+    return engine
+
+
+def run(group: bool, requests: int, concurrency: int) -> float:
+    """
+        Runs the benchmark against a fresh database
+
+        :return: Writes per second
+    """
+    engine = create_engine_with_savepoints(os.path.join(mkdtemp(), 'benchmark.lite'))
+    Base.metadata.create_all(engine)
+
+    application = Application([])
+    manager = ApiManager(application=application, session_maker=scoped_session(sessionmaker(bind=engine)))
+    manager.create_api(Measurement, methods=ApiManager.METHODS_ALL)
+    if group:
+        manager.create_write_coalescer()
+
+    sockets = bind_sockets(0, '127.0.0.1')
+    server = HTTPServer(application)
+    server.add_sockets(sockets)
+    url = 'http://127.0.0.1:%u/api/measurements' % sockets[0].getsockname()[1]
+
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+
+    @gen.coroutine
+    def worker(num: int):
+        for i in range(num):
+            yield client.fetch(url, method='POST', headers={'Content-Type': 'application/json'},
+                               body=json_encode({'name': 'measurement %u' % i, 'value': i / 7}))
+
+    @gen.coroutine
+    def main():
+        start = perf_counter()
+        yield [worker(requests // concurrency) for _ in range(concurrency)]
+        return perf_counter() - start
+
+    elapsed = IOLoop.current().run_sync(main)
+
+    server.stop()
+    client.close()
+    engine.dispose()
+
+    return (requests // concurrency * concurrency) / elapsed
+
+
+def main(requests: int=2000, concurrency: int=32):
+    for name, group in [('single', False), ('group', True)]:
+        print("%-8s %8.1f writes / second" % (name, run(group, requests, concurrency)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,47 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from tornado_restless import ApiManager
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 02:35'
+
+
+class TestAdmission(TestBase):
+    """
+        Test load shedding of blueprints
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='admitted_computers', max_concurrent_writes=2,
+                                       max_queued_requests=1, queue_timeout=0.1, retry_after=3)
+        # Holds the slots of the writes longer than the queue timeout
+        self.api['tornado'].create_write_coalescer(window=0.3)
+
+    def test_rejected(self):
+        """
+            Test for raising 503 with Retry-After once the slots are taken and the queue is full or times out
+        """
+
+        def post(ram):
+            return requests.post('http://localhost:%u/api/admitted_computers' % self.config['tornado']['port'],
+                                 json={'cpu': 1.0, 'ram': ram, '_user': 1})
+
+        with ThreadPoolExecutor(5) as executor:
+            responses = list(executor.map(post, range(5)))
+        assert sorted(response.status_code for response in responses) == [201, 201, 503, 503, 503]
+        assert all(response.headers['Retry-After'] == '3' for response in responses if response.status_code == 503)
+
+        # The slots are released
+        with ThreadPoolExecutor(2) as executor:
+            responses = list(executor.map(post, range(2)))
+        assert [response.status_code for response in responses] == [201, 201]
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 16:40'
+
+
+class TestBatch(TestBase):
+    """
+        Test the result of some /_batch operations
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_batch_api()
+
+    def test_order(self):
+        """
+            Test that results are returned in the order of the operations
+        """
+
+        operations = [{'method': 'GET', 'collection': 'persons', 'id': 1},
+                      {'method': 'POST', 'collection': 'computers', 'body': {'_user': 1, 'cpu': 1, 'ram': 1}},
+                      {'method': 'GET', 'collection': 'unknowns'},
+                      {'method': 'POST', 'collection': 'cities', 'body': {'name': 'Jules'}}]
+        results = self.curl_tornado('/api/_batch', 'post', json=operations)
+
+        assert [result['status'] for result in results] == [200, 201, 404, 405]
+        assert results[0]['body']['name'] == 'Anastacia'
+        assert results[1]['body']['cpu'] == 1
+
+    def test_atomic(self):
+        """
+            Test that a failing operation rolls back an atomic batch
+        """
+
+        operations = [{'method': 'PATCH', 'collection': 'persons', 'id': 1, 'body': {'name': 'Jules'}},
+                      {'method': 'PATCH', 'collection': 'persons', 'id': 2, 'body': {'name': 'Jules'}}]
+        results = self.curl_tornado('/api/_batch', 'post', json={'operations': operations, 'atomic': True})
+
+        assert [result['status'] for result in results] == [424, 400]
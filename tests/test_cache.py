@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+
+from tornado_restless import ApiManager
+from tornado_restless.cache import CountCache
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 23:05'
+
+
+class TestCountCache(TestBase):
+    """
+        Test the cached count strategy of get_many
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='counted_computers', count_strategy='cached')
+
+    def test_invalidation(self):
+        """
+            Test that a write through the api invalidates the cached counts
+        """
+
+        filters = [dict(name='ram', op='>', val=0)]
+        params = dict(q=json.dumps(dict(filters=filters)))
+
+        first = self.curl_tornado('/api/counted_computers', params=params)
+        assert first['num_results_exact'] is True
+
+        cached = self.curl_tornado('/api/counted_computers', params=params)
+        assert cached['num_results_exact'] is False
+        assert cached['num_results'] == first['num_results']
+
+        self.curl_tornado('/api/counted_computers', 'post', json={'cpu': 1.5, 'ram': 4, '_user': 1})
+
+        counted = self.curl_tornado('/api/counted_computers', params=params)
+        assert counted['num_results_exact'] is True
+        assert counted['num_results'] == first['num_results'] + 1
+
+    def test_generation(self):
+        """
+            Test that a count started before an invalidation is not cached
+        """
+
+        cache = CountCache()
+        model = self.models['Computer'][0]
+
+        generation = cache.generation(model)
+        cache.invalidate(model)
+        cache.set(model, 'key', 3, 60, generation)
+        assert cache.get(model, 'key') is None
+
+        cache.set(model, 'key', 4, 60, cache.generation(model))
+        assert cache.get(model, 'key') == 4
+
+
+class TestInstanceCache(TestBase):
+    """
+        Test the cached instances of get_single
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='cached_computers', cache_instances=True,
+                                       include_columns=['_id', 'cpu', 'ram'])
+        self.api['tornado'].create_batch_api()
+
+    def test_hits(self):
+        """
+            Test that repeated GET of an instance is answered from the cache
+        """
+
+        cache = self.api['tornado'].instance_cache
+
+        assert self.curl_tornado('/api/cached_computers/1')['cpu'] == 3.2
+        assert (cache.hits, cache.misses) == (0, 1)
+        assert self.curl_tornado('/api/cached_computers/1')['cpu'] == 3.2
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # Other fields are another entry
+        params = dict(q=json.dumps(dict(fields=['ram'])))
+        assert self.curl_tornado('/api/cached_computers/1', params=params) == {'ram': 4.0}
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_invalidation(self):
+        """
+            Test that writes through the api, batches included, invalidate the cached instances
+        """
+
+        self.curl_tornado('/api/cached_computers/1')
+
+        self.curl_tornado('/api/cached_computers/1', 'patch', assert_for=201, json={'_id': 1, 'cpu': 1.0, 'ram': 4.0})
+        assert self.curl_tornado('/api/cached_computers/1')['cpu'] == 1.0
+
+        self.curl_tornado('/api/cached_computers/1', 'put', assert_for=201, json={'_id': 1, 'cpu': 2.0, 'ram': 4.0})
+        assert self.curl_tornado('/api/cached_computers/1')['cpu'] == 2.0
+
+        self.curl_tornado('/api/_batch', 'post', json=[dict(method='patch', collection='cached_computers', id=1,
+                                                            body={'_id': 1, 'cpu': 3.0, 'ram': 4.0})])
+        assert self.curl_tornado('/api/cached_computers/1')['cpu'] == 3.0
@@ -0,0 +1,39 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import socket
+from time import sleep
+
+from tornado_restless import ApiManager
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 00:20'
+
+
+class TestCancel(TestBase):
+    """
+        Test requests whose client closed the connection
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='cancelled_computers',
+                                       preprocessor={'get_many': [lambda **kwargs: sleep(0.3)]})
+
+    def test_closed(self):
+        """
+            Test that a GET is cancelled and counted once the client is gone
+        """
+
+        connection = socket.create_connection(('localhost', self.config['tornado']['port']))
+        connection.sendall(b'GET /api/cancelled_computers HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        sleep(0.1)
+        connection.close()
+
+        # The next request is served after the cancelled one
+        assert self.curl_tornado('/api/cancelled_computers/1')['cpu'] == 3.2
+        assert self.api['tornado'].cancelled_requests == 1
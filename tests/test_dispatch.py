@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+import logging
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 10:12'
+
+
+class TestDispatch(TestBase):
+    """
+        Test the blueprints served by one dispatcher route
+    """
+
+    dispatch = True
+
+    def test_many(self):
+        """
+            Test a query through the dispatcher
+        """
+
+        filters = [dict(name='name', op='like', val='%r%')]
+        params = dict(q=json.dumps(dict(filters=filters)))
+
+        flask_data = self.curl_flask('/api/persons', params=params)
+        tornado_data = self.curl_tornado('/api/persons', params=params)
+
+        logging.debug(flask_data)
+        logging.debug(tornado_data)
+
+        assert self.subsetOf(flask_data, tornado_data)
+
+    def test_single(self):
+        """
+            Test for a specific computer per pk
+        """
+
+        flask_data = self.curl_flask('/api/computers/1')
+        tornado_data = self.curl_tornado('/api/computers/1')
+
+        logging.debug(flask_data)
+        logging.debug(tornado_data)
+
+        assert self.subsetOf(flask_data, tornado_data)
+
+    def test_unknown(self):
+        """
+            Test for an unknown collection
+        """
+
+        self.curl_tornado('/api/unknowns', assert_for=404)
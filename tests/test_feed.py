@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+from threading import Thread
+from time import sleep
+
+import requests
+
+from tornado_restless import ApiManager
+from tornado_restless.feed import ChangeFeed, EventFilter
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 01:55'
+
+
+class TestChangeFeed(TestBase):
+    """
+        Test the events of writes streamed to the subscribers of a collection
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='fed_computers', change_feed=True, allow_patch_many=True)
+        self.api['tornado'].create_feed_api(keepalive=0.2)
+
+    def listen(self, events: list, filters: list):
+        """
+            Appends the events of the stream to events until the first keepalive after an event
+        """
+        url = 'http://localhost:%u/api/_events/fed_computers' % self.config['tornado']['port']
+        response = requests.get(url, params=dict(q=json.dumps(dict(filters=filters))), stream=True)
+        try:
+            event = {}
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith(':') and events:
+                    return
+                elif line.startswith('event: '):
+                    event['event'] = line[len('event: '):]
+                elif line.startswith('data: '):
+                    event['data'] = json.loads(line[len('data: '):])
+                elif line == '' and event:
+                    events.append(event)
+                    event = {}
+        finally:
+            response.close()
+
+    def test_delivery(self):
+        """
+            Test that subscribers receive the events matching their filters
+        """
+
+        events, fast = [], []
+        listeners = [Thread(target=self.listen, args=(events, [])),
+                     Thread(target=self.listen, args=(fast, [dict(name='cpu', op='>', val=5)]))]
+        for listener in listeners:
+            listener.start()
+        sleep(0.3)
+
+        self.curl_tornado('/api/fed_computers', 'post', assert_for=201, json={'_id': 10, 'cpu': 1.0, '_user': 1})
+        self.curl_tornado('/api/fed_computers/10', 'patch', assert_for=201, json={'cpu': 8.0})
+        filters = [dict(name='_id', op='in', val=[1, 2])]
+        self.curl_tornado('/api/fed_computers', 'patch', assert_for=201, json={'ram': 2},
+                          params=dict(q=json.dumps(dict(filters=filters))))
+        for listener in listeners:
+            listener.join(5)
+
+        assert [(event['event'], event['data']['object']['_id']) for event in events] == \
+            [('create', 10), ('update', 10), ('update', 1), ('update', 2)]
+        assert [(event['event'], event['data']['object']['_id']) for event in fast] == \
+            [('update', 10), ('update', 1), ('update', 2)]
+
+    def test_overflow(self):
+        """
+            Test that a subscriber not reading its events is dropped
+        """
+
+        feed = ChangeFeed(max_buffer=2)
+        subscriber = feed.subscribe([EventFilter(dict(name='cpu', op='>', val=5))])
+
+        feed.deliver([('create', {'_id': 1, 'cpu': 1.0}), ('create', {'_id': 2, 'cpu': 8.0}),
+                      ('update', {'_id': 3, 'cpu': 9.0})])
+        assert not subscriber.closed
+        assert [event['object']['_id'] for event in subscriber.buffer] == [2, 3]
+
+        feed.deliver([('update', {'_id': 4, 'cpu': 9.0})])
+        assert subscriber.closed and subscriber.dropped
+        assert not subscriber.buffer
+
+        feed.unsubscribe(subscriber)
+        assert feed.dropped == 1
+        assert feed.published == 4
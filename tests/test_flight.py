@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from time import sleep
+
+from tornado_restless import ApiManager
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 00:45'
+
+
+class TestSingleFlight(TestBase):
+    """
+        Test concurrent GET requests sharing one computation
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_executor(max_workers=1)
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='flight_computers', single_flight=True)
+
+    def test_shared(self):
+        """
+            Test that identical requests share the result and requests of other clients don't
+        """
+
+        api = self.api['tornado']
+
+        # Occupy the only worker until all requests are in flight
+        gate = Event()
+        api.executor.submit(gate.wait)
+
+        headers = [{}, {}, {}, {'Authorization': 'Basic dXNlcjpwYXNz'}]
+        with ThreadPoolExecutor(len(headers)) as executor:
+            responses = [executor.submit(self.curl_tornado, '/api/flight_computers/1', headers=header)
+                         for header in headers]
+            for _ in range(100):
+                if api.coalesced_requests == 2 and len(api.flights) == 2:
+                    break
+                sleep(0.05)
+            gate.set()
+            results = [response.result() for response in responses]
+
+        assert api.coalesced_requests == 2
+        assert all(result['cpu'] == 3.2 for result in results)
+        assert api.flights == {}
@@ -5,6 +5,9 @@
 """
 import json
 import logging
+
+from sqlalchemy import event
+
 from .base import TestBase
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
@@ -142,9 +145,233 @@ class TestGet(TestBase):
         assert self.subsetOf(flask_data, tornado_data)
         assert len(flask_data['objects']) == 2 == len(tornado_data['objects'])
 
+    def test_relation(self):
+        """
+            Test the paginated related instances of a person
+        """
+
+        filters = [dict(name='cpu', op='>', val=5)]
+        params = dict(q=json.dumps(dict(filters=filters)))
+
+        tornado_data = self.curl_tornado('/api/persons/1/computers')
+        assert tornado_data['num_results'] == 2
+
+        tornado_data = self.curl_tornado('/api/persons/1/computers', params=params)
+        assert tornado_data['num_results'] == len(tornado_data['objects']) == 1
+        assert tornado_data['objects'][0]['cpu'] == 12
+
+        self.curl_tornado('/api/persons/1/unknowns', assert_for=400)
+
     def test_nothing(self):
         """
             Test for some missing data
         """
 
-        self.curl_tornado('/api/persons/1337', assert_for=400)
\ No newline at end of file
+        self.curl_tornado('/api/persons/1337', assert_for=400)
+
+
+class TestCappedRelations(TestBase):
+    """
+        Test embedded relations capped by max_relation_results
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['City'][0], collection_name='capped_cities',
+                                       max_relation_results=1,
+                                       include_columns=['_plz', 'persons._user', 'persons.user.name',
+                                                        'persons.user.computers._id'])
+        self.api['tornado'].create_api(self.models['Person'][0], collection_name='capped_persons',
+                                       max_relation_results=1, include_columns=['_id', 'computers.cpu'])
+
+        self.statements = []
+        event.listen(self.alchemy['engine'], 'before_cursor_execute', self.count_statement)
+
+    def tearDownAlchemy(self):
+        event.remove(self.alchemy['engine'], 'before_cursor_execute', self.count_statement)
+        super().tearDownAlchemy()
+
+    def count_statement(self, connection, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_nested(self):
+        """
+            Test that relations are capped in primary key order on every level
+        """
+
+        city = self.curl_tornado('/api/capped_cities/60400')
+
+        assert city['persons__count'] == 2
+        assert [assoc['_user'] for assoc in city['persons']] == [1]
+
+        user = city['persons'][0]['user']
+        assert user['computers__count'] == 2
+        assert [computer['_id'] for computer in user['computers']] == [1]
+
+    def test_page(self):
+        """
+            Test that the capped relations of a page are queried at once
+        """
+
+        self.statements = []
+        persons = self.curl_tornado('/api/capped_persons')['objects']
+        assert [(person['computers__count'], [computer['cpu'] for computer in person['computers']])
+                for person in persons] == [(2, [3.2]), (1, [12]), (0, []), (0, []), (2, [1.6]), (0, [])]
+        assert len(self.statements) == 4
+
+        self.statements = []
+        cities = self.curl_tornado('/api/capped_cities')['objects']
+        assert len(self.statements) == 6
+        assert cities == [self.curl_tornado('/api/capped_cities/%s' % city['_plz']) for city in cities]
+
+
+class TestIncludedRelation(TestBase):
+    """
+        Test the related instances of a relation included as a whole
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Person'][0], collection_name='listed_persons',
+                                       include_columns=['_id', 'name', 'computers'])
+
+    def test_relation(self):
+        """
+            Test that all columns of the related instances are converted
+        """
+
+        tornado_data = self.curl_tornado('/api/listed_persons/1/computers')
+        assert tornado_data['num_results'] == 2
+        assert sorted(computer['cpu'] for computer in tornado_data['objects']) == [3.2, 12]
+        assert all(computer['user']['_id'] == 1 for computer in tornado_data['objects'])
+
+
+class TestDatabaseJSON(TestBase):
+    """
+        Test pages encoded by the database
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Person'][0], collection_name='json_persons',
+                                       include_columns=['_id', 'name'], database_json=True)
+        self.api['tornado'].create_api(self.models['Person'][0], collection_name='processed_persons',
+                                       include_columns=['_id', 'name'], database_json=True,
+                                       postprocessor={'get': [self.count_objects]})
+
+    def count_objects(self, result=None, **kwargs):
+        result['count'] = len(result['objects'])
+
+    def test_order(self):
+        """
+            Test that the objects are in the requested order
+        """
+
+        order_by = [dict(field='_id', direction='desc')]
+        params = dict(q=json.dumps(dict(order_by=order_by)))
+
+        tornado_data = self.curl_tornado('/api/json_persons', params=params)
+        ids = [person['_id'] for person in tornado_data['objects']]
+        assert ids == sorted(ids, reverse=True)
+        assert tornado_data['num_results'] == len(ids)
+
+    def test_postprocessor(self):
+        """
+            Test that postprocessors of GET receive the objects as list
+        """
+
+        tornado_data = self.curl_tornado('/api/processed_persons')
+        assert tornado_data['count'] == len(tornado_data['objects']) == tornado_data['num_results']
+
+
+class TestRelationCounts(TestBase):
+    """
+        Test the <relation>__count fields of count_relations
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Person'][0], collection_name='counted_persons',
+                                       count_relations=['computers'])
+
+    def test_many(self):
+        """
+            Test the counts of every object of a page, including zero counts
+        """
+
+        tornado_data = self.curl_tornado('/api/counted_persons')
+        counts = {person['name']: person['computers__count'] for person in tornado_data['objects']}
+        assert counts == {'Anastacia': 2, 'Bernd': 1, 'Claudia': 0, 'Dennise': 0, 'Emil': 2, 'Feris': 0}
+
+    def test_single(self):
+        """
+            Test the count of a single instance
+        """
+
+        tornado_data = self.curl_tornado('/api/counted_persons/2')
+        assert tornado_data['computers__count'] == 1
+
+
+class TestFields(TestBase):
+    """
+        Test sparse fieldsets of /get operations
+    """
+
+    def test_columns(self):
+        """
+            Test that only the requested columns are returned
+        """
+
+        params = dict(q=json.dumps(dict(fields=['name'])))
+        tornado_data = self.curl_tornado('/api/persons', params=params)
+        assert all(list(person) == ['name'] for person in tornado_data['objects'])
+
+        params = dict(q=json.dumps(dict(fields='name,age')))
+        tornado_data = self.curl_tornado('/api/persons', params=params)
+        assert all(sorted(person) == ['age', 'name'] for person in tornado_data['objects'])
+
+    def test_relations(self):
+        """
+            Test fields of related instances
+        """
+
+        params = dict(q=json.dumps(dict(fields=['name', 'computers.cpu'])))
+        tornado_data = self.curl_tornado('/api/persons/1', params=params)
+        assert tornado_data == {'name': 'Anastacia', 'computers': [{'cpu': 3.2}, {'cpu': 12.0}]}
+
+    def test_unknown(self):
+        """
+            Test for raising 400 on unknown fields
+        """
+
+        self.curl_tornado('/api/persons', params=dict(q=json.dumps(dict(fields=['nope']))), assert_for=400)
+        self.curl_tornado('/api/persons', params=dict(q=json.dumps(dict(fields=['name.x']))), assert_for=400)
+
+
+class TestPlainColumns(TestBase):
+    """
+        Test pages of column only requests, queried as plain tuples
+    """
+
+    def test_order(self):
+        """
+            Test the order and the values of column only objects
+        """
+
+        order_by = [dict(field='name', direction='desc')]
+        params = dict(q=json.dumps(dict(fields=['name'], order_by=order_by)))
+
+        tornado_data = self.curl_tornado('/api/persons', params=params)
+        names = [person['name'] for person in tornado_data['objects']]
+        assert names == ['Feris', 'Emil', 'Dennise', 'Claudia', 'Bernd', 'Anastacia']
+
+    def test_single(self):
+        """
+            Test a single column only object
+        """
+
+        filters = [dict(name='name', op='==', val='Emil')]
+        params = dict(q=json.dumps(dict(fields=['name', '_id'], filters=filters, single=True)))
+
+        tornado_data = self.curl_tornado('/api/persons', params=params)
+        assert tornado_data == {'name': 'Emil', '_id': 5}
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+
+from sqlalchemy import Column, Integer, String
+
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 02:25'
+
+
+class TestGuards(TestBase):
+    """
+        Test the cost guards and the statement timeout of blueprints
+    """
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        Base = self.alchemy['Base']
+        engine = self.alchemy['engine']
+
+        class Row(Base):
+            __tablename__ = 'rows'
+
+            id = Column(Integer, primary_key=True)
+            name = Column(String)
+
+        Row.__table__.drop(engine, checkfirst=True)
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 500000) "
+                               "INSERT INTO rows SELECT i, 'name ' || i FROM n")
+        self.row = Row
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Person'][0], collection_name='guarded_persons',
+                                       max_filters=2, max_filter_depth=1, max_in_size=3,
+                                       filterable_columns=['name', 'computers.cpu'], sortable_columns=['name'])
+        self.api['tornado'].create_api(self.row, collection_name='rows', statement_timeout=0.01)
+
+    def test_guards(self):
+        """
+            Test for raising 400 for too expensive queries
+        """
+
+        allowed = dict(filters=[dict(name='computers__cpu', op='>', val=3)], order_by=[dict(field='name',
+                                                                                           direction='asc')])
+        assert self.curl_tornado('/api/guarded_persons', params=dict(q=json.dumps(allowed)))['num_results'] == 3
+
+        for query in [dict(filters=[dict(name='name', op='in', val=['a', 'b', 'c', 'd'])]),
+                      dict(filters=[dict(name='birth', op='is_null')]),
+                      dict(order_by=[dict(field='birth', direction='asc')]),
+                      dict(filters=[dict(name='name', op='==', val='a')] * 3),
+                      dict(filters=[dict(name='computers.user.name', op='==', val='a')])]:
+            self.curl_tornado('/api/guarded_persons', assert_for=400, params=dict(q=json.dumps(query)))
+
+    def test_timeout(self):
+        """
+            Test that a statement exceeding the timeout is interrupted with 503
+        """
+
+        query = dict(filters=[dict(name='name', op='like', val='%99999%')])
+        result = self.curl_tornado('/api/rows', assert_for=503, params=dict(q=json.dumps(query)))
+        assert 'statement timeout' in result['message']
+        assert self.curl_tornado('/api/rows/5')['name'] == 'name 5'
+
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from time import sleep
+
+from tornado_restless import ApiManager
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 19:05'
+
+
+class TestJobs(TestBase):
+    """
+        Test requests answered asynchronously with Prefer: respond-async
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='all_computers', allow_patch_many=True, chunk_size=2)
+        self.api['tornado'].create_job_api()
+
+    def test_patch_many(self):
+        """
+            Test that the job of a PATCH many reports the result
+        """
+
+        job = self.curl_tornado('/api/all_computers', 'patch', assert_for=202,
+                                headers={'Prefer': 'respond-async'}, json={'ram': 64})
+
+        for _ in range(50):
+            job = self.curl_tornado('/api/_jobs/%s' % job['id'])
+            if job['state'] not in ('pending', 'running'):
+                break
+            sleep(0.1)
+
+        assert job['state'] == 'succeeded'
+        assert job['status_code'] == 201
+        assert job['result']['num_modified'] == job['progress']['num_modified']
+
+        computers = self.curl_tornado('/api/all_computers')['objects']
+        assert all(computer['ram'] == 64 for computer in computers)
+
+    def test_unknown(self):
+        """
+            Test for raising 404 on unknown jobs
+        """
+
+        self.curl_tornado('/api/_jobs/unknown', assert_for=404)
+
+
+class TestJobLimit(TestBase):
+    """
+        Test the limit of unfinished jobs
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='slow_computers', allow_patch_many=True,
+                                       preprocessor={'patch_many': [lambda **kwargs: sleep(0.5)]})
+        self.api['tornado'].create_job_api(max_workers=1, max_pending=1)
+
+    def wait(self, job: dict) -> dict:
+        for _ in range(50):
+            job = self.curl_tornado('/api/_jobs/%s' % job['id'])
+            if job['state'] not in ('pending', 'running'):
+                break
+            sleep(0.1)
+        return job
+
+    def test_rejected(self):
+        """
+            Test for raising 503 while max_pending jobs are unfinished
+        """
+
+        job = self.curl_tornado('/api/slow_computers', 'patch', assert_for=202,
+                                headers={'Prefer': 'respond-async'}, json={'ram': 64})
+        self.curl_tornado('/api/slow_computers', 'patch', assert_for=503,
+                          headers={'Prefer': 'respond-async'}, json={'ram': 32})
+
+        assert self.wait(job)['state'] == 'succeeded'
+
+        job = self.curl_tornado('/api/slow_computers', 'patch', assert_for=202,
+                                headers={'Prefer': 'respond-async'}, json={'ram': 32})
+        assert self.wait(job)['state'] == 'succeeded'
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+
+from tornado_restless import ApiManager
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 01:25'
+
+
+class TestMemoryTable(TestBase):
+    """
+        Test that requests answered from memory equal the requests answered by the database
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        columns = ['_id', 'cpu', 'ram', '_user']
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='memory_computers', include_columns=columns, in_memory=True)
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='database_computers', include_columns=columns)
+
+    def test_parity(self):
+        """
+            Test filters, orderings and pagination in memory and in the database
+        """
+
+        # Written through the other blueprint
+        self.curl_tornado('/api/database_computers', 'post', assert_for=201,
+                          json={'_id': 6, 'cpu': 2.0, 'ram': None, '_user': 2})
+
+        queries = [
+            dict(filters=[dict(name='ram', op='==', val=None)]),
+            dict(filters=[dict(name='ram', op='!=', val=None)], order_by=[dict(field='ram', direction='desc'),
+                                                                            dict(field='_id', direction='asc')]),
+            dict(filters=[dict(name='cpu', op='>=', val=3), dict(name='_user', op='in', val=[1, 5])]),
+            dict(filters=[dict(name='cpu', op='==', val=12)], order_by=[dict(field='_id', direction='desc')]),
+            dict(order_by=[dict(field='ram', direction='asc'), dict(field='_id', direction='asc')]),
+        ]
+        for query in queries:
+            params = dict(q=json.dumps(query))
+            assert self.curl_tornado('/api/memory_computers', params=params) == \
+                self.curl_tornado('/api/database_computers', params=params), query
+
+        params = dict(q=json.dumps(dict(offset=100)))
+        assert self.curl_tornado('/api/memory_computers', params=params)['num_results'] == \
+            self.curl_tornado('/api/database_computers', params=params)['num_results'] == 6
+
+        table = self.api['tornado'].memory_tables[self.models['Computer'][0]]
+        assert table.loads == 2
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+
+from sqlalchemy import event
+
+from tornado_restless import ApiManager
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 23:55'
+
+
+class TestPatchList(TestBase):
+    """
+        Test /patch of a collection with a list of per-row changes
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='patched_computers', allow_patch_many=True)
+        self.api['tornado'].create_api(self.models['City'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='patched_cities', allow_patch_many=True)
+
+    def test_results(self):
+        """
+            Test the status of every element of the list
+        """
+
+        rows = [{'_id': 1, 'ram': 16}, {'_id': 1337, 'ram': 16}, {'ram': 16}, {'_id': 'x', 'ram': 16},
+                {'_id': 2, 'cpu': 1.5}]
+        result = self.curl_tornado('/api/patched_computers', 'patch', assert_for=201, json=rows)
+
+        assert result['num_modified'] == 2
+        assert [element['status'] for element in result['results']] == [201, 404, 400, 400, 201]
+
+        computers = {computer['_id']: computer for computer in self.curl_tornado('/api/patched_computers')['objects']}
+        assert (computers[1]['cpu'], computers[1]['ram']) == (3.2, 16)
+        assert (computers[2]['cpu'], computers[2]['ram']) == (1.5, 4)
+
+    def test_coerced_identity(self):
+        """
+            Test that a string primary key sent as number is found
+        """
+
+        result = self.curl_tornado('/api/patched_cities', 'patch', assert_for=201,
+                                   json=[{'_plz': 60400, 'name': 'Frankfurt am Main'}])
+
+        assert result['num_modified'] == 1
+        assert result['results'][0]['status'] == 201
+        assert self.curl_tornado('/api/patched_cities/60400')['name'] == 'Frankfurt am Main'
+
+
+class TestChunked(TestBase):
+    """
+        Test /patch and /delete of many instances in chunks
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='chunked_computers', allow_patch_many=True, chunk_size=2)
+
+    def test_patch(self):
+        """
+            Test that all filtered instances are patched chunk by chunk
+        """
+
+        filters = [dict(name='cpu', op='>', val=2)]
+        result = self.curl_tornado('/api/chunked_computers', 'patch', assert_for=201, json={'ram': 1},
+                                   params=dict(q=json.dumps(dict(filters=filters))))
+        assert result['num_modified'] == 4
+        assert result['num_chunks'] == 2
+
+        computers = self.curl_tornado('/api/chunked_computers')['objects']
+        assert sorted(computer['_id'] for computer in computers if computer['ram'] == 1) == [1, 2, 3, 5]
+
+    def test_limit(self):
+        """
+            Test that limit is honoured in the order of order_by
+        """
+
+        order_by = [dict(field='cpu', direction='desc'), dict(field='_id', direction='asc')]
+        result = self.curl_tornado('/api/chunked_computers', 'delete',
+                                   params=dict(q=json.dumps(dict(order_by=order_by, limit=3))))
+        assert result['num_removed'] == 3
+
+        computers = self.curl_tornado('/api/chunked_computers')['objects']
+        assert sorted(computer['_id'] for computer in computers) == [1, 4]
+
+        self.curl_tornado('/api/chunked_computers', 'delete', assert_for=400,
+                          params=dict(q=json.dumps(dict(limit='x'))))
+
+
+class TestAtomic(TestBase):
+    """
+        Test that /patch and /delete of many instances of a change feed are one transaction
+    """
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        session = self.alchemy['Session']()
+        session.bulk_insert_mappings(self.models['Computer'][0], [{'_id': number, 'cpu': 1.0, 'ram': 1}
+                                                                  for number in range(100, 2600)])
+        session.commit()
+        self.alchemy['Session'].remove()
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='fed_computers', change_feed=True, allow_patch_many=True)
+
+        self.commits = []
+        event.listen(self.alchemy['engine'], 'commit', self.count_commit)
+
+    def tearDown(self):
+        event.remove(self.alchemy['engine'], 'commit', self.count_commit)
+        super().tearDown()
+
+    def count_commit(self, connection):
+        self.commits.append(connection)
+
+    def test_patch(self):
+        """
+            Test that more instances than fit in one chunk are patched in one commit
+        """
+
+        filters = [dict(name='cpu', op='==', val=1.0)]
+        result = self.curl_tornado('/api/fed_computers', 'patch', assert_for=201, json={'ram': 2},
+                                   params=dict(q=json.dumps(dict(filters=filters))))
+        assert result['num_modified'] == 2500
+        assert result['num_chunks'] == 3
+        assert len(self.commits) == 1
+
+    def test_delete(self):
+        """
+            Test that more instances than fit in one chunk are deleted in one commit
+        """
+
+        filters = [dict(name='_id', op='>=', val=100)]
+        result = self.curl_tornado('/api/fed_computers', 'delete',
+                                   params=dict(q=json.dumps(dict(filters=filters))))
+        assert result['num_removed'] == 2500
+        assert len(self.commits) == 1
@@ -4,6 +4,11 @@
 
 """
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from tornado_restless import ApiManager
 from tests.base import TestBase
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
@@ -44,3 +49,49 @@ class TestGet(TestBase):
                           data=payload,
                           assert_for=405)
 
+
+class TestGroupCommit(TestBase):
+    """
+        Test single /post operations sharing one transaction
+    """
+
+    def setUpAlchemy(self):
+        super().setUpAlchemy()
+
+        # pysqlite needs an explicit BEGIN for the savepoints of the write coalescer
+        engine = self.alchemy['engine']
+        self.commits = []
+
+        @event.listens_for(engine, 'connect')
+        def connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, 'begin')
+        def begin(connection):
+            connection.execute('BEGIN')
+
+        @event.listens_for(engine, 'commit')
+        def commit(connection):
+            self.commits.append(connection)
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='grouped_computers')
+        self.api['tornado'].create_write_coalescer(window=0.05)
+
+    def test_coalesced(self):
+        """
+            Test that concurrent posts are committed together and every request gets its own result
+        """
+
+        rams = list(range(8))
+        del self.commits[:]
+        with ThreadPoolExecutor(len(rams)) as executor:
+            results = list(executor.map(lambda ram: self.curl_tornado('/api/grouped_computers', 'post', assert_for=201,
+                                                                      json={'cpu': 1.0, 'ram': ram, '_user': 1}),
+                                        rams))
+
+        assert sorted(result['ram'] for result in results) == rams
+        assert len(set(result['_id'] for result in results)) == len(rams)
+        assert len(self.commits) < len(rams)
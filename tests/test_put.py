@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from sqlalchemy import Column, Float, ForeignKey
+
+from tornado_restless import ApiManager
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 23:40'
+
+
+class TestPut(TestBase):
+    """
+        Test the upsert of /put operations
+    """
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        Base = self.alchemy['Base']
+
+        class Laptop(self.models['Computer'][0]):
+            __tablename__ = 'laptops'
+
+            _id = Column(ForeignKey('computers._id'), primary_key=True)
+            battery = Column(Float)
+
+        Base.metadata.create_all(self.alchemy['engine'])
+        self.laptop = Laptop
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=ApiManager.METHODS_ALL,
+                                       collection_name='put_computers', allow_patch_many=True)
+        self.api['tornado'].create_api(self.laptop, methods=ApiManager.METHODS_ALL, collection_name='laptops')
+
+    def test_single(self):
+        """
+            Test that PUT updates an existing instance and creates a missing one
+        """
+
+        computer = self.curl_tornado('/api/put_computers/1', 'put', assert_for=201, json={'ram': 32})
+        assert computer['ram'] == 32
+        assert computer['cpu'] == 3.2
+
+        computer = self.curl_tornado('/api/put_computers/77', 'put', assert_for=201, json={'cpu': 2.5})
+        assert computer['_id'] == 77
+        assert computer['ram'] is None
+
+    def test_many(self):
+        """
+            Test that PUT of a list upserts every element
+        """
+
+        rows = [{'_id': 1, 'cpu': 99}, {'_id': 78, 'cpu': 1, 'ram': 2}, {'_id': 2, 'ram': 64}]
+        result = self.curl_tornado('/api/put_computers', 'put', assert_for=201, json=rows)
+        assert result['num_modified'] == 3
+
+        computers = {computer['_id']: computer for computer in self.curl_tornado('/api/put_computers')['objects']}
+        assert (computers[1]['cpu'], computers[1]['ram']) == (99, 4)
+        assert (computers[2]['cpu'], computers[2]['ram']) == (12, 64)
+        assert (computers[78]['cpu'], computers[78]['ram']) == (1, 2)
+
+        self.curl_tornado('/api/put_computers', 'put', assert_for=400, json=[{'cpu': 99}])
+
+    def test_joined_inheritance(self):
+        """
+            Test for raising 400 for models mapped to more than one table
+        """
+
+        self.curl_tornado('/api/laptops/1', 'put', assert_for=400, json={'battery': 0.5})
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import os
+from tempfile import mkdtemp
+
+from tornado_restless.shared import SharedInstanceCache, SharedCountCache
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 01:05'
+
+
+class Model(object):
+    pass
+
+
+class TestSharedCaches(object):
+    """
+        Test the caches shared by forked processes
+    """
+
+    def setUp(self):
+        self.path = os.path.join(mkdtemp(), 'instances.cache')
+        self.instances = SharedInstanceCache(self.path, slots=64, slot_size=256)
+        self.counts = SharedCountCache(self.path + '.counts', slots=64)
+
+    def tearDown(self):
+        self.instances.close()
+        self.counts.close()
+
+    def test_fork(self):
+        """
+            Test that an invalidation in a forked process reaches the parent
+        """
+
+        self.instances.set(Model, (1,), 'variant', '{"_id": 1}', self.instances.generation(Model, (1,)))
+        self.counts.set(Model, 'key', 42, 60, self.counts.generation(Model))
+
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                if self.instances.get(Model, (1,), 'variant') != '{"_id": 1}' or self.counts.get(Model, 'key') != 42:
+                    status = 1
+                self.instances.invalidate(Model, [(1,)])
+                self.counts.invalidate(Model)
+            finally:
+                os._exit(status)
+
+        assert os.waitpid(pid, 0)[1] == 0
+        assert self.instances.get(Model, (1,), 'variant') is None
+        assert self.counts.get(Model, 'key') is None
+
+    def test_restart(self):
+        """
+            Test that the entries of a previous run are not reused
+        """
+
+        self.instances.set(Model, (1,), 'variant', '{"_id": 1}', self.instances.generation(Model, (1,)))
+        self.counts.set(Model, 'key', 42, 60, self.counts.generation(Model))
+
+        instances = SharedInstanceCache(self.path, slots=64, slot_size=256)
+        counts = SharedCountCache(self.path + '.counts', slots=64)
+        try:
+            assert instances.get(Model, (1,), 'variant') is None
+            assert counts.get(Model, 'key') is None
+        finally:
+            instances.close()
+            counts.close()
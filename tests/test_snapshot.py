@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+
+from sqlalchemy import Column, Integer
+
+from tornado_restless import ApiManager
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 02:10'
+
+
+class TestSnapshot(TestBase):
+    """
+        Test that pages of a snapshot stay stable under concurrent inserts
+    """
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        Base = self.alchemy['Base']
+        engine = self.alchemy['engine']
+
+        class Row(Base):
+            __tablename__ = 'rows'
+
+            id = Column(Integer, primary_key=True)
+            group = Column(Integer)
+
+        Row.__table__.drop(engine, checkfirst=True)
+        Base.metadata.create_all(engine)
+
+        session = self.alchemy['Session']()
+        session.add_all([Row(id=number, group=number % 3) for number in range(1, 31)])
+        session.commit()
+        self.alchemy['Session'].remove()
+        self.row = Row
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.row, methods=ApiManager.METHODS_ALL, collection_name='rows',
+                                       snapshot_column='id', results_per_page=7)
+        self.api['tornado'].create_api(self.row, methods=ApiManager.METHODS_ALL, collection_name='memory_rows',
+                                       snapshot_column='id', results_per_page=7, in_memory=True)
+
+    def get(self, collection, query, page=1, assert_for=200):
+        return self.curl_tornado('/api/%s' % collection, assert_for=assert_for,
+                                 params=dict(q=json.dumps(query), page=page))
+
+    def walk(self, collection: str):
+        """
+            Walks the pages of a snapshot, inserting instances into the front of the ordering between the pages
+        """
+        expected = sorted([number for number in range(1, 31) if number % 3 != 1],
+                          key=lambda number: (-(number % 3), number))
+
+        query = dict(snapshot=True, filters=[dict(name='group', op='!=', val=1)],
+                     order_by=[dict(field='group', direction='desc')])
+        result = self.get(collection, query)
+        token = result['snapshot']
+        seen = [obj['id'] for obj in result['objects']]
+
+        for page in range(2, result['total_pages'] + 1):
+            for number in range(3):
+                self.curl_tornado('/api/rows', 'post', assert_for=201,
+                                  json={'id': 100 + page * 10 + number, 'group': 2})
+            result = self.get(collection, dict(snapshot=token), page=page)
+            assert result['snapshot'] == token
+            seen += [obj['id'] for obj in result['objects']]
+
+        assert seen == expected
+        assert result['num_results'] == len(expected)
+
+    def test_paging(self):
+        """
+            Test that inserts between the pages neither duplicate nor shift instances
+        """
+        self.walk('rows')
+
+    def test_paging_in_memory(self):
+        """
+            Test that inserts between the pages neither duplicate nor shift instances of a memory table
+        """
+        self.walk('memory_rows')
+
+    def test_token(self):
+        """
+            Test that tokens can't be used with other orderings and forged tokens are rejected
+        """
+
+        query = dict(snapshot=True, order_by=[dict(field='group', direction='desc')])
+        token = self.get('rows', query)['snapshot']
+
+        assert len(self.get('rows', dict(query, snapshot=token))['objects']) == 7
+        self.get('rows', dict(snapshot=token, order_by=[dict(field='id', direction='asc')]), assert_for=400)
+        self.get('rows', dict(snapshot='garbage'), assert_for=400)
+        self.curl_tornado('/api/computers', assert_for=400, params=dict(q=json.dumps(dict(snapshot=True))))
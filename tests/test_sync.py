@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+from datetime import datetime, timedelta
+from time import sleep
+
+from sqlalchemy import Column, Integer, String, DateTime
+
+from tornado_restless import ApiManager
+from tornado_restless.sync import tombstones
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 01:40'
+
+
+class TestChanges(TestBase):
+    """
+        Test the incremental sync of tracked collections
+    """
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        Base = self.alchemy['Base']
+        engine = self.alchemy['engine']
+
+        class Item(Base):
+            __tablename__ = 'items'
+
+            id = Column(Integer, primary_key=True)
+            name = Column(String)
+            updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+        Item.__table__.drop(engine, checkfirst=True)
+        tombstones.drop(engine, checkfirst=True)
+        Base.metadata.create_all(engine)
+
+        session = self.alchemy['Session']()
+        session.add_all([Item(id=number, name='item %u' % number, updated_at=datetime.utcnow() - timedelta(minutes=1))
+                         for number in range(1, 6)])
+        session.commit()
+        self.alchemy['Session'].remove()
+        self.item = Item
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.item, methods=ApiManager.METHODS_ALL, collection_name='items',
+                                       track_changes='updated_at', track_changes_window=0.5, allow_patch_many=True)
+        self.api['tornado'].create_api(self.item, methods=ApiManager.METHODS_ALL, collection_name='counted_items',
+                                       track_changes='updated_at', track_changes_window=0.5, count_strategy='cached')
+
+    def sync(self, token, collection='items'):
+        """
+            Returns the modified names, the deleted ids and the new token of all changes after token
+        """
+        names, deleted = [], []
+        while True:
+            result = self.curl_tornado('/api/%s' % collection, params=dict(q=json.dumps(dict(since=token, limit=2))))
+            names += [obj['name'] for obj in result['objects']]
+            deleted += [identity[0] for identity in result['deleted']]
+            token = result['since']
+            if result['num_results'] <= len(result['objects']):
+                return names, deleted, token
+
+    def test_since(self):
+        """
+            Test that modified instances and tombstones of deleted instances follow the token
+        """
+
+        names, deleted, token = self.sync(None)
+        assert names == ['item %u' % number for number in range(1, 6)]
+        assert self.sync(token) == ([], [], token)
+
+        self.curl_tornado('/api/items/2', 'patch', assert_for=201, json={'name': 'two'})
+        filters = [dict(name='id', op='>', val=3)]
+        self.curl_tornado('/api/items', 'delete', params=dict(q=json.dumps(dict(filters=filters))))
+
+        # Held back by the window
+        assert self.sync(token)[:2] == ([], [])
+        sleep(0.6)
+        names, deleted, token = self.sync(token)
+        assert names == ['two']
+        assert sorted(deleted) == [4, 5]
+        assert self.sync(token)[:2] == ([], [])
+
+    def test_late_commit(self):
+        """
+            Test that a transaction committed after a newer change isn't skipped
+        """
+
+        names, deleted, token = self.sync(None)
+
+        session = self.alchemy['Session']()
+        session.add(self.item(id=10, name='newer', updated_at=datetime.utcnow()))
+        session.commit()
+        assert self.sync(token)[0] == []
+
+        # Its column was set before the newer change
+        session.add(self.item(id=11, name='older', updated_at=datetime.utcnow() - timedelta(seconds=0.3)))
+        session.commit()
+        self.alchemy['Session'].remove()
+
+        sleep(0.6)
+        assert self.sync(token)[0] == ['older', 'newer']
+
+    def test_cached_count(self):
+        """
+            Test that the cached count of the collection isn't used for the changes since a token
+        """
+
+        assert self.curl_tornado('/api/counted_items')['num_results'] == 5
+        assert self.curl_tornado('/api/counted_items')['num_results_exact'] is False
+
+        result = self.curl_tornado('/api/counted_items', params=dict(q=json.dumps(dict(since=None))))
+        assert len(result['objects']) == 5
+
+        result = self.curl_tornado('/api/counted_items', params=dict(q=json.dumps(dict(since=result['since']))))
+        assert result['num_results'] == 0
+        assert result['objects'] == []
+
+        names, deleted, token = self.sync(None, 'counted_items')
+        assert len(names) == 5
+
+        result = self.curl_tornado('/api/counted_items', params=dict(q=json.dumps(dict(since=token))))
+        assert result['num_results'] == 0
+        assert result['objects'] == []
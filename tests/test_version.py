@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import requests
+from sqlalchemy import Column, Integer, String
+
+from tornado_restless import ApiManager
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 02:10'
+
+
+class TestVersion(TestBase):
+    """
+        Test the version column of optimistic concurrency
+    """
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        Base = self.alchemy['Base']
+        engine = self.alchemy['engine']
+
+        class Document(Base):
+            __tablename__ = 'documents'
+
+            id = Column(Integer, primary_key=True)
+            title = Column(String)
+            version = Column(Integer, nullable=False, default=1)
+
+        Document.__table__.drop(engine, checkfirst=True)
+        Base.metadata.create_all(engine)
+
+        session = self.alchemy['Session']()
+        session.add_all([Document(id=number, title='document %u' % number) for number in range(1, 4)])
+        session.commit()
+        self.alchemy['Session'].remove()
+        self.document = Document
+
+    def setUpRestless(self):
+        super().setUpRestless()
+        self.api['tornado'].create_api(self.document, methods=ApiManager.METHODS_ALL, collection_name='documents',
+                                       version_column='version', allow_patch_many=True)
+
+    def patch(self, url: str, if_match: str, assert_for: int=201, json: dict=None):
+        """
+            Returns the response of a PATCH with If-Match
+        """
+        response = requests.patch('http://localhost:%u%s' % (self.config['tornado']['port'], url),
+                                  headers={'If-Match': if_match}, json=json or {'title': 'patched'})
+        assert response.status_code == assert_for
+        return response
+
+    def test_if_match(self):
+        """
+            Test the comparison of If-Match with the version
+        """
+
+        response = requests.get('http://localhost:%u/api/documents/1' % self.config['tornado']['port'])
+        assert response.headers['Etag'] == '"1"'
+
+        assert self.patch('/api/documents/1', '"1"').headers['Etag'] == '"2"'
+        self.patch('/api/documents/1', '"1"', assert_for=412)
+        self.patch('/api/documents/1', 'W/"2"', assert_for=412)
+        assert self.patch('/api/documents/1', '"7", "2"').headers['Etag'] == '"3"'
+        assert self.patch('/api/documents/1', '*').headers['Etag'] == '"4"'
+        self.patch('/api/documents/99', '*', assert_for=412)
+        self.patch('/api/documents/1', 'abc', assert_for=400)
+
+    def test_writes(self):
+        """
+            Test that every write increases the version and a version sent by the client is ignored
+        """
+
+        self.curl_tornado('/api/documents/1', 'patch', assert_for=201, json={'title': 'one', 'version': 100})
+        self.curl_tornado('/api/documents/2', 'put', assert_for=201, json={'title': 'two'})
+        self.curl_tornado('/api/documents', 'put', assert_for=201, json=[{'id': 3, 'title': 'three'},
+                                                                          {'id': 4, 'title': 'four'}])
+        self.curl_tornado('/api/documents', 'patch', assert_for=201, json=[{'id': 1, 'title': 'eins'},
+                                                                            {'id': 2, 'title': 'zwei'}])
+        self.curl_tornado('/api/documents', 'post', assert_for=201, json={'id': 5, 'title': 'five', 'version': 50})
+
+        documents = self.curl_tornado('/api/documents')['objects']
+        assert [(document['id'], document['version']) for document in documents] == \
+            [(1, 3), (2, 3), (3, 2), (4, 1), (5, 1)]
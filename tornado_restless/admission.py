@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Admission control of the blueprints
+
+    Limits the requests of a blueprint that are processed at once, excess requests wait in a bounded queue
+     or are rejected at once, so an overloaded database does not pile up requests until everything times out
+"""
+from datetime import timedelta
+
+from tornado import gen
+from tornado.locks import Semaphore
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 21:40'
+
+
+class AdmissionBudget(object):
+    """
+        A budget of concurrent requests with a bounded wait queue
+
+        :active: The number of admitted requests
+        :waiting: The number of queued requests
+        :rejected: The number of rejected requests
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int=0, queue_timeout: float=1):
+        """
+        :param max_concurrent: The maximum number of requests processed at once
+        :param max_queued: The maximum number of requests waiting for a slot, more are rejected at once
+        :param queue_timeout: Seconds a request waits for a slot before it is rejected
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+
+        self.semaphore = Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @gen.coroutine
+    def acquire(self):
+        """
+            Waits for a slot
+
+            :return: True if admitted, False if rejected
+        """
+        if self.active >= self.max_concurrent and self.waiting >= self.max_queued:
+            self.rejected += 1
+            return False
+
+        self.waiting += 1
+        try:
+            yield self.semaphore.acquire(timeout=timedelta(seconds=self.queue_timeout))
+        except gen.TimeoutError:
+            self.rejected += 1
+            return False
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        return True
+
+    def release(self):
+        """
+            Frees the slot of a finished request
+        """
+        self.active -= 1
+        self.semaphore.release()
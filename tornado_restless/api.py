@@ -3,15 +3,41 @@
 """
 
 """
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
 from tornado.web import Application, URLSpec
 
+from .admission import AdmissionBudget
+from .batch import BatchHandler
+from .cache import CountCache, InstanceCache
+from .coalesce import WriteCoalescer
+from .dispatcher import DispatchHandler
 from .handler import BaseHandler
 from .errors import IllegalArgumentError
+from .feed import ChangeFeed, FeedHandler
+from .jobs import JobRunner, JobHandler
+from .memory import MemoryTable
+from .shared import SharedCountCache, SharedInstanceCache
+from .sync import ChangeTracker, Snapshot
+from .wrapper import ModelWrapper
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
 __date__ = '26.04.13 - 22:25'
 
 
+class Blueprint(URLSpec):
+    """
+        The URLSpec of a model, remembers url_prefix and collection_name for the dispatcher
+    """
+
+    def __init__(self, url_prefix: str, collection_name: str, handler_class: type, kwargs: dict, name: str):
+        super().__init__("%s/%s(?:/([^/]+)(?:/([^/]+))?)?[/]?" % (url_prefix, collection_name),
+                         handler_class, kwargs, name)
+        self.url_prefix = url_prefix
+        self.collection_name = collection_name
+
+
 class ApiManager(object):
     """
         The tornado restless engine
@@ -28,17 +54,41 @@ class ApiManager(object):
 
     def __init__(self,
                  application: Application,
-                 session_maker: type=None):
+                 session_maker: type=None,
+                 dispatch: bool=False):
         """
         Create an instance of the tornado restless engine
 
         :param session_maker: is a sqlalchemy.orm.Session class factory
         :param application: is the tornado.web.Application object
+        :param dispatch: Serve all models of an url_prefix through one route instead of one route per model
         """
         self.application = application
 
         self.session_maker = session_maker
 
+        self.dispatch = dispatch
+        self.dispatchers = {}
+
+        self.blueprints = {}
+
+        self.count_cache = CountCache()
+        self.instance_cache = InstanceCache()
+        self.memory_tables = {}
+        self.feeds = {}
+
+        self.job_runner = None
+        self.job_url = None
+
+        self.write_coalescer = None
+
+        self.lock = Lock()
+        self.cancelled_requests = 0
+
+        self.executor = None
+        self.flights = {}
+        self.coalesced_requests = 0
+
     def create_api_blueprint(self,
                              model,
                              methods: set=METHODS_READ,
@@ -55,6 +105,31 @@ class ApiManager(object):
                              exclude_columns: list=None,
                              results_per_page: int=10,
                              max_results_per_page: int=100,
+                             max_relation_results: int=None,
+                             count_relations: list=None,
+                             database_json: bool=False,
+                             count_strategy: str='exact',
+                             count_cache_ttl: float=60,
+                             chunk_size: int=None,
+                             max_filters: int=None,
+                             max_filter_depth: int=None,
+                             max_in_size: int=None,
+                             filterable_columns: list=None,
+                             sortable_columns: list=None,
+                             statement_timeout: float=None,
+                             max_concurrent_reads: int=None,
+                             max_concurrent_writes: int=None,
+                             max_queued_requests: int=0,
+                             queue_timeout: float=1,
+                             retry_after: int=1,
+                             single_flight: bool=False,
+                             cache_instances: bool=False,
+                             in_memory: bool=False,
+                             track_changes: str=None,
+                             track_changes_window: float=5,
+                             change_feed: bool=False,
+                             version_column: str=None,
+                             snapshot_column: str=None,
                              blueprint_prefix: str='',
                              handler_class: type=BaseHandler) -> URLSpec:
         """
@@ -73,19 +148,98 @@ class ApiManager(object):
         :param exclude_columns: Blacklist of columns to be excluded
         :param results_per_page: The default value of how many results are returned per request
         :param max_results_per_page: The hard upper limit of resutest per page
+        :param max_relation_results: Embed at most that many instances of a relation, plus a <relation>__count field
+        :param count_relations: Relations for which a <relation>__count field is added without loading them
+        :param database_json: Let the database encode the objects of column only GET requests as JSON
+                              (ordered requests on postgresql only, not with GET postprocessors)
+        :param count_strategy: How num_results is determined:
+                               'exact' counts every request,
+                               'cached' caches the counts per filter until the model is written or ttl expires,
+                               'estimated' uses the database statistics for unfiltered requests
+        :param count_cache_ttl: Seconds a count is cached with count_strategy 'cached'
+        :param chunk_size: Let PATCH/DELETE many modify at most that many instances per statement and commit,
+                           otherwise they are atomic
+        :param max_filters: The maximum number of filters and orderings of a request
+        :param max_filter_depth: The maximum number of relations a filter may traverse (relation.column is 1)
+        :param max_in_size: The maximum number of values of an in/not_in filter
+        :param filterable_columns: Whitelist of columns (and relation.columns) that may be filtered
+        :param sortable_columns: Whitelist of columns that may be ordered by
+        :param statement_timeout: Seconds a statement of a GET request may run (with sqlite all together),
+                                  exceeding it is answered with 503
+        :param max_concurrent_reads: The maximum number of GET requests processed at once
+        :param max_concurrent_writes: The maximum number of POST/PUT/PATCH/DELETE requests processed at once
+        :param max_queued_requests: The maximum number of requests waiting for a slot (per budget),
+                                    more are rejected with 503 at once
+        :param queue_timeout: Seconds a request waits for a slot before it is rejected with 503
+        :param retry_after: Seconds sent as Retry-After header on rejected requests
+        :param single_flight: Compute GET requests in a thread pool, identical concurrent requests
+                              (same path, q and arguments) share one computation and its encoded result,
+                              see create_executor for the size of the thread pool
+        :param cache_instances: Answer GET of single instances from the instance cache of the api manager,
+                                writes through the api invalidate the cached instances of their model
+        :param in_memory: Load all instances of a small reference model into memory (now and after every write
+                          through the api) and answer GET of single instances and of filtered, ordered pages
+                          of plain columns from memory
+        :param track_changes: Name of a column increased by every write (e.g. updated_at), enables incremental
+                              sync: get_many with a since token in q returns the instances modified and
+                              the primary keys of instances deleted (kept in the table restless_tombstones) after it
+        :param track_changes_window: Seconds a change is held back from the since results, so that a transaction
+                                     committing later than a newer one isn't skipped, see ChangeTracker
+        :param change_feed: Publish the writes through the api as events to the subscribers of the collection,
+                            see create_feed_api
+        :param version_column: Name of an integer column increased by every PATCH/PUT of an instance (optimistic
+                               concurrency, values sent by clients are ignored): PATCH/PUT of an instance with
+                               If-Match: "<version>" is one UPDATE ... WHERE pk = ? AND version IN (?),
+                               answered with 412 if the version changed
+        :param snapshot_column: Name of a column increased by every insert (e.g. an autoincrement id or created_at),
+                                enables snapshots: get_many with snapshot true in q returns a token pinning
+                                the maximal value, filters and orderings, pages requested with it don't see
+                                instances inserted later
         :param blueprint_prefix: The Prefix that will be used to unique collection_name for named_handlers
         :param preprocessor: A dictionary of list of preprocessors that get called
         :param postprocessor: A dictionary of list of postprocessor that get called
         :param handler_class: The Handler Class that will be used in the route
         :type handler_class: tornado_restless.handler.BaseHandler or a subclass
-        :return: :class:`tornado.web.URLSpec`
+        :return: :class:`Blueprint`, a :class:`tornado.web.URLSpec`
         :raise: IllegalArgumentError
         """
         if exclude_columns is not None and include_columns is not None:
             raise IllegalArgumentError('Cannot simultaneously specify both include columns and exclude columns.')
 
+        if count_strategy not in ('exact', 'cached', 'estimated'):
+            raise IllegalArgumentError("Unknown count strategy '%s'" % count_strategy)
+
+        for relation in count_relations or []:
+            if relation not in ModelWrapper(model).relations:
+                raise IllegalArgumentError("Relation '%s' not defined for %s" % (relation, model.__name__))
+
+        if version_column is not None:
+            if version_column not in ModelWrapper(model).columns:
+                raise IllegalArgumentError("Column '%s' not defined for %s" % (version_column, model.__name__))
+            try:
+                python_type = getattr(model, version_column).property.columns[0].type.python_type
+            except NotImplementedError:
+                python_type = None
+            if python_type is not int:
+                raise IllegalArgumentError("Version column '%s' must be an integer column" % version_column)
+
+        if in_memory and model not in self.memory_tables:
+            self.memory_tables[model] = MemoryTable(model, self.session_maker,
+                                                    lambda: self.count_cache.generation(model))
+
+        change_tracker = None
+        if track_changes is not None:
+            change_tracker = ChangeTracker(model, track_changes, window=track_changes_window)
+            change_tracker.create(self.session_maker)
+
+        if single_flight and self.executor is None:
+            self.create_executor()
+
         table_name = collection_name if collection_name is not None else model.__tablename__
 
+        if change_feed and (url_prefix, table_name) not in self.feeds:
+            self.feeds[(url_prefix, table_name)] = ChangeFeed()
+
         kwargs = {'model': model,
                   'manager': self,
                   'methods': methods,
@@ -94,20 +248,74 @@ class ApiManager(object):
                   'allow_patch_many': allow_patch_many,
                   'allow_method_override': allow_method_override,
                   'validation_exceptions': validation_exceptions,
-                  'include_columns': include_columns,
-                  'exclude_columns': exclude_columns,
+                  'include_columns': handler_class.parse_columns(include_columns),
+                  'exclude_columns': handler_class.parse_columns(exclude_columns),
                   'exclude_queries': exclude_queries,
                   'exclude_hybrids': exclude_hybrids,
                   'results_per_page': results_per_page,
-                  'max_results_per_page': max_results_per_page}
+                  'max_results_per_page': max_results_per_page,
+                  'max_relation_results': max_relation_results,
+                  'count_relations': count_relations or [],
+                  'database_json': database_json,
+                  'count_strategy': count_strategy,
+                  'count_cache_ttl': count_cache_ttl,
+                  'chunk_size': chunk_size,
+                  'max_filters': max_filters,
+                  'max_filter_depth': max_filter_depth,
+                  'max_in_size': max_in_size,
+                  'filterable_columns': None if filterable_columns is None else frozenset(
+                      column.replace('__', '.') for column in filterable_columns),
+                  'sortable_columns': None if sortable_columns is None else frozenset(sortable_columns),
+                  'statement_timeout': statement_timeout,
+                  'admission': {
+                      'read': None if max_concurrent_reads is None else AdmissionBudget(
+                          max_concurrent_reads, max_queued=max_queued_requests, queue_timeout=queue_timeout),
+                      'write': None if max_concurrent_writes is None else AdmissionBudget(
+                          max_concurrent_writes, max_queued=max_queued_requests, queue_timeout=queue_timeout)},
+                  'retry_after': retry_after,
+                  'single_flight': single_flight,
+                  'cache_key': (url_prefix, table_name) if cache_instances else None,
+                  'in_memory': in_memory,
+                  'change_tracker': change_tracker,
+                  'feed_key': (url_prefix, table_name) if change_feed else None,
+                  'version_column': version_column,
+                  'snapshot': None if snapshot_column is None else Snapshot(model, snapshot_column)}
 
-        blueprint = URLSpec(
-            "%s/%s(?:/(.+))?[/]?" % (url_prefix, table_name),
+        blueprint = Blueprint(
+            url_prefix,
+            table_name,
             handler_class,
             kwargs,
             '%s%s' % (blueprint_prefix, table_name))
         return blueprint
 
+    def create_api_dispatcher(self,
+                              url_prefix: str='/api') -> URLSpec:
+        """
+        Create the tornado route that dispatches all collections below url_prefix
+
+        :param url_prefix: The url prefix of the application
+        :return: :class:`tornado.web.URLSpec`, its kwargs['blueprints'] is the collection_name lookup
+        """
+        return URLSpec(
+            "%s/[^/]+(?:/([^/]+)(?:/([^/]+))?)?[/]?" % url_prefix,
+            DispatchHandler,
+            {'url_prefix': url_prefix, 'blueprints': {}})
+
+    def add_handler(self, spec: URLSpec, virtualhost=r".*$"):
+        """
+        Appends a route to the handlers of virtualhost
+
+        :param spec: The route
+        :param virtualhost: bindhost for binding, .*$ in default
+        """
+        for vhost, handlers in self.application.handlers:
+            if vhost == virtualhost:
+                handlers.append(spec)
+                break
+        else:
+            self.application.add_handlers(virtualhost, [spec])
+
     def create_api(self,
                    model,
                    virtualhost=r".*$", *args, **kwargs):
@@ -121,11 +329,180 @@ class ApiManager(object):
         """
         blueprint = self.create_api_blueprint(model, *args, **kwargs)
 
-        for vhost, handlers in self.application.handlers:
-            if vhost == virtualhost:
-                handlers.append(blueprint)
-                break
+        self.blueprints[(blueprint.url_prefix, blueprint.collection_name)] = blueprint
+        self.add_blueprint(blueprint, virtualhost)
+
+    def create_batch_api(self,
+                         url_prefix: str='/api',
+                         virtualhost=r".*$",
+                         max_operations: int=100):
+        """
+        Creates and registers the route url_prefix/_batch executing many operations in one request
+
+        :param url_prefix: The url prefix of the blueprints the operations are executed on
+        :param virtualhost: bindhost for binding, .*$ in default
+        :param max_operations: The maximum number of operations per request
+        """
+        blueprint = Blueprint(
+            url_prefix,
+            '_batch',
+            BatchHandler,
+            {'manager': self, 'url_prefix': url_prefix, 'max_operations': max_operations},
+            '%s/_batch' % url_prefix)
+
+        self.add_blueprint(blueprint, virtualhost)
+
+    def create_job_api(self,
+                       url_prefix: str='/api',
+                       virtualhost=r".*$",
+                       max_workers: int=4,
+                       max_jobs: int=1000,
+                       retention: float=3600,
+                       max_pending: int=100):
+        """
+        Creates and registers the route url_prefix/_jobs reporting the jobs of asynchronous requests
+
+        Afterwards PATCH/DELETE/PUT many requests with the header Prefer: respond-async are executed
+        in a thread pool and answered at once with 202 and the url of their job.
+
+        :param url_prefix: The url prefix of the jobs route
+        :param virtualhost: bindhost for binding, .*$ in default
+        :param max_workers: The number of threads executing jobs
+        :param max_jobs: The maximum number of kept jobs
+        :param retention: Seconds a finished job is kept
+        :param max_pending: The maximum number of unfinished jobs, further requests are answered with 503
+        """
+        self.job_runner = JobRunner(max_workers=max_workers, max_jobs=max_jobs, retention=retention,
+                                    max_pending=max_pending)
+        self.job_url = '%s/_jobs/%%s' % url_prefix
+
+        blueprint = Blueprint(
+            url_prefix,
+            '_jobs',
+            JobHandler,
+            {'runner': self.job_runner},
+            '%s/_jobs' % url_prefix)
+
+        self.add_blueprint(blueprint, virtualhost)
+
+    def create_feed_api(self,
+                        url_prefix: str='/api',
+                        virtualhost=r".*$",
+                        keepalive: float=15,
+                        max_buffer: int=1000):
+        """
+        Creates and registers the route url_prefix/_events/<collection> streaming the changes of a collection
+
+        The collections must be created with change_feed. Clients receive the create, update and delete events
+        of writes through the api as Server-Sent Events after their commit, optionally filtered by the filters in q.
+
+        :param url_prefix: The url prefix of the blueprints
+        :param virtualhost: bindhost for binding, .*$ in default
+        :param keepalive: Seconds after which a comment is sent if no event occurred
+        :param max_buffer: The maximum number of events buffered for a slow subscriber before it is dropped
+        """
+        for (prefix, _), feed in self.feeds.items():
+            if prefix == url_prefix:
+                feed.max_buffer = max_buffer
+
+        blueprint = Blueprint(
+            url_prefix,
+            '_events',
+            FeedHandler,
+            {'manager': self, 'url_prefix': url_prefix, 'keepalive': keepalive},
+            '%s/_events' % url_prefix)
+
+        self.add_blueprint(blueprint, virtualhost)
+
+    def publish(self, key: tuple, events: list):
+        """
+        Publishes the events of a committed write to the change feed of a collection
+
+        :param key: (url_prefix, collection_name) of the feed, nothing is published if None
+        :param events: List of (type, object)
+        """
+        if key is not None and events and key in self.feeds:
+            self.feeds[key].publish(events)
+
+    def release_session(self, session):
+        """
+        Closes the session of a finished request
+
+        The connection is returned to the pool by the thread that used it,
+        a scoped session starts a new transaction with the next request.
+
+        :param session: The session of the request
+        """
+        session.close()
+
+    def count_cancelled(self):
+        """
+        Counts a request whose client closed the connection, see cancelled_requests
+        """
+        with self.lock:
+            self.cancelled_requests += 1
+
+    def count_coalesced(self):
+        """
+        Counts a GET request served by a computation already in flight, see coalesced_requests
+        """
+        with self.lock:
+            self.coalesced_requests += 1
+
+    def create_executor(self, max_workers: int=4):
+        """
+        Creates the thread pool computing the GET requests of blueprints with single_flight
+
+        Call before creating the blueprints to change the size of the pool.
+
+        :param max_workers: The maximum number of GET requests computed at once
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def create_write_coalescer(self,
+                               window: float=0.002,
+                               max_batch: int=64):
+        """
+        Enables group commit: Single POST/PATCH requests arriving within window share one transaction
+
+        Every request still gets its own result or error, its write runs in a savepoint.
+
+        :param window: Seconds to wait for further writes after the first one
+        :param max_batch: The maximum number of writes per transaction
+        """
+        self.write_coalescer = WriteCoalescer(self.session_maker, window=window, max_batch=max_batch)
+
+    def create_shared_caches(self,
+                             path: str=None,
+                             slots: int=65536,
+                             slot_size: int=1024):
+        """
+        Replaces the count and instance cache by caches in a memory mapped file shared by forked processes
+
+        Call before tornado.process.fork_processes: Writes in one worker invalidate the cached counts and
+        instances of all workers.
+
+        :param path: The file of the instance cache (the count cache uses path.counts), temporary files if None
+        :param slots: The number of cached instances (and counts)
+        :param slot_size: The maximal size of a serialized instance in bytes
+        """
+        self.instance_cache = SharedInstanceCache(path, slots=slots, slot_size=slot_size)
+        self.count_cache = SharedCountCache(None if path is None else path + '.counts', slots=slots)
+
+    def add_blueprint(self, blueprint: Blueprint, virtualhost=r".*$"):
+        """
+        Registers the route of a blueprint in your tornado application
+
+        :param blueprint: The blueprint
+        :param virtualhost: bindhost for binding, .*$ in default
+        """
+        if self.dispatch:
+            key = (virtualhost, blueprint.url_prefix)
+            if key not in self.dispatchers:
+                self.dispatchers[key] = self.create_api_dispatcher(blueprint.url_prefix)
+                self.add_handler(self.dispatchers[key], virtualhost)
+            self.dispatchers[key].kwargs['blueprints'][blueprint.collection_name] = blueprint
         else:
-            self.application.add_handlers(virtualhost, [blueprint])
+            self.add_handler(blueprint, virtualhost)
 
-        self.application.named_handlers[blueprint.name] = blueprint
\ No newline at end of file
+        self.application.named_handlers[blueprint.name] = blueprint
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless BatchHandler
+
+    Executes a list of operations against the registered blueprints in one HTTP round trip
+"""
+from json import dumps, loads
+from urllib.parse import urlencode
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.httputil import HTTPServerRequest, HTTPHeaders
+from tornado.web import RequestHandler
+
+from .errors import IllegalArgumentError
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 16:40'
+
+
+class BatchConnection(object):
+    """
+        Stands in for the HTTP connection of an operation and captures the response
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.status_code = None
+        self.chunks = []
+
+    def set_close_callback(self, callback):
+        pass
+
+    def write_headers(self, start_line, headers, chunk=None, callback=None):
+        self.status_code = start_line.code
+        return self.write(chunk, callback=callback)
+
+    def write(self, chunk, callback=None):
+        if chunk:
+            self.chunks.append(chunk)
+        if callback is not None:
+            callback()
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def finish(self):
+        pass
+
+    @property
+    def result(self) -> dict:
+        """
+            The status code and the decoded body of the response
+        """
+        body = b"".join(self.chunks)
+        try:
+            body = loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            body = body.decode('utf-8', 'replace')
+        return {'status': self.status_code, 'body': body}
+
+
+class BatchManager(object):
+    """
+        The ApiManager seen by the handlers of the operations, all of them share one session
+    """
+
+    write_coalescer = None
+    executor = None
+    instance_cache = None
+    memory_tables = {}
+
+    def __init__(self, manager, session, published: list):
+        self.manager = manager
+        self.session = session
+        self.published = published
+
+    def session_maker(self):
+        return self.session
+
+    def release_session(self, session):
+        """
+            The session of the batch is closed by the BatchHandler after all operations
+        """
+
+    def publish(self, key: tuple, events: list):
+        self.published.append((key, events))
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+
+class BatchHandler(RequestHandler):
+    """
+        Executes a list of operations in one request
+
+        The body is a list of operations (or a dictionary with the keys operations and atomic),
+        every operation is a dictionary with the keys:
+
+        :method: The HTTP method, e.g. GET
+        :collection: The collection name of the blueprint
+        :id: (optional) The instance id (string or list of primary keys)
+        :relation: (optional) The relation of the instance
+        :q: (optional) The query argument
+        :body: (optional) The body of the operation
+
+        Every operation is executed by the handler of its blueprint, all share one session.
+        If atomic is set they also share one transaction: On the first failing operation the
+        transaction is rolled back and all other operations answer with 424.
+
+        The response is the list of results ({status: .., body: ..}) in the order of the operations.
+    """
+
+    SUPPORTED_METHODS = ['POST']
+
+    # noinspection PyMethodOverriding
+    def initialize(self,
+                   manager,
+                   url_prefix: str,
+                   max_operations: int):
+        """
+        :param manager: The tornado_restless Api Manager
+        :param url_prefix: The url prefix of the blueprints
+        :param max_operations: The maximum number of operations per request
+        """
+        super().initialize()
+
+        self.manager = manager
+        self.url_prefix = url_prefix
+        self.max_operations = max_operations
+
+    @gen.coroutine
+    def post(self, *args):
+        """
+            POST of a list of operations
+
+            :statuscode 200: operations executed, see the results for their status
+            :statuscode 400: malformed operations
+        """
+        try:
+            arguments = loads(self.request.body.decode('utf-8'))
+        except ValueError:
+            raise IllegalArgumentError("Batch body is not valid JSON")
+
+        if isinstance(arguments, dict):
+            operations = arguments.get('operations', [])
+            atomic = arguments.get('atomic', False)
+        else:
+            operations = arguments
+            atomic = False
+
+        if not isinstance(operations, list):
+            raise IllegalArgumentError("Batch operations must be a list")
+        if len(operations) > self.max_operations:
+            raise IllegalArgumentError("Batch with more than %u operations" % self.max_operations)
+
+        session_factory = getattr(self.manager.session_maker, 'session_factory', self.manager.session_maker)
+        if atomic:
+            connection = session_factory().get_bind().connect()
+            transaction = connection.begin()
+            session = session_factory(bind=connection)
+        else:
+            session = session_factory()
+
+        results = []
+        published = []
+        try:
+            for operation in operations:
+                result = yield self.execute(operation, BatchManager(self.manager, session, published))
+                results.append(result)
+                if atomic and result['status'] >= 400:
+                    results = [r if r is result else {'status': 424, 'body': None} for r in results]
+                    results.extend({'status': 424, 'body': None} for _ in operations[len(results):])
+                    break
+        finally:
+            if atomic:
+                if len(results) == len(operations) and all(result['status'] < 400 for result in results):
+                    transaction.commit()
+                else:
+                    transaction.rollback()
+                    published = []
+                session.close()
+                connection.close()
+            else:
+                session.close()
+
+            # The operations bypass the caches and memory tables, invalidate after the commit
+            for operation in operations:
+                try:
+                    blueprint = self.manager.blueprints[(self.url_prefix, operation['collection'])]
+                except (KeyError, TypeError):
+                    continue
+                if str(operation.get('method', 'GET')).upper() != 'GET':
+                    self.manager.count_cache.invalidate(blueprint.kwargs['model'])
+                    self.manager.instance_cache.invalidate(blueprint.kwargs['model'])
+                    if blueprint.kwargs['model'] in self.manager.memory_tables:
+                        self.manager.memory_tables[blueprint.kwargs['model']].invalidate()
+
+            # The events of the operations are published once their transaction is committed
+            for key, events in published:
+                self.manager.publish(key, events)
+
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(dumps(results))
+
+    @gen.coroutine
+    def execute(self, operation: dict, manager: BatchManager):
+        """
+            Executes one operation with the handler of its blueprint
+
+            :param operation: The operation
+            :param manager: The manager passed to the handler
+            :return: The result {status: .., body: ..}
+        """
+        try:
+            blueprint = self.manager.blueprints[(self.url_prefix, operation['collection'])]
+            method = operation['method'].upper()
+        except (KeyError, TypeError, AttributeError):
+            return {'status': 404, 'body': None}
+
+        instance_id = operation.get('id')
+        if isinstance(instance_id, list):
+            instance_id = ','.join(str(pk) for pk in instance_id)
+        elif instance_id is not None:
+            instance_id = str(instance_id)
+
+        uri = "%s/%s" % (self.url_prefix, operation['collection'])
+        if 'q' in operation:
+            uri += "?" + urlencode({'q': dumps(operation['q'])})
+
+        headers = HTTPHeaders({'Content-Type': 'application/json; charset=UTF-8'})
+        for name in ('Host', 'Authorization', 'Cookie'):
+            if name in self.request.headers:
+                headers[name] = self.request.headers[name]
+
+        connection = BatchConnection(getattr(self.request.connection, 'context', None))
+        request = HTTPServerRequest(method=method,
+                                    uri=uri,
+                                    headers=headers,
+                                    body=dumps(operation.get('body', {})).encode('utf-8'),
+                                    connection=connection)
+
+        handler = blueprint.handler_class(self.application, request, **dict(blueprint.kwargs, manager=manager))
+        yield handler._execute([], instance_id, operation.get('relation'))
+
+        return connection.result
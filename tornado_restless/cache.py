@@ -0,0 +1,213 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Caches shared by all requests of an ApiManager
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 15:20'
+
+
+class CountCache(object):
+    """
+        Cache of the instance counts of a model per filter, with a time to live
+
+        All counts of a model are invalidated when the model is written through the api. Every invalidation increases
+        the generation of the model, a count started before the invalidation is not cached afterwards.
+    """
+
+    def __init__(self, max_entries: int=10000):
+        """
+        :param max_entries: The maximum number of cached counts, the oldest are evicted first
+        """
+        self.max_entries = max_entries
+        self.entries = {}
+        self.generations = {}
+        self.size = 0
+        self.lock = Lock()
+
+    def generation(self, model) -> int:
+        """
+            Returns the generation of model, pass it to set after counting
+
+            :param model: The sqlalchemy model
+        """
+        return self.generations.get(model, 0)
+
+    def get(self, model, key):
+        """
+            Returns the cached count or None if missing or expired
+
+            :param model: The sqlalchemy model
+            :param key: The key of the filters, see SessionedModelWrapper.count_key
+        """
+        with self.lock:
+            try:
+                expires, count = self.entries[model][key]
+            except KeyError:
+                return None
+
+            if expires < monotonic():
+                del self.entries[model][key]
+                self.size -= 1
+                return None
+
+            return count
+
+    def set(self, model, key, count: int, ttl: float, generation: int):
+        """
+            Caches the count for ttl seconds unless model was invalidated since generation
+
+            :param model: The sqlalchemy model
+            :param key: The key of the filters, see SessionedModelWrapper.count_key
+            :param count: The count
+            :param ttl: Time to live in seconds
+            :param generation: The generation of model before counting
+        """
+        with self.lock:
+            if self.generation(model) != generation:
+                return
+
+            while self.size >= self.max_entries:
+                self.evict()
+
+            entries = self.entries.setdefault(model, {})
+            if key not in entries:
+                self.size += 1
+            entries[key] = (monotonic() + ttl, count)
+
+    def evict(self):
+        """
+            Removes the oldest count of the model with the most cached counts, call with the lock held
+        """
+        entries = max(self.entries.values(), key=len)
+        del entries[next(iter(entries))]
+        self.size -= 1
+
+    def invalidate(self, model):
+        """
+            Removes all cached counts of model
+
+            :param model: The sqlalchemy model
+        """
+        with self.lock:
+            self.generations[model] = self.generation(model) + 1
+            self.size -= len(self.entries.pop(model, ()))
+
+
+class InstanceCache(object):
+    """
+        LRU cache of serialized instances per model and primary key, limited by the size of the serialized instances
+
+        Writes through the api invalidate the instances of their model. Every invalidation increases the generation
+        of the model, an instance read before the invalidation is not cached afterwards.
+
+        :hits: The number of instances answered from the cache
+        :misses: The number of instances that were not cached
+        :evictions: The number of instances evicted to stay within max_bytes
+        :invalidations: The number of invalidated instances
+    """
+
+    def __init__(self, max_bytes: int=64 * 1024 * 1024):
+        """
+        :param max_bytes: The maximum size of all serialized instances, the least recently used are evicted first
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.identities = {}
+        self.generations = {}
+        self.size = 0
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, model, identity: tuple=None) -> int:
+        """
+            Returns the generation of model, pass it to set after reading the instance
+
+            :param model: The sqlalchemy model
+            :param identity: The primary keys of the instance (all instances of a model share the generation)
+        """
+        return self.generations.get(model, 0)
+
+    def get(self, model, identity: tuple, variant):
+        """
+            Returns the serialized instance or None if not cached
+
+            :param model: The sqlalchemy model
+            :param identity: The primary keys of the instance
+            :param variant: The key of the serialization (blueprint and fields)
+        """
+        with self.lock:
+            try:
+                value = self.entries[(model, identity, variant)]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries.move_to_end((model, identity, variant))
+            self.hits += 1
+            return value
+
+    def set(self, model, identity: tuple, variant, value: str, generation: int):
+        """
+            Caches the serialized instance unless model was invalidated since generation
+
+            :param model: The sqlalchemy model
+            :param identity: The primary keys of the instance
+            :param variant: The key of the serialization (blueprint and fields)
+            :param value: The serialized instance
+            :param generation: The generation of model before the instance was read
+        """
+        if len(value) > self.max_bytes:
+            return
+
+        with self.lock:
+            if self.generation(model) != generation:
+                return
+
+            key = (model, identity, variant)
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = value
+            self.size += len(value)
+            self.identities.setdefault(model, {}).setdefault(identity, set()).add(key)
+
+            while self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+            Removes the least recently used instance
+        """
+        (model, identity, variant), value = self.entries.popitem(last=False)
+        self.size -= len(value)
+        self.evictions += 1
+
+        keys = self.identities[model][identity]
+        keys.discard((model, identity, variant))
+        if not keys:
+            del self.identities[model][identity]
+
+    def invalidate(self, model, identities: list=None):
+        """
+            Removes the cached instances of model
+
+            :param model: The sqlalchemy model
+            :param identities: The primary keys of the instances, all instances of the model if None
+        """
+        with self.lock:
+            self.generations[model] = self.generation(model) + 1
+
+            cached = self.identities.get(model, {})
+            if identities is None:
+                identities = list(cached)
+            for identity in identities:
+                for key in cached.pop(tuple(identity), ()):
+                    self.size -= len(self.entries.pop(key))
+                    self.invalidations += 1
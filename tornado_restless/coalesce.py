@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless WriteCoalescer
+
+    Group commit: the single writes of concurrent requests share one transaction,
+     so many requests cost one commit (and on sqlite one fsync) instead of one each
+"""
+import logging
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 20:30'
+
+
+class WriteCoalescer(object):
+    """
+        Collects the writes of concurrent requests and executes them in one transaction
+
+        The first write starts a window of window seconds, all writes arriving within the window
+        (or until max_batch writes are collected) are executed one after another in one session.
+        Every write runs in its own savepoint: a failing write is rolled back alone and receives
+        its own error, the others are committed together with one commit at the end.
+
+        If the final commit fails, all writes of the group receive that error.
+    """
+
+    def __init__(self, session_maker, window: float=0.002, max_batch: int=64):
+        """
+        :param session_maker: The session maker of the api manager
+        :param window: Seconds to wait for further writes after the first one
+        :param max_batch: The maximum number of writes per transaction
+        """
+        self.session_maker = session_maker
+        self.window = window
+        self.max_batch = max_batch
+
+        self.pending = []
+        self.timeout = None
+
+    def submit(self, handler, method: str, *args) -> Future:
+        """
+            Queues a write of a handler
+
+            :param handler: The handler of the request, its model session is replaced by the shared one
+            :param method: Name of the method of the handler executing the write, e.g. post_single
+            :param args: The positional arguments of the method
+            :return: Future resolving to the return value of the method
+        """
+        future = Future()
+        self.pending.append((handler, method, args, future))
+
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timeout is None:
+            self.timeout = IOLoop.current().call_later(self.window, self.flush)
+
+        return future
+
+    def flush(self):
+        """
+            Executes and commits all queued writes
+        """
+        if self.timeout is not None:
+            IOLoop.current().remove_timeout(self.timeout)
+            self.timeout = None
+
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+
+        session = self.session_maker()
+        outcomes = []
+        try:
+            for handler, method, args, future in pending:
+                handler.model.session = session
+                handler.savepoint = session.begin_nested()
+                try:
+                    result = getattr(handler, method)(*args)
+                except Exception as ex:
+                    handler.savepoint.rollback()
+                    outcomes.append((future, None, ex))
+                else:
+                    if handler.savepoint.is_active:
+                        handler.savepoint.commit()
+                    else:
+                        handler.savepoint.rollback()
+                    outcomes.append((future, result, None))
+                finally:
+                    handler.savepoint = None
+
+            session.commit()
+        except Exception as ex:
+            logging.exception(ex)
+            session.rollback()
+            outcomes = [(future, None, error or ex) for future, result, error in outcomes]
+            outcomes.extend((future, None, ex) for handler, method, args, future in pending[len(outcomes):])
+        finally:
+            session.close()
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
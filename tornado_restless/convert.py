@@ -3,17 +3,20 @@
 """
 
 """
+from copy import copy
 from datetime import datetime, date, time
 from decimal import Decimal
+from types import MappingProxyType
 import collections
 import itertools
 
-from sqlalchemy.orm import object_mapper
+from sqlalchemy import inspect as sqinspect
+from sqlalchemy.orm import object_mapper, object_session
 from sqlalchemy.orm.exc import UnmappedInstanceError
 from sqlalchemy.orm.query import Query
 
 from .errors import IllegalArgumentError, DictConvertionError
-from .wrapper import ModelWrapper
+from .wrapper import ModelWrapper, SessionedModelWrapper
 
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
@@ -24,6 +27,12 @@ __basetypes__ = (str, int, bool, float)
 __clsztypes__ = (Decimal, )
 
 
+class RawJSON(str):
+    """
+        An already JSON encoded value, the BaseHandler writes it as it is
+    """
+
+
 def to_filter(instance,
               filters=None,
               order_by=None):
@@ -162,8 +171,11 @@ def parse_columns(strings):
     """
         Parse a list of column names (name1, name2, relation.name1, ...)
 
+        The result is a read-only tree, so it can be computed once per blueprint
+        and shared by all requests.
+
         :param strings: List of Column Names
-        :return:
+        :return: Read-only mapping of column name to True or a nested mapping
     """
     columns = {}
 
@@ -184,7 +196,7 @@ def parse_columns(strings):
             columns[key] = parse_columns(item)
 
     # Return
-    return columns
+    return MappingProxyType(columns)
 
 
 def to_deep(include,
@@ -200,7 +212,7 @@ def to_deep(include,
     rtn = {}
 
     try:
-        rtn['include'] = include.setdefault(key, False)
+        rtn['include'] = include.get(key, False)
     except AttributeError:
         rtn['include'] = False
 
@@ -212,6 +224,120 @@ def to_deep(include,
     return rtn
 
 
+def to_capped(instance,
+              relation: str,
+              limit: int,
+              capped: dict=None) -> tuple:
+    """
+        Get at most limit related instances and the total count of a relation
+
+        Relations that are not loaded yet are queried in the database instead of loading them completly,
+         ordered by the order_by of the relationship or the primary keys of the related model
+
+        :param instance: The parent instance
+        :param relation: The name of the relation
+        :param limit: The maximum number of related instances
+        :param capped: The relations fetched for a whole page, see to_capped_page
+        :return: (list of related instances, count) or (related instance, None) for scalar relations
+    """
+    if not object_mapper(instance).relationships[relation].uselist:
+        return getattr(instance, relation), None
+
+    if capped is not None and (sqinspect(instance).key, relation) in capped:
+        return capped[(sqinspect(instance).key, relation)]
+
+    prop = object_mapper(instance).relationships[relation]
+    if relation in instance.__dict__:
+        node = instance.__dict__[relation]
+    else:
+        node = object_session(instance).query(prop.mapper.class_).with_parent(instance, relation)
+
+    if isinstance(node, Query):
+        order_by = prop.order_by or prop.mapper.primary_key
+        return node.order_by(None).order_by(*order_by).limit(limit).all(), node.order_by(None).count()
+
+    node = list(node)
+    return node[:limit], len(node)
+
+
+def to_capped_page(instances: list,
+                   options: dict,
+                   include=None,
+                   exclude=None) -> dict:
+    """
+        Fetches the capped relations of all instances of a page at once instead of querying them per instance
+
+        Every relation is fetched with one windowed query (see SessionedModelWrapper.capped_relation) and
+         one grouped count query, the relations of the fetched instances are fetched the same way.
+
+        :param instances: The instances of the page
+        :param options: The options of to_dict
+        :param include: Columns and Relations that should be included for an instance
+        :param exclude: Columns and Relations that should not be included for an instance
+        :return: The options with the fetched relations (capped) to be passed to to_dict
+    """
+    if options.get('max_relation_results') is None:
+        return options
+
+    # Nested lists share the fetched relations of the page
+    if 'capped' not in options:
+        options = copy(options)
+        options['capped'] = {}
+    fetch_capped(instances, options, include, exclude)
+    return options
+
+
+def fetch_capped(instances: list,
+                 options: dict,
+                 include,
+                 exclude):
+    """
+        Adds the relations of instances to options['capped'] and recurses into the related instances
+
+        Only relations converted by to_dict are fetched, scalar relations are followed if they are loaded
+    """
+    if not instances or include is False:
+        return
+    try:
+        mappers = {object_mapper(instance) for instance in instances}
+    except UnmappedInstanceError:
+        return
+    if len(mappers) != 1 or object_session(instances[0]) is None:
+        return
+
+    mapper = mappers.pop()
+    model = SessionedModelWrapper(mapper.class_, object_session(instances[0]))
+    limit = options['max_relation_results']
+    capped = options['capped']
+
+    for relation, prop in mapper.relationships.items():
+        if isinstance(include, collections.Iterable):
+            if relation not in include:
+                continue
+        elif (exclude is not None and relation in exclude) or not options.get('execute_queries', True):
+            continue
+
+        # Scalar Relations
+        if not prop.uselist:
+            related = [instance.__dict__[relation] for instance in instances
+                       if instance.__dict__.get(relation) is not None]
+            fetch_capped(related, options, **to_deep(include, exclude, relation))
+            continue
+
+        # Not loaded or fetched yet
+        states = [sqinspect(instance) for instance in instances]
+        states = [state for state in states if state.key is not None and relation not in state.dict and
+                  (state.key, relation) not in capped]
+        identities = [state.identity for state in states]
+        rows = model.capped_relation(identities, relation, limit)
+        counts = model.count_relation(identities, relation)
+        for state in states:
+            capped[(state.key, relation)] = rows.get(state.identity, []), counts.get(state.identity, 0)
+
+        related = [node for instance in instances for node in to_capped(instance, relation, limit, capped)[0]]
+        fetch_capped(related, options, **to_deep(include, exclude, relation))
+
+
 def to_dict(instance,
             options=collections.defaultdict(bool),
             include=None,
@@ -225,6 +351,8 @@ def to_dict(instance,
         :param options: Dictionary of flags
                           * execute_queries: Execute Query Objects
                           * execute_hybrids: Execute Hybrids
+                          * max_relation_results: Convert at most that many instances of a relation,
+                                                  the count is added as <relation>__count
         :param include: Columns and Relations that should be included for an instance
         :param exclude: Columns and Relations that should not be included for an instance
     """
@@ -249,6 +377,8 @@ def to_dict(instance,
 
     # Any List
     if isinstance(instance, list) or hasattr(instance, '__iter__'):
+        instance = list(instance)
+        options = to_capped_page(instance, options, include=include, exclude=exclude)
         return [to_dict(x, options=options, include=include, exclude=exclude) for x in instance]
 
     # Additional classes:
@@ -258,9 +388,20 @@ def to_dict(instance,
 
     # Include Columns given
     if isinstance(include, collections.Iterable):
+        if options.get('max_relation_results') is not None:
+            relations = ModelWrapper.get_relations(object_mapper(instance)).keys()
+        else:
+            relations = ()
         rtn = {}
         for column in include:
-            rtn[column] = to_dict(getattr(instance, column), **to_deep(include, exclude, column))
+            if column in relations:
+                node, count = to_capped(instance, column, options['max_relation_results'],
+                                    options.get('capped'))
+                if count is not None:
+                    rtn[column + '__count'] = count
+            else:
+                node = getattr(instance, column)
+            rtn[column] = to_dict(node, options=options, **to_deep(include, exclude, column))
         return rtn
 
     # Include all columns if it is a SQLAlchemy instance
@@ -293,7 +434,13 @@ def to_dict(instance,
                 continue
 
         # Get Attribute
-        node = getattr(instance, column)
+        if column in relations and options.get('max_relation_results') is not None:
+            node, count = to_capped(instance, column, options['max_relation_results'],
+                                    options.get('capped'))
+            if count is not None:
+                rtn[column + '__count'] = count
+        else:
+            node = getattr(instance, column)
 
         # Don't execute queries if stopping deepnes
         if include is False and isinstance(node, Query):
@@ -303,5 +450,5 @@ def to_dict(instance,
             node = node.all()
 
         # Convert it
-        rtn[column] = to_dict(node, **to_deep(include, exclude, column))
+        rtn[column] = to_dict(node, options=options, **to_deep(include, exclude, column))
     return rtn
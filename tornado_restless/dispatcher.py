@@ -0,0 +1,42 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless DispatchHandler
+
+    Serves all blueprints of one url_prefix through a single route,
+     the collection is looked up in a dictionary instead of trying one regex per model
+"""
+from tornado.web import RequestHandler, ErrorHandler
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 10:12'
+
+
+class DispatchHandler(RequestHandler):
+    """
+        Dispatcher for all blueprints below an url_prefix
+
+        Tornado instantiates this class for every request on the dispatcher route,
+        instead of itself it returns the handler_class of the matching blueprint
+        initialized with the kwargs of that blueprint.
+
+        Unknown collections are answered with 404.
+    """
+
+    def __new__(cls, application, request, url_prefix: str, blueprints: dict, **kwargs):
+        """
+            Lookup the blueprint for the requested collection
+
+            :param application: The tornado application
+            :param request: The incoming request
+            :param url_prefix: The url prefix of the dispatcher route
+            :param blueprints: Dictionary of collection_name to blueprint
+        """
+        collection_name = request.path[len(url_prefix) + 1:].split('/', 1)[0]
+
+        try:
+            blueprint = blueprints[collection_name]
+        except KeyError:
+            return ErrorHandler(application, request, status_code=404)
+
+        return blueprint.handler_class(application, request, **blueprint.kwargs)
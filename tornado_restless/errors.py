@@ -40,6 +40,26 @@ class DictConvertionError(HTTPError):
         self.instance_type = instance_type
 
 
+class RequestCancelled(HTTPError):
+    """
+        Raised when the client closed the connection and the remaining work of the request is skipped
+    """
+
+    def __init__(self, log_message=None, status_code=499, *args, **kwargs):
+        kwargs.setdefault('reason', 'Client Closed Request')
+        super().__init__(status_code, log_message, *args, **kwargs)
+
+
+
+class StatementTimeout(HTTPError):
+    """
+        Raised when a statement exceeded the statement timeout of the blueprint, the request may be retried
+    """
+
+    def __init__(self, log_message=None, status_code=503, *args, **kwargs):
+        kwargs.setdefault('reason', 'Service Unavailable')
+        super().__init__(status_code, log_message, *args, **kwargs)
+
 try:
     from tornado.web import MethodNotAllowedError
 except ImportError:
@@ -0,0 +1,282 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Change feed of collections as Server-Sent Events
+
+    Writes through the api publish create, update and delete events after their commit,
+     subscribers receive them at url_prefix/_events/<collection> instead of polling get_many
+"""
+from collections import deque
+from datetime import timedelta
+from json import dumps, loads
+import operator
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.locks import Event
+from tornado.web import RequestHandler, HTTPError
+
+from .errors import IllegalArgumentError
+from .memory import like
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 01:40'
+
+
+class EventFilter(object):
+    """
+        A restless filter evaluated on the object of an event
+
+        Supported are the comparisons, in/not_in, is_null/is_not_null, between and the like operators on columns.
+        Events of bulk writes only carry the primary keys and the written values: a filter on a column
+         missing in the object of an event does not exclude the event.
+    """
+
+    COMPARISONS = {"==": "eq", "eq": "eq", "equals": "eq", "equals_to": "eq",
+                   "!=": "ne", "ne": "ne", "neq": "ne", "not_equal_to": "ne", "does_not_equal": "ne",
+                   ">": "gt", "gt": "gt", "<": "lt", "lt": "lt",
+                   ">=": "ge", "ge": "ge", "gte": "ge", "geq": "ge", "<=": "le", "le": "le", "lte": "le", "leq": "le"}
+    LIKES = {"like": "%s", "ilike": "%s", "not_like": "%s", "not_ilike": "%s",
+             "startswith": "%s%%", "endswith": "%%%s", "contains": "%%%s%%"}
+
+    def __init__(self, argument_filter: dict):
+        """
+        :param argument_filter: A filter in restless 3-tuple op string format
+        :raise IllegalArgumentError: If the filter can't be evaluated on events
+        """
+        if not isinstance(argument_filter, dict) or "name" not in argument_filter:
+            raise IllegalArgumentError("Missing fieldname attribute 'name'")
+        if "field" in argument_filter or "." in argument_filter["name"] or "__" in argument_filter["name"]:
+            raise IllegalArgumentError("Filter '%s' can't be evaluated on events" % argument_filter["name"])
+
+        self.name = argument_filter["name"]
+        self.op = op = argument_filter.get("op")
+        value = argument_filter.get("val", argument_filter.get("value"))
+
+        if op == "is_null":
+            self.test = lambda item: item is None
+        elif op == "is_not_null":
+            self.test = lambda item: item is not None
+        elif op in self.COMPARISONS:
+            compare = getattr(operator, self.COMPARISONS[op])
+            self.test = lambda item: item is not None and value is not None and self.compare(compare, item, value)
+        elif op in ("in", "not_in") and isinstance(value, list):
+            if op == "in":
+                self.test = lambda item: item in value
+            else:
+                self.test = lambda item: item is not None and item not in value
+        elif op == "between" and isinstance(value, list) and len(value) == 2:
+            self.test = lambda item: item is not None and \
+                self.compare(operator.le, value[0], item) and self.compare(operator.le, item, value[1])
+        elif op in self.LIKES and isinstance(value, str):
+            match = like(self.LIKES[op] % value, op in ("ilike", "not_ilike"))
+            if op.startswith("not_"):
+                self.test = lambda item: isinstance(item, str) and match(item) is None
+            else:
+                self.test = lambda item: isinstance(item, str) and match(item) is not None
+        else:
+            raise IllegalArgumentError("Operator '%s' can't be evaluated on events" % op)
+
+    @staticmethod
+    def compare(compare, left, right) -> bool:
+        try:
+            return compare(left, right)
+        except TypeError:
+            return False
+
+    def __call__(self, obj: dict) -> bool:
+        if self.name not in obj:
+            return True
+        return self.test(obj[self.name])
+
+
+class Subscriber(object):
+    """
+        A client of a change feed with a bounded buffer
+
+        If the client does not read fast enough and the buffer overflows, the subscriber is dropped:
+         it receives an overflow event and the stream is closed, the client has to resync.
+    """
+
+    def __init__(self, filters: list, max_buffer: int):
+        """
+        :param filters: List of EventFilter, all must match
+        :param max_buffer: The maximum number of buffered events
+        """
+        self.filters = filters
+        self.max_buffer = max_buffer
+        self.buffer = deque()
+        self.event = Event()
+        self.dropped = False
+        self.closed = False
+
+    def push(self, event: dict):
+        """
+            Buffers an event if it matches the filters
+        """
+        if self.closed or not all(test(event['object']) for test in self.filters):
+            return
+
+        if len(self.buffer) >= self.max_buffer:
+            self.buffer.clear()
+            self.dropped = True
+            self.closed = True
+        else:
+            self.buffer.append(event)
+        self.event.set()
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+
+    @gen.coroutine
+    def wait(self, timeout: float) -> list:
+        """
+            Waits for events
+
+            :param timeout: Seconds to wait
+            :return: The buffered events, empty after the timeout
+        """
+        if not self.buffer and not self.closed:
+            try:
+                yield self.event.wait(timeout=timedelta(seconds=timeout))
+            except gen.TimeoutError:
+                pass
+        self.event.clear()
+
+        events = list(self.buffer)
+        self.buffer.clear()
+        return events
+
+
+class ChangeFeed(object):
+    """
+        The subscribers of a collection
+
+        :published: The number of published events
+        :dropped: The number of subscribers dropped because of a full buffer
+    """
+
+    def __init__(self, max_buffer: int=1000):
+        """
+        :param max_buffer: The maximum number of buffered events per subscriber
+        """
+        self.max_buffer = max_buffer
+        self.subscribers = set()
+        self.io_loop = None
+        self.sequence = 0
+
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, filters: list) -> Subscriber:
+        """
+            Adds a subscriber, call in the thread of the IOLoop
+
+            :param filters: List of EventFilter
+        """
+        self.io_loop = IOLoop.current()
+        subscriber = Subscriber(filters, self.max_buffer)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+        if subscriber.dropped:
+            self.dropped += 1
+
+    def publish(self, events: list):
+        """
+            Delivers events to the subscribers, may be called from any thread
+
+            :param events: List of (type, object)
+        """
+        if self.subscribers and self.io_loop is not None:
+            self.io_loop.add_callback(self.deliver, events)
+
+    def deliver(self, events: list):
+        for event_type, obj in events:
+            self.sequence += 1
+            self.published += 1
+            event = {'id': self.sequence, 'type': event_type, 'object': obj}
+            for subscriber in list(self.subscribers):
+                subscriber.push(event)
+
+
+class FeedHandler(RequestHandler):
+    """
+        Streams the events of a collection as text/event-stream
+
+        Every event has the id, the event type (create, update or delete) and the JSON
+         {"type": .., "object": ..} as data. The object is the instance as returned by the write,
+         for deletes and bulk writes only the primary keys and the written values.
+    """
+
+    SUPPORTED_METHODS = ['GET']
+
+    # noinspection PyMethodOverriding
+    def initialize(self, manager, url_prefix: str, keepalive: float):
+        """
+        :param manager: The tornado_restless Api Manager
+        :param url_prefix: The url prefix of the blueprints
+        :param keepalive: Seconds after which a comment is sent if no event occurred
+        """
+        super().initialize()
+
+        self.manager = manager
+        self.url_prefix = url_prefix
+        self.keepalive = keepalive
+        self.subscriber = None
+
+    @gen.coroutine
+    def get(self, collection: str=None, *args):
+        """
+            GET the events of a collection
+
+            :statuscode 200: event stream
+            :statuscode 400: filter can't be evaluated on events
+            :statuscode 404: no change feed for the collection
+
+            :query filters: list of filters an event has to match
+        """
+        feed = self.manager.feeds.get((self.url_prefix, collection))
+        if feed is None:
+            raise HTTPError(404, "No change feed for %s" % collection)
+
+        try:
+            filters = loads(self.get_argument("q", default="{}")).get("filters", [])
+        except (ValueError, AttributeError):
+            raise IllegalArgumentError("Query is not valid JSON")
+        if not isinstance(filters, list):
+            raise IllegalArgumentError("Filters must be a list")
+        filters = [EventFilter(argument_filter) for argument_filter in filters]
+
+        self.subscriber = feed.subscribe(filters)
+        try:
+            self.set_header("Content-Type", "text/event-stream")
+            self.set_header("Cache-Control", "no-cache")
+            yield self.flush()
+
+            while not self.subscriber.closed:
+                events = yield self.subscriber.wait(self.keepalive)
+                if not events and not self.subscriber.closed:
+                    self.write(": keepalive\n\n")
+                for event in events:
+                    self.write("id: %u\nevent: %s\ndata: %s\n\n" % (event['id'], event['type'],
+                                                                   dumps({'type': event['type'],
+                                                                          'object': event['object']})))
+                yield self.flush()
+
+            # The client missed events and has to resync
+            if self.subscriber.dropped:
+                self.write("event: overflow\ndata: {}\n\n")
+            self.finish()
+        except StreamClosedError:
+            pass
+        finally:
+            feed.unsubscribe(self.subscriber)
+
+    def on_connection_close(self):
+        if self.subscriber is not None:
+            self.subscriber.close()
@@ -6,24 +6,35 @@
     Handles all registered blueprints, you may override this class and
      use the modification via create_api_blueprint(handler_class=...)
 """
-import inspect
-from json import loads
+from contextlib import contextmanager
+from copy import deepcopy
+from json import loads, dumps
 import logging
 from math import ceil
+from socket import MSG_PEEK, MSG_DONTWAIT
+from time import monotonic
+from types import MappingProxyType
 from traceback import print_exception
 from urllib.parse import parse_qs
 import sys
 import itertools
 
-from sqlalchemy import inspect as sqinspect
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import inspect as sqinspect, text
+from sqlalchemy.exc import SQLAlchemyError, DBAPIError
 from sqlalchemy.orm.exc import NoResultFound, UnmappedInstanceError, MultipleResultsFound
 from sqlalchemy.util import memoized_instancemethod, memoized_property
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.escape import json_encode, utf8
+from tornado.httputil import HTTPServerRequest, HTTPHeaders
+from tornado.ioloop import IOLoop
 from tornado.web import RequestHandler, HTTPError
 
-from .convert import to_dict, to_filter, parse_columns
-from .errors import IllegalArgumentError, MethodNotAllowedError, ProcessingException
-from .wrapper import SessionedModelWrapper
+from .batch import BatchConnection
+from .convert import to_dict, to_filter, to_deep, parse_columns, RawJSON
+from .errors import IllegalArgumentError, MethodNotAllowedError, ProcessingException, RequestCancelled, \
+    StatementTimeout
+from .wrapper import ModelWrapper, SessionedModelWrapper, RelatedModelWrapper, _is_ordering_expression
 
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
@@ -48,6 +59,15 @@ class BaseHandler(RequestHandler):
 
     ID_SEPARATOR = ","
     SUPPORTED_METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+    CANCEL_CHECK_INSTRUCTIONS = 100000
+    FLIGHT_HEADERS = ('Authorization', 'Cookie')
+
+    def __init__(self, application, request, **kwargs):
+        """
+        :param kwargs: The arguments of initialize, kept for handlers detached from the request, see detached
+        """
+        self.initialize_kwargs = kwargs
+        super().__init__(application, request, **kwargs)
 
     # noinspection PyMethodOverriding
     def initialize(self,
@@ -61,10 +81,31 @@ class BaseHandler(RequestHandler):
                    validation_exceptions,
                    exclude_queries: bool,
                    exclude_hybrids: bool,
-                   include_columns: list,
-                   exclude_columns: list,
+                   include_columns: dict,
+                   exclude_columns: dict,
                    results_per_page: int,
-                   max_results_per_page: int):
+                   max_results_per_page: int,
+                   max_relation_results: int,
+                   count_relations: list,
+                   database_json: bool,
+                   count_strategy: str,
+                   count_cache_ttl: float,
+                   chunk_size: int,
+                   max_filters: int,
+                   max_filter_depth: int,
+                   max_in_size: int,
+                   filterable_columns: frozenset,
+                   sortable_columns: frozenset,
+                   statement_timeout: float,
+                   admission: dict,
+                   retry_after: int,
+                   single_flight: bool,
+                   cache_key: tuple,
+                   in_memory: bool,
+                   change_tracker,
+                   feed_key: tuple,
+                   version_column: str,
+                   snapshot):
         """
 
         Init of the handler, derives arguments from api create_api_blueprint
@@ -79,10 +120,35 @@ class BaseHandler(RequestHandler):
         :param validation_exceptions:
         :param exclude_queries: Don't execude dynamic queries (like from associations or lazy relations)
         :param exclude_hybrids: When exclude_queries is True and exclude_hybrids is False, hybrids are still included.
-        :param include_columns: Whitelist of columns to be included
-        :param exclude_columns: Blacklist of columns to be excluded
+        :param include_columns: Whitelist of columns to be included, already parsed by :func:`parse_columns`
+        :param exclude_columns: Blacklist of columns to be excluded, already parsed by :func:`parse_columns`
         :param results_per_page: The default value of how many results are returned per request
         :param max_results_per_page: The hard upper limit of resutest per page
+        :param max_relation_results: Embed at most that many instances of a relation, plus a <relation>__count field
+        :param count_relations: Relations for which a <relation>__count field is added without loading them
+        :param database_json: Let the database encode the objects of column only GET requests as JSON
+                              (ordered requests on postgresql only, not with GET postprocessors)
+        :param count_strategy: How num_results is determined: 'exact', 'cached' or 'estimated'
+        :param count_cache_ttl: Seconds a count is cached with count_strategy 'cached'
+        :param chunk_size: Let PATCH/DELETE many modify at most that many instances per statement and commit,
+                           otherwise they are atomic
+        :param max_filters: The maximum number of filters and orderings of a request
+        :param max_filter_depth: The maximum number of relations a filter may traverse (relation.column is 1)
+        :param max_in_size: The maximum number of values of an in/not_in filter
+        :param filterable_columns: Whitelist of columns (and relation.columns) that may be filtered
+        :param sortable_columns: Whitelist of columns that may be ordered by
+        :param statement_timeout: Seconds a statement of a GET request may run (with sqlite all together)
+        :param admission: The AdmissionBudget for 'read' and 'write' requests (or None)
+        :param retry_after: Seconds sent as Retry-After header on rejected requests
+        :param single_flight: Compute GET requests in the thread pool of the api manager,
+                              identical concurrent requests share one computation
+        :param cache_key: The key of the blueprint in the instance cache of the api manager,
+                          None if get_single does not use the cache
+        :param in_memory: Answer get_single and get_many from the memory table of the model in the api manager
+        :param change_tracker: The ChangeTracker answering get_many with a since token, None if changes are not tracked
+        :param feed_key: The key of the change feed of the api manager the writes are published to, None if no feed
+        :param version_column: The integer column increased by every PATCH/PUT for optimistic concurrency, or None
+        :param snapshot: The Snapshot pinning the pages of get_many with a snapshot token, None if not supported
 
         :reqheader X-HTTP-Method-Override: If allow_method_override is True, this header overwrites the request method
         """
@@ -93,6 +159,7 @@ class BaseHandler(RequestHandler):
 
         super(BaseHandler, self).initialize()
 
+        self.manager = manager
         self.model = SessionedModelWrapper(model, manager.session_maker())
         self.pk_length = len(sqinspect(model).primary_key)
         self.methods = [method.lower() for method in methods]
@@ -105,26 +172,160 @@ class BaseHandler(RequestHandler):
         self.results_per_page = results_per_page
         self.max_results_per_page = max_results_per_page
 
-        self.include = self.parse_columns(include_columns)
-        self.exclude = self.parse_columns(exclude_columns)
+        self.count_relations = count_relations
+        self.database_json = database_json
+
+        self.count_strategy = count_strategy
+        self.count_cache_ttl = count_cache_ttl
+
+        self.chunk_size = chunk_size
+
+        self.max_filters = max_filters
+        self.max_filter_depth = max_filter_depth
+        self.max_in_size = max_in_size
+        self.filterable_columns = filterable_columns
+        self.sortable_columns = sortable_columns
+        self.statement_timeout = statement_timeout
+
+        self.admission = admission
+        self.admitted = None
+        self.retry_after = retry_after
 
-        self.to_dict_options = {'execute_queries': not exclude_queries, 'execute_hybrids': not exclude_hybrids}
+        self.single_flight = single_flight
+        self.cache_key = cache_key
+        self.in_memory = in_memory
+        self.change_tracker = change_tracker
+        self.feed_key = feed_key
+        self.changes = []
+        self.version_column = version_column
+        self.snapshot = snapshot
 
+        self.job = None
+        self.savepoint = None
+        self.cancelled = False
+        self.statement_connection = None
+
+        self.include = include_columns
+        self.exclude = exclude_columns
+
+        self.to_dict_options = {'execute_queries': not exclude_queries,
+                                'execute_hybrids': not exclude_hybrids,
+                                'max_relation_results': max_relation_results}
+
+    @gen.coroutine
     def prepare(self):
         """
             Prepare the request
+
+            Waits for a slot of the admission budget of the request method (reads: GET/HEAD/OPTIONS, writes: others),
+            the request is rejected if the queue is full or the slot is not free in time.
+
+            :statuscode 503: Too many requests, retry after the seconds of the Retry-After header
         """
-        self._call_preprocessor()
+        budget = self.admission['read' if self.request.method in ('GET', 'HEAD', 'OPTIONS') else 'write']
+        if budget is not None:
+            admitted = yield budget.acquire()
+            if not admitted:
+                self.set_status(503, "Service Unavailable")
+                self.set_header('Retry-After', self.retry_after)
+                self.finish({'type': 'tornado_restless.admission', 'message': 'Too many requests'})
+                return
+            self.admitted = budget
+
+        self._call_preprocessor('prepare')
 
     def on_finish(self):
         """
             Finish the request
+
+            The session is released in the thread that used it, see ApiManager.release_session
         """
-        self._call_postprocessor()
+        if self.admitted is not None:
+            self.admitted.release()
+            self.admitted = None
 
-    def parse_columns(self, strings):
+        self._call_postprocessor('on_finish')
+
+        self.manager.release_session(self.model.session)
+
+    @classmethod
+    def parse_columns(cls, strings):
+        """
+            Parse the include/exclude column lists of a blueprint
+
+            Called once by :func:`ApiManager.create_api_blueprint`, the result is shared by all requests
+
+            :param strings: List of Column Names
+        """
         return parse_columns(strings)
 
+    @memoized_instancemethod
+    def get_fields(self):
+        """
+            Returns the columns requested by the fields argument, limited to the columns of the blueprint
+
+            :statuscode 400: if a field is unknown or not included
+
+            :query fields: list of column and relation names (name1, relation.name1, ...)
+        """
+        fields = self.get_query_argument("fields", None)
+        if fields is None:
+            return None
+        if isinstance(fields, str):
+            fields = fields.split(",")
+
+        return self.narrow_columns(self.model, self.parse_columns(fields), self.include, self.exclude)
+
+    def narrow_columns(self, model: ModelWrapper, fields, include, exclude):
+        """
+            Validates the requested fields against the included columns and relations
+
+            :param model: The wrapper of the model the fields belong to
+            :param fields: The requested columns, parsed by parse_columns
+            :param include: Columns and Relations that are included by the blueprint
+            :param exclude: Columns and Relations that are excluded by the blueprint
+            :return: The requested columns in the format of include
+        """
+        known = set(model.columns) | set(model.relations) | {p.key for p in model.hybrids + model.proxies}
+
+        narrowed = {}
+        for key, value in fields.items():
+            if key not in known:
+                raise IllegalArgumentError("Field '%s' not defined for %s" % (key, model.__name__))
+            if (include is not None and key not in include) or (exclude is not None and key in exclude):
+                raise IllegalArgumentError("Field '%s' not included for %s" % (key, model.__name__))
+
+            allowed = include[key] if include is not None else True
+            if value is True:
+                narrowed[key] = allowed
+            elif key in model.relations:
+                related = ModelWrapper(model.relations[key].property.mapper.class_)
+                narrowed[key] = self.narrow_columns(related, value, allowed if allowed is not True else None, None)
+            else:
+                raise IllegalArgumentError("Field '%s' of %s is not a relation" % (key, model.__name__))
+
+        return MappingProxyType(narrowed)
+
+    def get_load_only(self):
+        """
+            Returns the names of the columns that need to be loaded for the fields argument
+
+            None if all columns need to be loaded, e.g. because hybrids or proxies may depend on any column
+        """
+        fields = self.get_fields()
+        if fields is None:
+            return None
+
+        columns = set()
+        for key in fields:
+            if key in self.model.columns:
+                columns.add(key)
+            elif key in self.model.relations:
+                columns.update(self.model.foreign_keys)
+            else:
+                return None
+        return list(columns)
+
     def get_filters(self):
         """
             Returns a list of filters made by the query argument
@@ -139,8 +340,85 @@ class BaseHandler(RequestHandler):
         # Get all provided orders
         argument_orders = self.get_query_argument("order_by", [])
 
+        # Check the cost before any sql is run
+        self.check_filters(argument_filters, argument_orders)
+
         return to_filter(self.model.model, argument_filters, argument_orders)
 
+    def check_filters(self, filters: list, order_by: list, prefix: str=None):
+        """
+            Rejects filters and orderings exceeding the query cost limits of the blueprint
+
+            :param filters: List of filters in restless 3-tuple op string format
+            :param order_by: List of orders
+            :param prefix: The relation the filters are applied on, e.g. for get_relation
+            :raise: IllegalArgumentError
+        """
+        if not isinstance(filters, list) or not isinstance(order_by, list):
+            raise IllegalArgumentError("Filters and orderings must be lists")
+
+        if self.max_filters is not None and len(filters) + len(order_by) > self.max_filters:
+            raise IllegalArgumentError("More than %u filters and orderings" % self.max_filters)
+
+        def qualified(name):
+            name = str(name).replace("__", ".")
+            return name if prefix is None else "%s.%s" % (prefix, name)
+
+        for argument_filter in filters:
+            if not isinstance(argument_filter, dict):
+                raise IllegalArgumentError("Filter must be an object")
+
+            names = [qualified(argument_filter.get("name"))]
+            if "field" in argument_filter:
+                names.append(qualified(argument_filter["field"]))
+
+            for name in names:
+                if self.filterable_columns is not None and name not in self.filterable_columns:
+                    raise IllegalArgumentError("Filtering by '%s' is not allowed" % name)
+                if self.max_filter_depth is not None and name.count(".") > self.max_filter_depth:
+                    raise IllegalArgumentError("Filter '%s' traverses more than %u relations" %
+                                               (name, self.max_filter_depth))
+
+            value = argument_filter.get("val", argument_filter.get("value"))
+            if self.max_in_size is not None and argument_filter.get("op") in ("in", "not_in") and \
+                    isinstance(value, list) and len(value) > self.max_in_size:
+                raise IllegalArgumentError("Filter '%s' with more than %u values" %
+                                           (argument_filter.get("name"), self.max_in_size))
+
+        for argument_order in order_by:
+            if not isinstance(argument_order, dict):
+                raise IllegalArgumentError("Ordering must be an object")
+
+            name = qualified(argument_order.get("field"))
+            if self.sortable_columns is not None and name not in self.sortable_columns:
+                raise IllegalArgumentError("Ordering by '%s' is not allowed" % name)
+
+    def write(self, chunk):
+        """
+            Writes chunk to the output buffer
+
+            Values of a dictionary that are :class:`RawJSON` are written as they are, without encoding them again
+
+            :param chunk: str, bytes or dict
+        """
+        if isinstance(chunk, dict) and any(isinstance(value, RawJSON) for value in chunk.values()):
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
+            chunk = self.encode(chunk)
+        super().write(chunk)
+
+    @staticmethod
+    def encode(chunk: dict) -> str:
+        """
+            Encodes a dictionary as JSON, values that are :class:`RawJSON` are inserted as they are
+
+            :param chunk: dict
+        """
+        if not any(isinstance(value, RawJSON) for value in chunk.values()):
+            return json_encode(chunk)
+        return "{%s}" % ", ".join("%s: %s" % (json_encode(key),
+                                              value if isinstance(value, RawJSON) else json_encode(value))
+                                  for key, value in chunk.items())
+
     def write_error(self, status_code: int, **kwargs):
         """
             Encodes any exceptions thrown to json
@@ -194,36 +472,51 @@ class BaseHandler(RequestHandler):
         else:
             super().write_error(status_code, **kwargs)
 
-    def patch(self, instance_id: str=None):
+    def patch(self, instance_id: str=None, relation: str=None):
         """
             PATCH (update instance) request
 
+            Returns a Future if the write of a single instance is coalesced, see execute_write
+
             :param instance_id: query argument of request
             :type instance_id: comma seperated string list
+            :param relation: (unsupported)
 
             :statuscode 403: PATCH MANY disallowed
             :statuscode 405: PATCH disallowed
+            :statuscode 412: Instance is not at the version of If-Match
         """
 
-        if not 'patch' in self.methods:
+        if not 'patch' in self.methods or relation is not None:
             raise MethodNotAllowedError(self.request.method)
 
-        self._call_preprocessor(search_params=self.search_params)
+        self._call_preprocessor('patch', search_params=self.search_params)
 
         if instance_id is None:
-            if self.allow_patch_many:
+            if self.allow_patch_many and self.prefers_async:
+                result = self.respond_async('patch_many')
+                self._call_postprocessor('patch', result=result)
+                self.finish(result)
+                return
+            elif self.allow_patch_many:
                 result = self.patch_many()
             else:
                 raise MethodNotAllowedError(self.request.method, status_code=403)
+        elif self.get_if_match() is not None:
+            return self.execute_write('patch', [self.parse_pk(instance_id)],
+                                      'patch_version', self.parse_pk(instance_id), self.get_if_match())
         else:
-            result = self.patch_single(self.parse_pk(instance_id))
+            return self.execute_write('patch', [self.parse_pk(instance_id)],
+                                      'patch_single', self.parse_pk(instance_id))
+
+        self.on_modified(None)
 
-        self._call_postprocessor(result=result)
+        self._call_postprocessor('patch', result=result)
         self.finish(result)
 
     def patch_many(self) -> dict:
         """
-            Patch many instances
+            Patch many instances, see patch_bulk if the body is a list
 
             :statuscode 201: instances successfull modified
 
@@ -231,6 +524,9 @@ class BaseHandler(RequestHandler):
             :query single: If true sqlalchemy will raise an error if zero or more than one instances would be modified
         """
 
+        if isinstance(self.get_body_arguments(), list):
+            return self.patch_bulk()
+
         # Flush
         self.model.session.flush()
 
@@ -244,18 +540,24 @@ class BaseHandler(RequestHandler):
         limit = self.get_query_argument("limit", None)
 
         # Call Preprocessor
-        self._call_preprocessor(filters=filters, data=values)
+        self._call_preprocessor('patch_many', filters=filters, data=values)
 
         # Modify Instances
         if self.get_query_argument("single", False):
             instances = [self.model.one(filters=filters)]
             for instance in instances:
-                for (key, value) in values.items():
+                for (key, value) in self.versioned(values).items():
                     logging.debug("%s => %s" % (key, value))
                     setattr(instance, key, value)
+                self.add_changes('update', [sqinspect(instance).identity], values)
             num = 1
+        elif limit is not None or self.chunk_size is not None or self.feed_key is not None:
+            num, chunks = self.execute_chunked(lambda identities: self.update_identities(values, identities),
+                                               filters, limit)
+            self.set_status(201, "Patched")
+            return {'num_modified': num, 'num_chunks': chunks}
         else:
-            num = self.model.update(values, limit=limit, filters=filters)
+            num = self.model.update(self.versioned(values), filters=filters)
 
         # Commit
         self.model.session.commit()
@@ -264,6 +566,66 @@ class BaseHandler(RequestHandler):
         self.set_status(201, "Patched")
         return {'num_modified': num}
 
+    def patch_bulk(self) -> dict:
+        """
+            Patch every instance of a list with its own values
+
+            Every element of the list contains the primary keys and the changes of one instance.
+            All changes are written in one transaction with one executemany per set of changed columns,
+            the instances are never loaded.
+
+            The result contains the status of every element in the order of the list:
+            201 if patched, 400 for malformed elements and 404 if no instance exists.
+
+            :statuscode 201: list processed, see the results for the status of every element
+        """
+
+        # Get values
+        results = []
+        rows = {}
+        for argument in self.get_body_arguments():
+            try:
+                values = self.get_argument_values(argument)
+                for key in self.model.primary_key_names:
+                    if values.get(key) is None:
+                        raise IllegalArgumentError("Missing primary key %s" % key)
+                for key in values:
+                    if key not in self.model.columns:
+                        raise IllegalArgumentError("Column '%s' not defined for %s" % (key, self.model.__name__))
+                identity = tuple(self.model.coerce_primary_keys([values[key]
+                                                                 for key in self.model.primary_key_names]))
+                values.update(zip(self.model.primary_key_names, identity))
+            except (HTTPError, NoResultFound) as ex:
+                results.append({'status': 400, 'message': "%s" % (getattr(ex, 'log_message', None) or ex)})
+            else:
+                results.append({'status': 201, 'id': list(identity)})
+                rows.setdefault(identity, {}).update(values)
+
+        # Call Preprocessor
+        self._call_preprocessor('patch_bulk', data=list(rows.values()))
+
+        # Existing Instances
+        existing = self.model.existing_identities(list(rows))
+        for result in results:
+            if result['status'] == 201 and tuple(result['id']) not in existing:
+                result['status'] = 404
+                result['message'] = 'No result found'
+
+        # Modify Instances
+        num = self.model.bulk_update([values for identity, values in rows.items() if identity in existing])
+        if self.version_column is not None and num:
+            self.model.update_identities(self.versioned({}), [identity for identity in rows if identity in existing])
+        for identity, values in rows.items():
+            if identity in existing:
+                self.add_changes('update', [identity], values)
+
+        # Commit
+        self.model.session.commit()
+
+        # Result
+        self.set_status(201, "Patched")
+        return {'num_modified': num, 'results': results}
+
     def patch_single(self, instance_id: list) -> dict:
         """
             Patch one instance
@@ -279,24 +641,18 @@ class BaseHandler(RequestHandler):
                 values = self.get_argument_values()
 
                 # Call Preprocessor
-                self._call_preprocessor(instance_id=instance_id, data=values)
+                self._call_preprocessor('patch_single', instance_id=instance_id, data=values)
 
                 # Get Instance
                 instance = self.model.get(*instance_id)
 
                 # Set Values
-                for (key, value) in values.items():
+                for (key, value) in self.versioned(values).items():
                     self.logger.debug("%r.%s => %s" % (instance, key, value))
                     setattr(instance, key, value)
 
                 # Flush
-                try:
-                    self.model.session.flush()
-                except SQLAlchemyError as ex:
-                    logging.exception(ex)
-                    self.model.session.rollback()
-                    self.send_error(status_code=400, exc_info=sys.exc_info())
-                    return
+                self.model.session.flush()
 
                 # Refresh
                 self.model.session.refresh(instance)
@@ -305,40 +661,138 @@ class BaseHandler(RequestHandler):
                 self.set_status(201, "Patched")
 
                 # To Dict
-                return self.to_dict(instance)
+                result = self.to_dict(instance)
+                self.add_change('update', result)
+                return result
         except SQLAlchemyError as ex:
             logging.exception(ex)
             self.send_error(status_code=400, exc_info=sys.exc_info())
         finally:
             # Commit
-            self.model.session.commit()
+            self.commit()
+
+    def patch_version(self, instance_id: list, versions) -> dict:
+        """
+            Patch one instance if it is still at one of versions, without loading or refreshing it
+
+            :param instance_id: query argument of request
+            :type instance_id: list of primary keys
+            :param versions: The expected values of the version column, '*' for any, see get_if_match
+
+            :statuscode 201: instance successfull modified
+            :statuscode 412: instance modified meanwhile (or not existing)
+
+            :resheader ETag: The new version
+        """
+        values = self.get_argument_values()
+
+        # Call Preprocessor
+        self._call_preprocessor('patch_version', instance_id=instance_id, data=values)
+
+        # Conditional Update
+        identity = tuple(self.model.coerce_primary_keys(instance_id))
+        if not self.model.update_version(values, identity, self.version_column, versions):
+            self.rollback()
+            raise HTTPError(412, "%s(%s) does not match If-Match %s" % (self.model.__collectionname__,
+                                                                       ",".join(str(pk) for pk in identity),
+                                                                       self.request.headers.get('If-Match')),
+                            reason='Precondition Failed')
+
+        # New Version
+        if versions != '*' and len(versions) == 1:
+            version = versions[0] + 1
+        else:
+            version = self.model.session.query(getattr(self.model.model, self.version_column)) \
+                .filter(self.model.identity_condition([identity])).scalar()
+
+        # Commit
+        self.commit()
+
+        # Set Status
+        self.set_status(201, "Patched")
+        self.set_header("Etag", '"%u"' % version)
+
+        # To Dict
+        result = {key: to_dict(value) for key, value in values.items()}
+        result.update((key, to_dict(value)) for key, value in zip(self.model.primary_key_names, identity))
+        result[self.version_column] = version
+        self.add_change('update', result)
+        return result
+
+    def get_if_match(self):
+        """
+            The versions expected by the client if the blueprint has a version column
+
+            The entity tags are compared strongly (RFC 7232): weak tags (W/"3") never match,
+             * matches any version of an existing instance.
+
+            :reqheader If-Match: The expected versions as entity tags, e.g. "3" or "3", "4"
+            :return: None, the list of versions or '*'
+        """
+        if self.version_column is None or 'If-Match' not in self.request.headers:
+            return None
+
+        header = self.request.headers['If-Match'].strip()
+        if header == '*':
+            return '*'
+
+        versions = []
+        for tag in header.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                continue
+            if len(tag) >= 2 and tag[0] == tag[-1] == '"':
+                tag = tag[1:-1]
+            try:
+                versions.append(int(tag))
+            except ValueError:
+                raise IllegalArgumentError("If-Match must be the version of the instance")
+        return versions
+
+    def versioned(self, values: dict) -> dict:
+        """
+            Adds the increase of the version column to the values of an update, if the blueprint has one
+
+            :param values: Dictionary of values
+        """
+        if self.version_column is None:
+            return values
+        return dict(values, **{self.version_column: getattr(self.model.model, self.version_column) + 1})
 
-    def delete(self, instance_id: str=None):
+    def delete(self, instance_id: str=None, relation: str=None):
         """
             DELETE (delete instance) request
 
             :param instance_id: query argument of request
             :type instance_id: comma seperated string list
+            :param relation: (unsupported)
 
             :statuscode 403: DELETE MANY disallowed
             :statuscode 405: DELETE disallowed
         """
 
-        if not 'delete' in self.methods:
+        if not 'delete' in self.methods or relation is not None:
             raise MethodNotAllowedError(self.request.method)
 
         # Call Preprocessor
-        self._call_preprocessor(search_params=self.search_params)
+        self._call_preprocessor('delete', search_params=self.search_params)
 
         if instance_id is None:
-            if self.allow_patch_many:
+            if self.allow_patch_many and self.prefers_async:
+                result = self.respond_async('delete_many')
+                self._call_postprocessor('delete', result=result)
+                self.finish(result)
+                return
+            elif self.allow_patch_many:
                 result = self.delete_many()
             else:
                 raise MethodNotAllowedError(self.request.method, status_code=403)
         else:
             result = self.delete_single(self.parse_pk(instance_id))
 
-        self._call_postprocessor(result=result)
+        self.on_modified(None if instance_id is None else [self.parse_pk(instance_id)])
+
+        self._call_postprocessor('delete', result=result)
         self.finish(result)
 
     def delete_many(self) -> dict:
@@ -361,16 +815,24 @@ class BaseHandler(RequestHandler):
         limit = self.get_query_argument("limit", None)
 
         # Call Preprocessor
-        self._call_preprocessor(filters=filters)
+        self._call_preprocessor('delete_many', filters=filters)
 
         # Modify Instances
         if self.get_query_argument("single", False):
             instance = self.model.one(filters=filters)
+            if self.change_tracker is not None:
+                self.change_tracker.record(self.model.session, [sqinspect(instance).identity])
+            self.add_changes('delete', [sqinspect(instance).identity])
             self.model.session.delete(instance)
             self.model.session.commit()
             num = 1
+        elif limit is not None or self.chunk_size is not None or self.change_tracker is not None or \
+                self.feed_key is not None:
+            num, chunks = self.execute_chunked(self.delete_identities, filters, limit)
+            self.set_status(200, "Removed")
+            return {'num_removed': num, 'num_chunks': chunks}
         else:
-            num = self.model.delete(limit=limit, filters=filters)
+            num = self.model.delete(filters=filters)
 
         # Commit
         self.model.session.commit()
@@ -379,6 +841,150 @@ class BaseHandler(RequestHandler):
         self.set_status(200, "Removed")
         return {'num_removed': num}
 
+    @property
+    def prefers_async(self) -> bool:
+        """
+            Whether the client prefers an asynchronous response and the api manager runs jobs
+
+            :reqheader Prefer: respond-async
+        """
+        if getattr(self.manager, 'job_runner', None) is None:
+            return False
+
+        preferences = self.request.headers.get_list('Prefer')
+        return any(preference.split(';', 1)[0].strip().lower() == 'respond-async'
+                   for header in preferences for preference in header.split(','))
+
+    def respond_async(self, method: str) -> dict:
+        """
+            Executes a method of the handler as job of the job runner and returns the job
+
+            The job runs on a handler detached from this request with its own session, progress reported by
+             the method is visible at the job url.
+
+            :param method: Name of the method, e.g. patch_many
+            :statuscode 202: job accepted
+            :statuscode 503: too many unfinished jobs, retry after the seconds of the Retry-After header
+
+            :resheader Location: The url of the job
+        """
+
+        # Parse the arguments while the request is alive
+        if self.request.body:
+            self.get_body_arguments()
+
+        worker = self.detached()
+
+        def execute(job):
+            worker.job = job
+            try:
+                result = getattr(worker, method)()
+                worker.on_modified()
+                return worker.get_status(), result
+            except NoResultFound as ex:
+                worker.model.session.rollback()
+                raise HTTPError(404, "%s" % ex)
+            except SQLAlchemyError as ex:
+                worker.model.session.rollback()
+                raise HTTPError(400, "%s" % ex)
+            except:
+                worker.model.session.rollback()
+                raise
+            finally:
+                worker.model.session.close()
+
+        job = self.manager.job_runner.submit(execute)
+        if job is None:
+            worker.model.session.close()
+            self.set_header('Retry-After', self.retry_after)
+            raise HTTPError(503, "Too many unfinished jobs", reason="Service Unavailable")
+
+        self.set_status(202, "Accepted")
+        self.set_header('Location', self.manager.job_url % job.id)
+        self.set_header('Preference-Applied', 'respond-async')
+        return job.to_dict()
+
+    def detached(self) -> 'BaseHandler':
+        """
+            Returns a new handler of this request for work in another thread
+
+            The handler gets copies of the request line, headers, body and arguments (without the connection),
+             of the q dictionary (preprocessors may have changed it) and a session of its own.
+            Nothing it modifies is shared with this handler.
+        """
+        request = HTTPServerRequest(method=self.request.method,
+                                    uri=self.request.uri,
+                                    version=self.request.version,
+                                    headers=HTTPHeaders(self.request.headers),
+                                    body=self.request.body,
+                                    host=self.request.host,
+                                    connection=BatchConnection(getattr(self.request.connection, 'context', None)))
+        request.body_arguments = deepcopy(self.request.body_arguments)
+        request.arguments = deepcopy(self.request.arguments)
+
+        worker = type(self)(self.application, request, **self.initialize_kwargs)
+        worker._search_params = deepcopy(self.search_params)
+
+        session_factory = getattr(self.manager.session_maker, 'session_factory', self.manager.session_maker)
+        worker.model = SessionedModelWrapper(self.model.model, session_factory())
+        return worker
+
+    def execute_chunked(self, execute, filters: list, limit: int=None) -> tuple:
+        """
+            Executes a modification on the instances filtered by filters chunk by chunk
+
+            With a chunk_size every chunk is committed on its own, so no statement holds its locks for
+             the whole operation. Without (for a limit, change tracking or a change feed, which need the identities)
+             the chunks of 1000 instances share one transaction like a single statement.
+            The progress is logged after every chunk.
+
+            :param execute: Function modifying the instances of a list of identities, returns the number modified
+            :param filters: Filters and OrderBy Clauses
+            :param limit: Maximal number of instances
+            :return: Number of modified instances and number of chunks
+        """
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                raise IllegalArgumentError("Limit must be an integer")
+
+        num = chunks = 0
+        for identities in self.model.identity_chunks(filters, chunk_size=self.chunk_size or 1000, limit=limit):
+            num += execute(identities)
+            chunks += 1
+            if self.chunk_size is not None:
+                self.model.session.commit()
+                self.publish()
+            if self.job is not None:
+                self.job.progress = {'num_modified': num, 'num_chunks': chunks}
+            self.logger.info("%s %s: %u instances in %u chunks" % (self.request.method, self.model.__collectionname__,
+                                                                   num, chunks))
+        self.model.session.commit()
+        self.publish()
+        return num, chunks
+
+    def update_identities(self, values: dict, identities: list) -> int:
+        """
+            Sets the values of the instances with one of the identities
+
+            :param values: The new values
+            :param identities: Identities (tuple of primary keys) of the instances
+        """
+        self.add_changes('update', identities, values)
+        return self.model.update_identities(self.versioned(values), identities)
+
+    def delete_identities(self, identities: list) -> int:
+        """
+            Deletes the instances with one of the identities, adds their tombstones if changes are tracked
+
+            :param identities: Identities (tuple of primary keys) of the instances
+        """
+        if self.change_tracker is not None:
+            self.change_tracker.record(self.model.session, identities)
+        self.add_changes('delete', identities)
+        return self.model.delete_identities(identities)
+
     def delete_single(self, instance_id: list) -> dict:
         """
             Get one instance
@@ -390,12 +996,15 @@ class BaseHandler(RequestHandler):
         """
 
         # Call Preprocessor
-        self._call_preprocessor(instance_id=instance_id)
+        self._call_preprocessor('delete_single', instance_id=instance_id)
 
         # Get Instance
         instance = self.model.get(*instance_id)
 
         # Trigger deletion
+        if self.change_tracker is not None:
+            self.change_tracker.record(self.model.session, [sqinspect(instance).identity])
+        self.add_changes('delete', [sqinspect(instance).identity])
         self.model.session.delete(instance)
         self.model.session.commit()
 
@@ -403,59 +1012,146 @@ class BaseHandler(RequestHandler):
         self.set_status(204, "Instance removed")
         return {}
 
-    def put(self, instance_id: str=None):
+    def put(self, instance_id: str=None, relation: str=None):
         """
             PUT (update instance) request
 
+            Instances are upserted, see SessionedModelWrapper.upsert: models mapped to more than one table
+             (joined table inheritance) can't be PUT.
+
             :param instance_id: query argument of request
             :type instance_id: comma seperated string list
+            :param relation: (unsupported)
 
+            :statuscode 400: Model is mapped to more than one table
             :statuscode 403: PUT MANY disallowed
             :statuscode 404: Error
             :statuscode 405: PUT disallowed
+            :statuscode 412: Instance is not at the version of If-Match
         """
 
-        if not 'put' in self.methods:
+        if not 'put' in self.methods or relation is not None:
             raise MethodNotAllowedError(self.request.method)
 
         # Call Preprocessor
-        self._call_preprocessor(search_params=self.search_params)
+        self._call_preprocessor('put', search_params=self.search_params)
 
         if instance_id is None:
-            if self.allow_patch_many:
+            if self.allow_patch_many and self.prefers_async:
+                result = self.respond_async('put_many')
+                self._call_postprocessor('put', result=result)
+                self.finish(result)
+                return
+            elif self.allow_patch_many:
                 result = self.put_many()
             else:
                 raise MethodNotAllowedError(self.request.method, status_code=403)
+        elif self.get_if_match() is not None:
+            result = self.patch_version(self.parse_pk(instance_id), self.get_if_match())
         else:
             result = self.put_single(self.parse_pk(instance_id))
 
-        self._call_postprocessor(result=result)
+        self.on_modified(None if instance_id is None else [self.parse_pk(instance_id)])
+
+        self._call_postprocessor('put', result=result)
         self.finish(result)
 
-    put_many = patch_many
-    put_single = patch_single
+    def put_many(self) -> dict:
+        """
+            Upsert many instances if the body is a list, otherwise like patch_many
+
+            Every element of the list needs to contain the primary keys.
+            All rows are written with INSERT ... ON CONFLICT DO UPDATE where supported by the database,
+             otherwise with one bulk update and one bulk insert.
 
-    def post(self, instance_id: str=None):
+            :statuscode 201: instances successfull upserted
+        """
+
+        arguments = self.get_body_arguments()
+        if not isinstance(arguments, list):
+            return self.patch_many()
+
+        # Get values
+        rows = [self.get_argument_values(argument) for argument in arguments]
+        for values in rows:
+            for key in self.model.primary_key_names:
+                if values.get(key) is None:
+                    raise IllegalArgumentError("Missing primary key %s" % key)
+            values.update(zip(self.model.primary_key_names,
+                              self.model.coerce_primary_keys([values[key] for key in self.model.primary_key_names])))
+
+        # Call Preprocessor
+        self._call_preprocessor('put_many', data=rows)
+
+        # Upsert
+        num = self.model.upsert(rows, version_column=self.version_column)
+        for values in rows:
+            self.add_changes('update', [tuple(values[key] for key in self.model.primary_key_names)], values)
+
+        # Commit
+        self.model.session.commit()
+
+        # Result
+        self.set_status(201, "Upserted")
+        return {'num_modified': num}
+
+    def put_single(self, instance_id: list) -> dict:
+        """
+            Upsert one instance: Creates it if it does not exist, otherwise updates the given values
+
+            Written with INSERT ... ON CONFLICT DO UPDATE where supported by the database,
+             otherwise updated or inserted after selecting its primary key.
+
+            :param instance_id: query argument of request
+            :type instance_id: list of primary keys
+
+            :statuscode 201: instance successfull upserted
+        """
+
+        values = self.get_argument_values()
+        if len(instance_id) != len(self.model.primary_key_names):
+            raise IllegalArgumentError("Expected %u primary keys" % len(self.model.primary_key_names))
+        values.update(zip(self.model.primary_key_names, self.model.coerce_primary_keys(instance_id)))
+
+        # Call Preprocessor
+        self._call_preprocessor('put_single', instance_id=instance_id, data=values)
+
+        # Upsert
+        self.model.upsert([values], version_column=self.version_column)
+
+        # Commit
+        self.model.session.commit()
+
+        # Set Status
+        self.set_status(201, "Upserted")
+
+        # To Dict
+        self.model.session.expire_all()
+        result = self.to_dict(self.model.get(*instance_id))
+        self.add_change('update', result)
+        return result
+
+    def post(self, instance_id: str=None, relation: str=None):
         """
             POST (new input) request
 
+            Returns a Future if the write is coalesced, see execute_write
+
             :param instance_id: (ignored)
+            :param relation: (unsupported)
 
             :statuscode 204: instance successfull created
             :statuscode 404: Error
             :statuscode 405: POST disallowed
         """
 
-        if not 'post' in self.methods:
+        if not 'post' in self.methods or relation is not None:
             raise MethodNotAllowedError(self.request.method)
 
         # Call Preprocessor
-        self._call_preprocessor(search_params=self.search_params)
-
-        result = self.post_single()
+        self._call_preprocessor('post', search_params=self.search_params)
 
-        self._call_postprocessor(result=result)
-        self.finish(result)
+        return self.execute_write('post', [], 'post_single')
 
     def post_single(self):
         """
@@ -466,13 +1162,13 @@ class BaseHandler(RequestHandler):
             values = self.get_argument_values()
 
             # Call Preprocessor
-            self._call_preprocessor(data=values)
+            self._call_preprocessor('post_single', data=values)
 
             # Create Instance
             instance = self.model(**values)
 
             # Flush
-            self.model.session.commit()
+            self.commit()
 
             # Refresh
             self.model.session.refresh(instance)
@@ -481,14 +1177,72 @@ class BaseHandler(RequestHandler):
             self.set_status(201, "Created")
 
             # To Dict
-            return self.to_dict(instance)
+            result = self.to_dict(instance)
+            self.add_change('create', result)
+            return result
         except SQLAlchemyError:
             self.send_error(status_code=400, exc_info=sys.exc_info())
-            self.model.session.rollback()
+            self.rollback()
         finally:
             # Commit
+            self.commit()
+
+    def execute_write(self, request_method: str, instance_ids: list, method: str, *args):
+        """
+            Executes a single write and finishes the request with its result
+
+            Without a write coalescer the write is executed at once and None is returned, so subclasses may still
+             call e.g. super().post() synchronously. With a write coalescer the write is executed together with
+             concurrent writes in one transaction (group commit) and a Future is returned.
+
+            :param request_method: Name of the request method, e.g. post, for the postprocessors
+            :param instance_ids: The primary keys of the written instances, see on_modified
+            :param method: Name of the method executing the write, e.g. post_single
+            :param args: The positional arguments of the method
+            :return: None or a Future resolving once the request is finished
+        """
+        coalescer = getattr(self.manager, 'write_coalescer', None)
+        if coalescer is not None:
+            return self.execute_coalesced(coalescer, request_method, instance_ids, method, *args)
+
+        self.finish_write(request_method, instance_ids, getattr(self, method)(*args))
+
+    @gen.coroutine
+    def execute_coalesced(self, coalescer, request_method: str, instance_ids: list, method: str, *args):
+        """
+            Executes a single write with group commit, see execute_write
+        """
+        result = yield coalescer.submit(self, method, *args)
+        self.finish_write(request_method, instance_ids, result)
+
+    def finish_write(self, request_method: str, instance_ids: list, result: dict):
+        """
+            Invalidates the caches, calls the postprocessors and finishes the request with the result of a write
+        """
+        self.on_modified(instance_ids)
+
+        self._call_postprocessor(request_method, result=result)
+        self.finish(result)
+
+    def commit(self):
+        """
+            Commits the session, during group commit only flushes into the savepoint of this request
+        """
+        if self.savepoint is not None:
+            self.model.session.flush()
+        else:
             self.model.session.commit()
 
+    def rollback(self):
+        """
+            Rolls back the session, during group commit only the savepoint of this request (and starts a new one)
+        """
+        if self.savepoint is not None:
+            self.savepoint.rollback()
+            self.savepoint = self.model.session.begin_nested()
+        else:
+            self.model.session.rollback()
+
     @memoized_instancemethod
     def get_content_encoding(self) -> str:
         """
@@ -595,18 +1349,30 @@ class BaseHandler(RequestHandler):
             else:
                 raise
 
-    def get_argument_values(self):
+    def get_argument_values(self, arguments: dict=None):
         """
             Get all values provided via arguments
 
+            :param arguments: Use this dictionary instead of the body arguments, e.g. for an element of a list body
+
             :query q: (ignored)
         """
 
         # Include Columns
-        if self.include is not None:
-            values = {k: self.get_body_argument(k) for k in self.include}
+        if arguments is None:
+            if self.include is not None:
+                values = {k: self.get_body_argument(k) for k in self.include}
+            else:
+                values = {k: v for k, v in self.get_body_arguments().items()}
+        elif not isinstance(arguments, dict):
+            raise IllegalArgumentError("Expected an object of values")
+        elif self.include is not None:
+            for k in self.include:
+                if k not in arguments:
+                    raise HTTPError(400, "Missing argument %s" % k)
+            values = {k: arguments[k] for k in self.include}
         else:
-            values = {k: v for k, v in self.get_body_arguments().items()}
+            values = dict(arguments)
 
         # Exclude "q"
         if "q" in values:
@@ -630,6 +1396,11 @@ class BaseHandler(RequestHandler):
                 self.logger.debug("Skipping hybrid: %s" % hybrid.key)
                 del values[hybrid.key]
 
+        # Silently Ignore the version, it is increased by every write
+        if self.version_column is not None and self.version_column in values:
+            self.logger.debug("Skipping version column: %s" % self.version_column)
+            del values[self.version_column]
+
         # Handle Relations extra
         values_relations = {}
         for relation_key, relation in self.model.relations.items():
@@ -644,12 +1415,14 @@ class BaseHandler(RequestHandler):
 
         return values
 
-    def get(self, instance_id: str=None):
+    @gen.coroutine
+    def get(self, instance_id: str=None, relation: str=None):
         """
             GET request
 
             :param instance_id: query argument of request
             :type instance_id: comma seperated string list
+            :param relation: name of a relation of the instance, returns the related instances paginated
 
             :statuscode 405: GET disallowed
         """
@@ -658,15 +1431,230 @@ class BaseHandler(RequestHandler):
             raise MethodNotAllowedError(self.request.method)
 
         # Call Preprocessor
-        self._call_preprocessor(search_params=self.search_params)
+        self._call_preprocessor('get', search_params=self.search_params)
+
+        # Check the cost before any sql is run
+        self.check_filters(self.get_query_argument("filters", []), self.get_query_argument("order_by", []),
+                           prefix=relation)
+
+        if self.single_flight and self.manager.executor is not None and self.result_shareable:
+            chunk, headers = yield self.get_shared(instance_id, relation)
+            for name, value in headers:
+                self.set_header(name, value)
+            self.finish(chunk)
+            return
+
+        with self.cancellable():
+            result = self.get_result(instance_id, relation)
+        self.set_etag(result, instance_id, relation)
+
+        self._call_postprocessor('get', result=result)
+        self.finish(result)
 
+    def get_result(self, instance_id: str=None, relation: str=None) -> dict:
+        """
+            Dispatches a GET request to get_many, get_relation or get_single
+
+            :param instance_id: query argument of request
+            :param relation: name of a relation of the instance
+        """
         if instance_id is None:
-            result = self.get_many()
+            return self.get_many()
+        elif relation is not None:
+            return self.get_relation(self.parse_pk(instance_id), relation)
         else:
-            result = self.get_single(self.parse_pk(instance_id))
+            return self.get_single(self.parse_pk(instance_id))
 
-        self._call_postprocessor(result=result)
-        self.finish(result)
+    def set_etag(self, result: dict, instance_id: str=None, relation: str=None):
+        """
+            Sets the Etag header to the version of a single instance
+
+            :param result: The GET result
+            :param instance_id: query argument of request
+            :param relation: name of a relation of the instance
+        """
+        if self.version_column is not None and instance_id is not None and relation is None and \
+                result.get(self.version_column) is not None:
+            self.set_header("Etag", '"%s"' % result[self.version_column])
+
+    @property
+    def result_shareable(self) -> bool:
+        """
+            Whether concurrent requests may share the result: No processor may depend on or modify the single result
+        """
+        return not any(name in self.preprocessor for name in ('get_single', 'get_many', 'get_relation')) and \
+            not any(name.startswith('get') for name in self.postprocessor)
+
+    def get_shared(self, instance_id: str=None, relation: str=None) -> Future:
+        """
+            Computes the encoded GET result in the thread pool of the api manager
+
+            Concurrent requests with the same key (host, path, q, the other query arguments and FLIGHT_HEADERS)
+             await the computation that is already in flight and share its encoded bytes and response headers.
+            The computation runs on a detached handler, it is finished even if its client leaves.
+
+            :param instance_id: query argument of request
+            :param relation: name of a relation of the instance
+            :return: Future resolving to the encoded result and the list of response headers
+        """
+        key = (self.request.host, self.request.path, dumps(self.search_params, sort_keys=True),
+               tuple(sorted((name, tuple(values)) for name, values in self.request.query_arguments.items()
+                            if name != 'q')),
+               tuple(tuple(self.request.headers.get_list(name)) for name in self.FLIGHT_HEADERS))
+
+        flights = self.manager.flights
+        if key in flights:
+            self.manager.count_coalesced()
+            return flights[key]
+
+        worker = self.detached()
+
+        def compute():
+            try:
+                with worker.cancellable():
+                    result = worker.get_result(instance_id, relation)
+                worker.set_etag(result, instance_id, relation)
+                worker.set_header("Content-Type", "application/json; charset=UTF-8")
+                return utf8(worker.encode(result)), [(name, value) for name, value in worker._headers.get_all()
+                                                     if name not in ('Server', 'Date')]
+            finally:
+                worker.model.session.close()
+
+        future = flights[key] = Future()
+
+        def done(computation):
+            del flights[key]
+            if computation.exception() is not None:
+                future.set_exception(computation.exception())
+            else:
+                future.set_result(computation.result())
+
+        IOLoop.current().add_future(self.manager.executor.submit(compute), done)
+        return future
+
+    def on_connection_close(self):
+        """
+            The client closed the connection, the remaining work of the request is cancelled
+
+            A statement of a GET request running in cancellable is interrupted (sqlite3 interrupt,
+            psycopg2 cancel), the remaining steps of a GET request are skipped and
+            the cancelled_requests counter of the api manager is increased.
+            Writes are never interrupted, they are finished and committed.
+        """
+        if self.cancelled:
+            return
+
+        self.cancelled = True
+        self.manager.count_cancelled()
+        self.logger.info("Client closed the connection of %s %s" % (self.request.method, self.request.uri))
+
+        # Only a connection already checked out by a running statement
+        connection = self.statement_connection
+        if connection is None or self.request.method != 'GET':
+            return
+        for method in ('interrupt', 'cancel'):
+            if hasattr(connection, method):
+                getattr(connection, method)()
+                break
+
+    def client_disconnected(self) -> bool:
+        """
+            Whether the client closed the connection, without waiting for the IOLoop to notice it
+        """
+        stream = getattr(self.request.connection, 'stream', None)
+        if stream is None:
+            return False
+        if stream.closed():
+            return True
+
+        try:
+            return stream.socket.recv(1, MSG_PEEK | MSG_DONTWAIT) == b''
+        except BlockingIOError:
+            return False
+        except ValueError:
+            # SSL sockets don't support peeking
+            return False
+        except OSError:
+            return True
+
+    def check_cancelled(self):
+        """
+            Raises RequestCancelled if the client closed the connection
+
+            Called between the steps of a request (count, fetch, serialization)
+
+            :raise: RequestCancelled
+        """
+        if not self.cancelled and self.client_disconnected():
+            self.on_connection_close()
+        if self.cancelled:
+            raise RequestCancelled("Client closed the connection")
+
+    @contextmanager
+    def cancellable(self):
+        """
+            Context in which statements are interrupted when the client closes the connection
+            or the statement_timeout of the blueprint is exceeded
+
+            With sqlite the connection is checked every CANCEL_CHECK_INSTRUCTIONS virtual machine instructions
+            by a progress handler, the running statement is aborted as soon as the client is gone or
+            the timeout is over. With postgresql and mysql the timeout is set on the connection.
+
+            :raise: RequestCancelled, StatementTimeout if the statement timeout is exceeded
+        """
+        self.check_cancelled()
+
+        session = self.model.session
+        mapper = sqinspect(self.model.model)
+        dialect = session.get_bind(mapper=mapper).dialect.name
+
+        connection = None
+        try:
+            connection = session.connection(mapper=mapper).connection.connection
+        except SQLAlchemyError:
+            pass
+        self.statement_connection = connection
+        if not hasattr(connection, 'set_progress_handler'):
+            connection = None
+
+        # Statement Timeout
+        deadline = None
+        if self.statement_timeout is not None:
+            deadline = monotonic() + self.statement_timeout
+            if dialect == 'postgresql':
+                session.execute(text("SET LOCAL statement_timeout = %u" % (self.statement_timeout * 1000)),
+                                mapper=mapper)
+            elif dialect == 'mysql':
+                session.execute(text("SET SESSION max_execution_time = %u" % (self.statement_timeout * 1000)),
+                                mapper=mapper)
+
+        def progress():
+            if not self.cancelled and self.client_disconnected():
+                self.on_connection_close()
+            return self.cancelled or (deadline is not None and monotonic() > deadline)
+
+        if connection is not None:
+            connection.set_progress_handler(progress, self.CANCEL_CHECK_INSTRUCTIONS)
+        try:
+            yield
+        except DBAPIError as ex:
+            if self.cancelled:
+                raise RequestCancelled("Client closed the connection")
+            # sqlite interrupted, postgresql query_canceled, mysql ER_QUERY_TIMEOUT
+            if deadline is not None and (monotonic() > deadline or getattr(ex.orig, 'pgcode', None) == '57014' or
+                                         getattr(ex.orig, 'args', (None,))[:1] == (3024,)):
+                raise StatementTimeout("Query exceeded the statement timeout of %gs" % self.statement_timeout)
+            raise
+        finally:
+            self.statement_connection = None
+            if connection is not None:
+                connection.set_progress_handler(None, self.CANCEL_CHECK_INSTRUCTIONS)
+            if deadline is not None and dialect in ('postgresql', 'mysql'):
+                try:
+                    session.execute(text("SET %s = DEFAULT" % ("LOCAL statement_timeout" if dialect == 'postgresql'
+                                                               else "SESSION max_execution_time")), mapper=mapper)
+                except SQLAlchemyError:
+                    pass
 
     def get_single(self, instance_id: list) -> dict:
         """
@@ -677,13 +1665,56 @@ class BaseHandler(RequestHandler):
         """
 
         # Call Preprocessor
-        self._call_preprocessor(instance_id=instance_id)
+        self._call_preprocessor('get_single', instance_id=instance_id)
+
+        # Reference Table
+        result = self.get_single_from_memory(instance_id)
+        if result is not None:
+            return result
+
+        # Cached Instance
+        cache = self.instance_cache
+        if cache is not None:
+            identity = tuple(self.model.coerce_primary_keys(instance_id))
+            variant = (self.cache_key, dumps(self.get_query_argument("fields", None)))
+            cached = cache.get(self.model.model, identity, variant)
+            if cached is not None:
+                return loads(cached)
+            generation = cache.generation(self.model.model, identity)
 
         # Get Instance
         instance = self.model.get(*instance_id)
 
         # To Dict
-        return self.to_dict(instance)
+        fields = self.get_fields()
+        if fields is not None:
+            result = self.to_dict(instance, include=fields, exclude=None)
+        else:
+            result = self.to_dict(instance)
+        result = self.to_counted_dict(self.model, [sqinspect(instance).identity], result, self.count_relations)
+
+        if cache is not None:
+            cache.set(self.model.model, identity, variant, json_encode(result), generation)
+        return result
+
+    @property
+    def instance_cache(self):
+        """
+            The instance cache of the api manager if get_single may use it, otherwise None
+
+            Only instances converted to their own columns are cached, as writes invalidate only the instances
+             of the written model: relations, hybrids and relation counts might change without notice.
+        """
+        cache = getattr(self.manager, 'instance_cache', None)
+        if cache is None or self.cache_key is None or self.count_relations:
+            return None
+
+        fields = self.get_fields()
+        if fields is not None:
+            columns = self.get_plain_columns(self.model, fields, None)
+        else:
+            columns = self.get_plain_columns(self.model, self.include, self.exclude)
+        return cache if columns is not None else None
 
     def get_many(self) -> dict:
         """
@@ -699,9 +1730,283 @@ class BaseHandler(RequestHandler):
             :query page: Return nth page
             :query limit: limit the count of modified instances
             :query single: If true sqlalchemy will raise an error if zero or more than one instances would be deleted
+            :query fields: Only return (and load) these columns
+            :query snapshot: true to start a snapshot, the token of the result for further pages
         """
 
         # All search params
+        search_params = self.get_search_params()
+
+        # Pinned filters and orderings of a snapshot
+        snapshot = self.get_snapshot()
+
+        # Reference Table
+        result = self.get_many_from_memory(search_params)
+        if result is not None:
+            return result
+
+        # Filters
+        filters = self.get_filters()
+
+        # Call Preprocessor
+        self._call_preprocessor('get_many', filters=filters, search_params=search_params)
+
+        # Sparse Fieldsets
+        fields = self.get_fields()
+        if fields is not None:
+            include, exclude = fields, None
+        else:
+            include, exclude = self.include, self.exclude
+
+        # Changes since a token
+        if 'since' in self.search_params:
+            return self.get_changes(filters, search_params, include, exclude)
+
+        # Page of a snapshot
+        if snapshot is not None:
+            mark, token = snapshot
+            result = self.paginate(self.model, filters + self.snapshot.filters(mark), search_params,
+                                   include=include, exclude=exclude, count_relations=self.count_relations,
+                                   load_only=self.get_load_only())
+            result['snapshot'] = token
+            return result
+
+        return self.paginate(self.model, filters, search_params,
+                             include=include, exclude=exclude, count_relations=self.count_relations,
+                             load_only=self.get_load_only())
+
+    def get_snapshot(self) -> tuple:
+        """
+            Returns the mark and token of the snapshot of the request, applies its filters and orderings
+             to the query arguments
+
+            The first page (snapshot true) reads the current mark, later pages take the mark, filters and
+             orderings of the token: the request may repeat them but not change them.
+
+            :query snapshot: true to start a snapshot, the token of a previous page for further pages
+            :return: (mark, token) or None if no snapshot is requested
+            :raise IllegalArgumentError: If snapshots are not supported or the token is invalid
+        """
+        token = self.get_query_argument("snapshot", None)
+        if token is None or token is False:
+            return None
+
+        if self.snapshot is None:
+            raise IllegalArgumentError("Snapshots of %s are not supported" % self.model.__collectionname__)
+        if 'since' in self.search_params:
+            raise IllegalArgumentError("Snapshots can't be combined with since")
+
+        if token is True:
+            mark = self.snapshot.mark(self.model.session)
+            return mark, self.snapshot.encode(mark, self.get_query_argument("filters", []),
+                                              self.get_query_argument("order_by", []))
+
+        mark, filters, order_by = self.snapshot.decode(token)
+        for name, pinned in (("filters", filters), ("order_by", order_by)):
+            if self.get_query_argument(name, pinned) != pinned:
+                raise IllegalArgumentError("The %s of a snapshot can't be changed" % name)
+            self.search_params[name] = pinned
+        return mark, token
+
+    def get_changes(self, filters: list, search_params: dict, include, exclude) -> dict:
+        """
+            Get the instances modified and the primary keys of the instances deleted after the since token
+
+            The instances are ordered by the change column of the blueprint, the result contains the
+             primary keys of the deleted instances (deleted) and the token of the last returned change (since).
+            Changes newer than the window of the change tracker are held back, see ChangeTracker.
+            If num_results is larger than the number of objects, more changes follow: Pass the new token to get them.
+
+            :param filters: Filters of the request, applied to the modified instances
+            :param search_params: The pagination parameters, see get_search_params
+            :param include: Columns and Relations that should be included for an instance
+            :param exclude: Columns and Relations that should not be included for an instance
+
+            :query since: The token of a previous result, null to start the sync
+        """
+        tracker = self.change_tracker
+        if tracker is None:
+            raise IllegalArgumentError("Changes of %s are not tracked" % self.model.__collectionname__)
+        if self.get_query_argument("order_by", []):
+            raise IllegalArgumentError("Ordering can't be combined with since")
+
+        since = tracker.decode(self.get_query_argument("since"))
+        if since is None:
+            position, tombstone = None, tracker.last_tombstone(self.model.session)
+            deleted = []
+        else:
+            position, tombstone = since
+            deleted, tombstone = tracker.deleted(self.model.session, tombstone)
+
+        # Modified Instances
+        filters = filters + tracker.filters(position)
+        search_params = dict(search_params, offset=0, page=1, single=False)
+        result = self.paginate(self.model, filters, search_params,
+                               include=include, exclude=exclude, count_relations=self.count_relations,
+                               load_only=self.get_load_only())
+
+        # Position of the last returned instance
+        objects = result['objects']
+        if isinstance(objects, RawJSON):
+            objects = loads(objects)
+        if objects:
+            try:
+                position = [objects[-1][key] for key in tracker.keys]
+            except KeyError:
+                raise IllegalArgumentError("Changes can only be requested with the fields %s" %
+                                           ", ".join(tracker.keys))
+
+        result['deleted'] = deleted
+        result['since'] = tracker.encode(position, tombstone)
+        return result
+
+    @property
+    def memory_table(self):
+        """
+            The memory table of the model if this blueprint answers from memory, otherwise None
+        """
+        if not self.in_memory or self.count_relations:
+            return None
+        return self.manager.memory_tables.get(self.model.model)
+
+    def get_memory_columns(self):
+        """
+            Returns the names of the requested columns if they can be answered from memory, otherwise None
+        """
+        fields = self.get_fields()
+        if fields is not None:
+            return self.get_plain_columns(self.model, fields, None)
+        return self.get_plain_columns(self.model, self.include, self.exclude)
+
+    def get_single_from_memory(self, instance_id: list) -> dict:
+        """
+            Get one instance from the memory table
+
+            :param instance_id: list of primary keys
+            :return: The instance or None if it can't be answered from memory
+        """
+        table = self.memory_table
+        columns = self.get_memory_columns() if table is not None else None
+        if columns is None:
+            return None
+
+        row = table.get(self.model.coerce_primary_keys(instance_id))
+        if row is None:
+            raise NoResultFound("No element recieved for %s(%s)" % (self.model.__collectionname__, instance_id))
+        return self.to_plain_dict(columns, table.values(row, columns))
+
+    def get_many_from_memory(self, search_params: dict) -> dict:
+        """
+            Get one page of instances filtered, ordered and counted in the memory table
+
+            Not used if a get_many preprocessor may modify the filters or for changes since a token.
+
+            :param search_params: The pagination parameters, see get_search_params
+            :return: The page or None if it can't be answered from memory
+        """
+        table = self.memory_table
+        if table is None or 'get_many' in self.preprocessor or 'since' in self.search_params or \
+                self.search_params.get('snapshot') not in (None, False):
+            return None
+        columns = self.get_memory_columns()
+        if columns is None:
+            return None
+
+        argument_filters = self.get_query_argument("filters", [])
+        argument_orders = self.get_query_argument("order_by", [])
+        self.check_filters(argument_filters, argument_orders)
+        rows = table.select(argument_filters, argument_orders)
+        if rows is None:
+            return None
+
+        num_results = len(rows)
+        rows = rows[search_params['offset']:]
+        if search_params['single']:
+            if not rows:
+                raise NoResultFound("No row was found for one()")
+            if len(rows) > 1:
+                raise MultipleResultsFound("Multiple rows were found for one()")
+            return self.to_plain_dict(columns, table.values(rows[0], columns))
+
+        if search_params['results_per_page']:
+            total_pages = ceil(num_results / search_params['results_per_page'])
+        else:
+            total_pages = 1
+        if search_params['limit'] is not None:
+            rows = rows[:int(search_params['limit'])]
+
+        return {'num_results': num_results,
+                "num_results_exact": True,
+                "total_pages": total_pages,
+                "page": search_params['page'],
+                "objects": [self.to_plain_dict(columns, table.values(row, columns)) for row in rows]}
+
+    def get_relation(self, instance_id: list, relation: str) -> dict:
+        """
+            Get the related instances of one instance
+
+            Filtering, ordering and pagination are done in the database like for get_many
+
+            :param instance_id: query argument of request
+            :type instance_id: list of primary keys
+            :param relation: Name of the relation
+
+            :statuscode 400: if the relation is unknown or not included
+
+            :query results_per_page: Overwrite the returned results_per_page
+            :query offset: Skip offset instances
+            :query page: Return nth page
+            :query limit: limit the count of returned instances
+        """
+
+        # Check Relation
+        if relation not in self.model.relations:
+            raise IllegalArgumentError("Relation '%s' not defined for %s" % (relation, self.model.__name__))
+        deep = to_deep(self.include, self.exclude, relation)
+        if (self.include is not None and relation not in self.include) or deep['exclude'] is True:
+            raise IllegalArgumentError("Relation '%s' not included for %s" % (relation, self.model.__name__))
+
+        # All search params
+        search_params = self.get_search_params()
+
+        # Check Filters
+        argument_filters = self.get_query_argument("filters", [])
+        argument_orders = self.get_query_argument("order_by", [])
+        self.check_filters(argument_filters, argument_orders, prefix=relation)
+
+        # Get Instance
+        instance = self.model.get(*instance_id)
+        model = RelatedModelWrapper(instance, relation, self.model.session)
+
+        # Filters
+        filters = to_filter(model.model, argument_filters, argument_orders)
+
+        # Call Preprocessor
+        self._call_preprocessor('get_relation', instance_id=instance_id, relation=relation,
+                                filters=filters, search_params=search_params)
+
+        # Serialize like the relation would be nested in the instance
+        if self.include is not None:
+            include, exclude = deep['include'], None
+        elif deep['exclude'] is not None:
+            include, exclude = None, deep['exclude']
+        else:
+            include, exclude = False, None
+
+        return self.paginate(model, filters, search_params, include=include, exclude=exclude)
+
+    def get_search_params(self) -> dict:
+        """
+            Returns the pagination parameters of the request
+
+            :statuscode 400: if results_per_page > max_results_per_page or offset < 0
+
+            :query results_per_page: Overwrite the returned results_per_page
+            :query offset: Skip offset instances
+            :query page: Return nth page
+            :query limit: limit the count of returned instances
+            :query single: If true sqlalchemy will raise an error if zero or more than one instances would be returned
+        """
         search_params = {'single': self.get_query_argument("single", False),
                          'results_per_page': int(self.get_argument("results_per_page", self.results_per_page)),
                          'offset': int(self.get_query_argument("offset", 0))}
@@ -711,57 +2016,232 @@ class BaseHandler(RequestHandler):
             raise IllegalArgumentError("request.results_per_page > application.max_results_per_page")
 
         # Offset & Page
-        page = int(self.get_argument("page", '1')) - 1
-        search_params['offset'] += page * search_params['results_per_page']
+        search_params['page'] = int(self.get_argument("page", '1'))
+        search_params['offset'] += (search_params['page'] - 1) * search_params['results_per_page']
         if search_params['offset'] < 0:
             raise IllegalArgumentError("request.offset < 0")
 
         # Limit
         search_params['limit'] = self.get_query_argument("limit", search_params['results_per_page'] or None)
 
-        # Filters
-        filters = self.get_filters()
+        return search_params
 
-        # Call Preprocessor
-        self._call_preprocessor(filters=filters, search_params=search_params)
+    def paginate(self, model: SessionedModelWrapper, filters: list, search_params: dict, include, exclude,
+                 count_relations: list=(), load_only: list=None) -> dict:
+        """
+            Returns one page of instances of model
+
+            If only plain columns are converted, the values are queried as tuples without creating instances
+
+            :param model: The wrapper the instances are queried from
+            :param filters: Filters and OrderBy Clauses
+            :param search_params: The pagination parameters, see get_search_params
+            :param include: Columns and Relations that should be included for an instance
+            :param exclude: Columns and Relations that should not be included for an instance
+            :param count_relations: Relations for which a <relation>__count field is added
+            :param load_only: Names of the only columns that are loaded
+        """
 
         # Num Results
-        num_results = self.model.count(filters=filters)
+        num_results, exact = self.count(model, filters)
+        self.check_cancelled()
         if search_params['results_per_page']:
             total_pages = ceil(num_results / search_params['results_per_page'])
         else:
             total_pages = 1
 
+        # Plain Columns
+        columns = self.get_plain_columns(model, include, exclude)
+        if columns is not None:
+            selected = columns + [key for key in model.primary_key_names if key not in columns]
+            identity = [selected.index(key) for key in model.primary_key_names]
+
         # Get Instances
-        if search_params['single']:
-            instance = self.model.one(offset=search_params['offset'],
-                                      filters=filters)
-            return self.to_dict(instance)
+        if search_params['single'] and columns is not None:
+            row = model.row(selected, offset=search_params['offset'], filters=filters)
+            return self.to_counted_dict(model, [tuple(row[i] for i in identity)],
+                                        self.to_plain_dict(columns, row), count_relations)
+        elif search_params['single']:
+            instance = model.one(offset=search_params['offset'],
+                                 load_only=load_only,
+                                 filters=filters)
+            return self.to_counted_dict(model, [sqinspect(instance).identity],
+                                        self.to_dict(instance, include=include, exclude=exclude), count_relations)
+        elif columns is not None and self.database_json and not count_relations and \
+                not any(name.startswith('get') for name in self.postprocessor) and \
+                model.supports_json(columns, filters):
+            objects = RawJSON(model.json_array(columns,
+                                               offset=search_params['offset'],
+                                               limit=search_params['limit'],
+                                               filters=filters))
+        elif columns is not None:
+            rows = model.rows(selected,
+                              offset=search_params['offset'],
+                              limit=search_params['limit'],
+                              filters=filters)
+            self.check_cancelled()
+            objects = self.to_counted_dict(model, [tuple(row[i] for i in identity) for row in rows],
+                                           [self.to_plain_dict(columns, row) for row in rows], count_relations)
         else:
-            instances = self.model.all(offset=search_params['offset'],
-                                       limit=search_params['limit'],
-                                       filters=filters)
-            return {'num_results': num_results,
-                    "total_pages": total_pages,
-                    "page": page + 1,
-                    "objects": self.to_dict(instances)}
+            instances = model.all(offset=search_params['offset'],
+                                  limit=search_params['limit'],
+                                  load_only=load_only,
+                                  filters=filters)
+            self.check_cancelled()
+            objects = self.to_counted_dict(model, [sqinspect(instance).identity for instance in instances],
+                                           self.to_dict(instances, include=include, exclude=exclude), count_relations)
+
+        return {'num_results': num_results,
+                "num_results_exact": exact,
+                "total_pages": total_pages,
+                "page": search_params['page'],
+                "objects": objects}
+
+    def count(self, model: SessionedModelWrapper, filters: list) -> tuple:
+        """
+            Returns the number of instances of model matching filters according to the count_strategy
+
+            :param model: The wrapper the instances are queried from
+            :param filters: Filters and OrderBy Clauses
+            :return: (count, whether the count is exact)
+        """
+        if self.count_strategy == 'estimated' and not isinstance(model, RelatedModelWrapper) and \
+                all(_is_ordering_expression(expression) for expression in filters):
+            estimate = model.estimate_count()
+            if estimate is not None:
+                return estimate, False
+
+        if self.count_strategy == 'cached':
+            cache = self.manager.count_cache
+            # Keyed by the compiled query: Filters added by the server (since, snapshots, preprocessors) count too
+            key = model.count_key(filters=filters)
+            count = cache.get(model.model, key)
+            if count is not None:
+                return count, False
+            generation = cache.generation(model.model)
+            count = model.count(filters=filters)
+            cache.set(model.model, key, count, self.count_cache_ttl, generation)
+            return count, True
+
+        return model.count(filters=filters), True
+
+    def on_modified(self, instance_ids: list=None):
+        """
+            Called after a request that may have created, modified or removed instances of the model
+
+            Invalidates the cached counts, the cached instances and the memory table of the model
+
+            :param instance_ids: The primary keys of the modified instances, None if any instance may be modified
+        """
+        self.manager.count_cache.invalidate(self.model.model)
+
+        table = self.manager.memory_tables.get(self.model.model)
+        if table is not None:
+            table.invalidate()
+
+        cache = getattr(self.manager, 'instance_cache', None)
+        if cache is not None:
+            cache.invalidate(self.model.model, None if instance_ids is None else
+                             [tuple(self.model.coerce_primary_keys(instance_id)) for instance_id in instance_ids])
 
-    def _call_preprocessor(self, *args, **kwargs):
+        self.publish()
+
+    def add_change(self, event_type: str, obj: dict):
         """
-            Calls a preprocessor with args and kwargs
+            Adds an event for the change feed, published by publish after the commit
+
+            :param event_type: create, update or delete
+            :param obj: The instance as dictionary
         """
-        func_name = inspect.stack()[1][3]
+        if self.feed_key is not None:
+            self.changes.append((event_type, obj))
 
+    def add_changes(self, event_type: str, identities: list, values: dict=None):
+        """
+            Adds an event for every identity, its object are the primary keys and values
+
+            :param event_type: create, update or delete
+            :param identities: Identities (tuple of primary keys) of the instances
+            :param values: The written values
+        """
+        if self.feed_key is None:
+            return
+        for identity in identities:
+            obj = {key: to_dict(value) for key, value in (values or {}).items()}
+            obj.update((key, to_dict(value)) for key, value in zip(self.model.primary_key_names, identity))
+            self.changes.append((event_type, obj))
+
+    def publish(self):
+        """
+            Publishes the added events to the change feed, call after the commit of the changes
+        """
+        if self.changes:
+            self.manager.publish(self.feed_key, self.changes)
+            self.changes = []
+
+    def get_plain_columns(self, model: ModelWrapper, include, exclude):
+        """
+            Returns the names of the columns if include/exclude would only convert plain columns of model
+
+            :param model: The wrapper of the model
+            :param include: Columns and Relations that should be included for an instance
+            :param exclude: Columns and Relations that should not be included for an instance
+            :return: List of column names or None if instances are needed for the conversion
+        """
+        # True (a whole relation in include_columns) converts like None
+        if include is None or include is True or include is False:
+            if model.hybrids or (include is not False and (model.relations or model.proxies)):
+                return None
+            return [column for column in model.columns if exclude is None or column not in exclude]
+
+        if all(include[key] is True and key in model.columns for key in include):
+            return list(include)
+
+        return None
+
+    def to_counted_dict(self, model: SessionedModelWrapper, identities: list, result, count_relations: list):
+        """
+            Adds the <relation>__count fields to the converted instances
+
+            Every relation is counted with one grouped query for all instances
+
+            :param model: The wrapper the instances are queried from
+            :param identities: The identities (tuple of primary keys) of the instances
+            :param result: The converted instances, a list or the dictionary of a single instance
+            :param count_relations: Relations for which a <relation>__count field is added
+        """
+        objects = result if isinstance(result, list) else [result]
+        for relation in count_relations:
+            counts = model.count_relation(identities, relation)
+            for identity, obj in zip(identities, objects):
+                obj[relation + '__count'] = counts.get(tuple(identity), 0)
+        return result
+
+    def to_plain_dict(self, columns: list, row: tuple) -> dict:
+        """
+            Converts the values of a tuple row queried for columns
+
+            :param columns: Names of the columns
+            :param row: The values
+        """
+        return {column: to_dict(value) for column, value in zip(columns, row)}
+
+    def _call_preprocessor(self, func_name: str, *args, **kwargs):
+        """
+            Calls the preprocessors of a method with args and kwargs
+
+            :param func_name: Name of the method, e.g. get_many
+        """
         if func_name in self.preprocessor:
             for func in self.preprocessor[func_name]:
                 func(*args, model=self.model, handler=self, **kwargs)
 
-    def _call_postprocessor(self, *args, **kwargs):
-        """
-            Calls a postprocessor with args and kwargs
+    def _call_postprocessor(self, func_name: str, *args, **kwargs):
         """
-        func_name = inspect.stack()[1][3]
+            Calls the postprocessors of a method with args and kwargs
 
+            :param func_name: Name of the method, e.g. get_many
+        """
         if func_name in self.postprocessor:
             for func in self.postprocessor[func_name]:
                 func(*args, model=self.model, handler=self, **kwargs)
@@ -773,15 +2253,17 @@ class BaseHandler(RequestHandler):
         """
         return logging.getLogger('tornado.restless')
 
-    def to_dict(self, instance):
+    def to_dict(self, instance, include=RequestHandler._ARG_DEFAULT, exclude=RequestHandler._ARG_DEFAULT):
         """
             Wrapper to convert.to_dict with arguments from blueprint init
 
             :param instance: Instance to be translated
+            :param include: Overwrite the included columns of the blueprint
+            :param exclude: Overwrite the excluded columns of the blueprint
         """
         return to_dict(instance,
-                       include=self.include,
-                       exclude=self.exclude,
+                       include=self.include if include is RequestHandler._ARG_DEFAULT else include,
+                       exclude=self.exclude if exclude is RequestHandler._ARG_DEFAULT else exclude,
                        options=self.to_dict_options)
 
     def parse_pk(self, instance_id):
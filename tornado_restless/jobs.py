@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless JobRunner
+
+    Runs long modifications (e.g. PATCH/DELETE many) in a thread pool,
+     the client polls the state of the job instead of waiting for the response
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from threading import Lock
+from time import monotonic
+from uuid import uuid4
+
+from tornado.web import RequestHandler, HTTPError
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 19:05'
+
+
+class Job(object):
+    """
+        State of one job
+
+        :state: pending, running, succeeded or failed
+        :progress: Dictionary reported by the running operation, e.g. num_modified and num_chunks
+        :status_code: The status code the operation would have answered with
+        :result: The result of the operation or the error message
+    """
+
+    def __init__(self):
+        self.id = uuid4().hex
+        self.state = 'pending'
+        self.progress = {}
+        self.status_code = None
+        self.result = None
+        self.finished = None
+
+    def to_dict(self) -> dict:
+        return {'id': self.id,
+                'state': self.state,
+                'progress': self.progress,
+                'status_code': self.status_code,
+                'result': self.result}
+
+
+class JobRunner(object):
+    """
+        Executes jobs in a thread pool and keeps them for polling
+
+        Finished jobs are forgotten after retention seconds, or earlier when more than max_jobs are kept.
+        At most max_pending jobs are unfinished (pending or running), further jobs are rejected.
+
+        :rejected: The number of jobs rejected because max_pending jobs were unfinished
+    """
+
+    def __init__(self, max_workers: int=4, max_jobs: int=1000, retention: float=3600, max_pending: int=100):
+        """
+        :param max_workers: The number of threads executing jobs
+        :param max_jobs: The maximum number of kept jobs, the oldest finished are forgotten first
+        :param retention: Seconds a finished job is kept
+        :param max_pending: The maximum number of unfinished jobs
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_jobs = max_jobs
+        self.retention = retention
+        self.max_pending = max_pending
+        self.jobs = OrderedDict()
+        self.pending = 0
+        self.lock = Lock()
+
+        self.rejected = 0
+
+    def submit(self, execute) -> Job:
+        """
+            Submits a job
+
+            :param execute: Function called with the job in a worker thread,
+                            returns the status code and the result of the operation
+            :return: The pending job, None if max_pending jobs are unfinished
+        """
+        job = Job()
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                return None
+            self.pending += 1
+            self.evict()
+            self.jobs[job.id] = job
+        self.executor.submit(self.run, job, execute)
+        return job
+
+    def run(self, job: Job, execute):
+        """
+            Runs a job and records its outcome
+        """
+        job.state = 'running'
+        try:
+            job.status_code, job.result = execute(job)
+        except HTTPError as ex:
+            job.state = 'failed'
+            job.status_code = ex.status_code
+            job.result = {'message': ex.log_message or ex.reason}
+        except Exception as ex:
+            logging.exception(ex)
+            job.state = 'failed'
+            job.status_code = 500
+            job.result = {'message': "%s" % ex}
+        else:
+            job.state = 'succeeded'
+        finally:
+            with self.lock:
+                job.finished = monotonic()
+                self.pending -= 1
+
+    def get(self, job_id: str) -> Job:
+        """
+            Returns the job or None if unknown or already forgotten
+        """
+        with self.lock:
+            self.evict()
+            return self.jobs.get(job_id)
+
+    def evict(self):
+        """
+            Forgets the finished jobs older than retention and the oldest finished beyond max_jobs
+        """
+        finished = [job for job in self.jobs.values() if job.finished is not None]
+        expired = monotonic() - self.retention
+        for job in finished:
+            if job.finished < expired or len(self.jobs) >= self.max_jobs:
+                del self.jobs[job.id]
+
+
+class JobHandler(RequestHandler):
+    """
+        Reports the state of a job
+
+        The response is the dictionary of :class:`Job`, unknown or forgotten jobs are answered with 404.
+    """
+
+    SUPPORTED_METHODS = ['GET']
+
+    # noinspection PyMethodOverriding
+    def initialize(self, runner: JobRunner):
+        """
+        :param runner: The job runner of the api manager
+        """
+        super().initialize()
+
+        self.runner = runner
+
+    def get(self, job_id: str=None, *args):
+        """
+            GET the state of a job
+
+            :statuscode 200: job found
+            :statuscode 404: unknown job
+        """
+        job = self.runner.get(job_id)
+        if job is None:
+            raise HTTPError(404, "No job %s" % job_id)
+
+        self.finish(job.to_dict())
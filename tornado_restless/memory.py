@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Reference tables held in memory
+
+    Small, rarely changing models (countries, currencies, states) are loaded completely,
+     GET requests on them are answered without a query
+"""
+import operator
+import re
+from threading import Lock
+
+from sqlalchemy import inspect as sqinspect
+
+from .errors import IllegalArgumentError
+from .wrapper import ModelWrapper
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 00:05'
+
+
+def like(pattern: str, case_insensitive: bool=False):
+    """
+        Compiles a sql like pattern, returns its match function
+    """
+    expression = "".join(".*" if char == "%" else "." if char == "_" else re.escape(char) for char in pattern)
+    return re.compile(expression + r"\Z", re.DOTALL | (re.IGNORECASE if case_insensitive else 0)).match
+
+
+class MemoryTable(object):
+    """
+        All rows of a model in memory, with an index of the values of every column
+
+        The rows are loaded when the table is created and reloaded by the first read after a write
+         through the api (see invalidate and the generation of the model in the count cache, with shared
+         caches a write in any process, see ApiManager.create_shared_caches). Filters on the plain columns
+         of the model with the common operators (comparisons, in, null checks and like) and orderings are
+         evaluated in memory, everything else (relations, field comparisons, other operators) is left to the database.
+
+        Values are compared like python does, like is case insensitive on sqlite and mysql.
+        Like in sqlalchemy == and != against None test for null.
+
+        :loads: The number of times the rows were loaded
+    """
+
+    EQUALS = ("==", "eq", "equals", "equals_to")
+    COMPARISONS = {"!=": "ne", "ne": "ne", "neq": "ne", "not_equal_to": "ne", "does_not_equal": "ne",
+                   ">": "gt", "gt": "gt", "<": "lt", "lt": "lt",
+                   ">=": "ge", "ge": "ge", "gte": "ge", "geq": "ge", "<=": "le", "le": "le", "lte": "le", "leq": "le"}
+    TYPES = (int, float, str, bool)
+
+    def __init__(self, model, session_maker, generation=None):
+        """
+        :param model: The sqlalchemy model
+        :param session_maker: The session maker of the api manager
+        :param generation: Function returning the generation of the model, e.g. in the count cache
+        """
+        self.model = model
+        self.session_factory = getattr(session_maker, 'session_factory', session_maker)
+
+        self.columns = list(ModelWrapper(model).columns)
+        self.positions = {column: position for position, column in enumerate(self.columns)}
+        self.types = {}
+        for column in self.columns:
+            try:
+                self.types[column] = getattr(model, column).property.columns[0].type.python_type
+            except (AttributeError, NotImplementedError):
+                self.types[column] = None
+        self.primary_key_names = ModelWrapper(model).primary_key_names
+
+        self.lock = Lock()
+        self.generation_lock = Lock()
+        self.generation = 0
+        self.external_generation = generation
+        self.loaded = None
+        self.state = None
+        self.case_insensitive_like = False
+        self.nulls_low = True
+        self.loads = 0
+
+        self.load()
+
+    def load(self):
+        """
+            Loads all rows and builds the indexes
+        """
+        with self.lock:
+            self.fetch()
+
+    def fetch(self):
+        """
+            Loads all rows and builds the indexes, call with the lock held
+        """
+        version = self.version()
+
+        session = self.session_factory()
+        try:
+            dialect = session.get_bind(mapper=sqinspect(self.model)).dialect.name
+            order_by = [getattr(self.model, key) for key in self.primary_key_names]
+            rows = session.query(*[getattr(self.model, column) for column in self.columns]) \
+                .order_by(*order_by).all()
+        finally:
+            session.close()
+
+        rows = [tuple(row) for row in rows]
+        indexes = {}
+        for column, position in self.positions.items():
+            if self.types[column] not in self.TYPES:
+                continue
+            index = indexes[column] = {}
+            for number, row in enumerate(rows):
+                if row[position] is not None:
+                    index.setdefault(row[position], []).append(number)
+        identities = {tuple(row[self.positions[key]] for key in self.primary_key_names): row for row in rows}
+
+        self.case_insensitive_like = dialect in ('sqlite', 'mysql')
+        self.nulls_low = dialect != 'postgresql'
+        self.state = (rows, indexes, identities)
+        self.loaded = version
+        self.loads += 1
+
+    def invalidate(self):
+        """
+            Marks the rows as outdated, the next read reloads them
+
+            Doesn't wait for a running load (which holds lock), the load notices the newer generation
+        """
+        with self.generation_lock:
+            self.generation += 1
+
+    def version(self) -> tuple:
+        """
+            Returns the generations the rows are compared against
+        """
+        if self.external_generation is None:
+            return self.generation, None
+        return self.generation, self.external_generation()
+
+    def current(self) -> tuple:
+        """
+            Returns the current rows, indexes and identities, reloaded if invalidated
+        """
+        if self.loaded != self.version():
+            with self.lock:
+                if self.loaded != self.version():
+                    self.fetch()
+        return self.state
+
+    def get(self, identity: tuple) -> tuple:
+        """
+            Returns the row of the primary keys or None
+
+            :param identity: The primary keys, converted to their python types
+        """
+        return self.current()[2].get(tuple(identity))
+
+    def values(self, row: tuple, columns: list) -> tuple:
+        """
+            Returns the values of columns of a row
+        """
+        return tuple(row[self.positions[column]] for column in columns)
+
+    def coerce(self, column: str, value):
+        """
+            Converts a filter value to the python type of column
+
+            :raise ValueError: If the value can't be compared in memory
+        """
+        python_type = self.types[column]
+        if python_type not in self.TYPES:
+            raise ValueError(column)
+        if value is None or isinstance(value, python_type) and not (python_type is int and isinstance(value, bool)):
+            return value
+        if python_type is float and isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if python_type in (int, float) and isinstance(value, str):
+            return python_type(value)
+        if python_type is bool and value in (0, 1):
+            return bool(value)
+        raise ValueError(column)
+
+    def null_check(self, op: str, value) -> str:
+        """
+            Returns is_null or is_not_null for == and != against None, otherwise op
+        """
+        if value is None and op in self.EQUALS:
+            return "is_null"
+        elif value is None and self.COMPARISONS.get(op) == "ne":
+            return "is_not_null"
+        return op
+
+    def predicate(self, op: str, position: int, column: str, value):
+        """
+            Returns a function testing a row for a filter, None if the operator is not supported in memory
+        """
+        op = self.null_check(op, value)
+        if op == "is_null":
+            return lambda row: row[position] is None
+        elif op == "is_not_null":
+            return lambda row: row[position] is not None
+        elif op in self.COMPARISONS:
+            value = self.coerce(column, value)
+            if value is None:
+                return lambda row: False
+            compare = getattr(operator, self.COMPARISONS[op])
+            return lambda row: row[position] is not None and compare(row[position], value)
+        elif op in ("in", "not_in") and isinstance(value, list):
+            values = {self.coerce(column, item) for item in value} - {None}
+            if op == "in":
+                return lambda row: row[position] in values
+            return lambda row: row[position] is not None and row[position] not in values
+        elif op == "between" and isinstance(value, list) and len(value) == 2:
+            low, high = self.coerce(column, value[0]), self.coerce(column, value[1])
+            if low is None or high is None:
+                return lambda row: False
+            return lambda row: row[position] is not None and low <= row[position] <= high
+        elif op in ("like", "not_like", "ilike", "not_ilike", "startswith", "endswith", "contains") and \
+                self.types[column] is str and isinstance(value, str):
+            if op in ("startswith", "endswith", "contains"):
+                value = {"startswith": "%s%%", "endswith": "%%%s", "contains": "%%%s%%"}[op] % value
+                op = "like"
+            match = like(value, op in ("ilike", "not_ilike") or self.case_insensitive_like)
+            if op.startswith("not_"):
+                return lambda row: row[position] is not None and match(row[position]) is None
+            return lambda row: row[position] is not None and match(row[position]) is not None
+        return None
+
+    def select(self, filters: list, order_by: list) -> list:
+        """
+            Returns the rows matching the filters in the order of order_by
+
+            :param filters: List of filters in restless 3-tuple op string format
+            :param order_by: List of orders
+            :return: The rows or None if a filter or ordering can't be evaluated in memory
+        """
+        rows, indexes, identities = self.current()
+
+        candidates = None
+        predicates = []
+        for argument_filter in filters:
+            name, op = argument_filter.get("name"), argument_filter.get("op")
+            if name not in self.positions or "field" in argument_filter:
+                return None
+            value = argument_filter.get("val", argument_filter.get("value"))
+            op = self.null_check(op, value)
+
+            try:
+                if op in self.EQUALS and name in indexes:
+                    value = self.coerce(name, value)
+                    numbers = set(indexes[name].get(value, ()))
+                elif op == "in" and name in indexes and isinstance(value, list):
+                    numbers = set()
+                    for item in value:
+                        numbers.update(indexes[name].get(self.coerce(name, item), ()))
+                else:
+                    predicate = self.predicate(op, self.positions[name], name, value)
+                    if predicate is None:
+                        return None
+                    predicates.append(predicate)
+                    continue
+            except (ValueError, TypeError):
+                return None
+            candidates = numbers if candidates is None else candidates & numbers
+
+        if candidates is not None:
+            rows = [rows[number] for number in sorted(candidates)]
+        result = [row for row in rows if all(predicate(row) for predicate in predicates)]
+
+        for argument_order in reversed(order_by):
+            name, direction = argument_order.get("field"), argument_order.get("direction")
+            if direction not in ("asc", "desc"):
+                raise IllegalArgumentError("Direction unknown")
+            if name not in self.positions:
+                return None
+
+            position = self.positions[name]
+            descending = direction == "desc"
+            if argument_order.get("nullsfirst", False):
+                nulls_first = True
+            elif argument_order.get("nullslast", False):
+                nulls_first = False
+            else:
+                nulls_first = self.nulls_low != descending
+
+            present = sorted((row for row in result if row[position] is not None),
+                             key=lambda row: row[position], reverse=descending)
+            missing = [row for row in result if row[position] is None]
+            result = missing + present if nulls_first else present + missing
+
+        return result
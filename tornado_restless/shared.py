@@ -0,0 +1,332 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Caches shared by forked worker processes
+
+    The caches live in a memory mapped file: created before tornado.process.fork_processes,
+     every worker sees the entries and invalidations of the others without an external service
+"""
+import fcntl
+import os
+from contextlib import contextmanager
+from hashlib import blake2b
+from mmap import mmap
+from struct import Struct
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+
+from .errors import IllegalArgumentError
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 23:10'
+
+
+class SharedMemory(object):
+    """
+        A direct mapped table of fixed size slots in a memory mapped file
+
+        Every key is stored in the slot of its digest, a key in the same slot replaces the previous one.
+        Readers don't lock: Every slot has a sequence number that is odd while it is written, a read is only
+        accepted if the number was even and unchanged before and after reading the slot (seqlock).
+        Writers are serialized by a lock on the file (lockf) and a thread lock.
+
+        Invalidation doesn't touch the slots: Every slot stores the generations of its model and its identity
+        at the time it was read from the database, increasing a generation invalidates all slots storing the old one.
+
+        An existing file of the same layout is reused, but its slots are cleared: Entries of a previous run
+        may have been written before changes the invalidations of this run don't know about.
+    """
+
+    MAGIC = b'TRSHM001'
+    HEADER = Struct('<8sIII')
+    SLOT = Struct('<Q16sQQI')
+    GENERATION = Struct('<Q')
+
+    def __init__(self, path: str=None, slots: int=65536, slot_size: int=1024, generations: int=65536):
+        """
+        :param path: The file, a temporary file (deleted at once) if None
+        :param slots: The number of slots
+        :param slot_size: The size of a slot in bytes, larger values are not cached
+        :param generations: The number of generation counters, identities sharing a counter are invalidated together
+        """
+        if slot_size <= self.SLOT.size:
+            raise IllegalArgumentError("Slots must be larger than %u bytes" % self.SLOT.size)
+
+        if path is None:
+            self.fd, path = mkstemp(prefix='tornado_restless.', suffix='.cache')
+            os.unlink(path)
+        else:
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        self.slots = slots
+        self.slot_size = slot_size
+        self.generations = generations
+        self.lock = Lock()
+
+        self.generations_offset = self.HEADER.size
+        self.slots_offset = self.generations_offset + generations * self.GENERATION.size
+        size = self.slots_offset + slots * slot_size
+
+        with self.locked():
+            header = os.pread(self.fd, self.HEADER.size, 0)
+            if len(header) < self.HEADER.size or header[:len(self.MAGIC)] != self.MAGIC:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, self.HEADER.pack(self.MAGIC, slots, slot_size, generations), 0)
+            elif self.HEADER.unpack(header)[1:] != (slots, slot_size, generations):
+                raise IllegalArgumentError("Cache file %s has a different layout" % path)
+            else:
+                self.clear(size)
+
+        self.map = mmap(self.fd, size)
+
+    def clear(self, size: int, chunk_size: int=1 << 20):
+        """
+            Overwrites all slots with zeros (empty slots), call with the lock held
+
+            The generation counters are kept, they only ever increase.
+        """
+        zeros = bytes(chunk_size)
+        for offset in range(self.slots_offset, size, chunk_size):
+            os.pwrite(self.fd, zeros[:size - offset], offset)
+
+    @contextmanager
+    def locked(self):
+        """
+            Context holding the write lock of threads and processes
+        """
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def digest(*parts) -> bytes:
+        """
+            The digest of a key, equal in all processes
+
+            :param parts: Strings, numbers and tuples of them
+        """
+        return blake2b(repr(parts).encode('utf-8'), digest_size=16).digest()
+
+    def counter(self, digest: bytes) -> int:
+        """
+            Returns the generation counter of a digest
+
+            :param digest: See digest
+        """
+        return self.GENERATION.unpack_from(self.map, self.counter_offset(digest))[0]
+
+    def counter_offset(self, digest: bytes) -> int:
+        return self.generations_offset + int.from_bytes(digest[:8], 'little') % self.generations * self.GENERATION.size
+
+    def increase(self, digest: bytes):
+        """
+            Increases the generation counter of a digest, call with the lock held
+
+            :param digest: See digest
+        """
+        offset = self.counter_offset(digest)
+        self.GENERATION.pack_into(self.map, offset, self.GENERATION.unpack_from(self.map, offset)[0] + 1)
+
+    def slot_offset(self, digest: bytes) -> int:
+        return self.slots_offset + int.from_bytes(digest[8:], 'little') % self.slots * self.slot_size
+
+    def load(self, digest: bytes, generations: tuple) -> bytes:
+        """
+            Reads the value of a key without locking
+
+            :param digest: The digest of the key
+            :param generations: The current generations of model and identity
+            :return: The value or None if missing, invalidated or concurrently written
+        """
+        offset = self.slot_offset(digest)
+        sequence, key, model_generation, identity_generation, length = self.SLOT.unpack_from(self.map, offset)
+        if sequence & 1 or key != digest or (model_generation, identity_generation) != generations:
+            return None
+
+        start = offset + self.SLOT.size
+        value = self.map[start:start + length]
+        if self.SLOT.unpack_from(self.map, offset)[0] != sequence:
+            return None
+        return value
+
+    def store(self, digest: bytes, value: bytes, generations: tuple, current) -> bool:
+        """
+            Writes the value of a key unless the generations changed since the value was read
+
+            :param digest: The digest of the key
+            :param value: The value
+            :param generations: The generations of model and identity before the value was read
+            :param current: Function returning the current generations of model and identity
+            :return: True if another key was replaced
+        """
+        if self.SLOT.size + len(value) > self.slot_size:
+            return False
+
+        offset = self.slot_offset(digest)
+        with self.locked():
+            if current() != generations:
+                return False
+
+            # An odd sequence (of a crashed writer) stays odd
+            sequence, key, _, _, length = self.SLOT.unpack_from(self.map, offset)
+            sequence = (sequence + 1) | 1
+            self.SLOT.pack_into(self.map, offset, sequence, key, 0, 0, 0)
+            start = offset + self.SLOT.size
+            self.map[start:start + len(value)] = value
+            self.SLOT.pack_into(self.map, offset, sequence + 1, digest, generations[0], generations[1], len(value))
+
+        return length > 0 and key != digest
+
+    def close(self):
+        """
+            Unmaps and closes the file
+        """
+        self.map.close()
+        os.close(self.fd)
+
+
+class SharedInstanceCache(SharedMemory):
+    """
+        Replacement of :class:`tornado_restless.cache.InstanceCache` shared by forked worker processes
+
+        Values are limited by the slot size instead of a total size, the least recently used are not tracked:
+         a new instance replaces the instance in its slot.
+
+        The counters are per process.
+
+        :hits: The number of instances answered from the cache
+        :misses: The number of instances that were not cached
+        :evictions: The number of instances replaced by another one
+        :invalidations: The number of invalidated identities (and models)
+    """
+
+    def __init__(self, path: str=None, slots: int=65536, slot_size: int=1024, generations: int=65536):
+        super().__init__(path, slots=slots, slot_size=slot_size, generations=generations)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def model_name(model) -> str:
+        return "%s.%s" % (model.__module__, model.__qualname__)
+
+    def generation(self, model, identity: tuple=None) -> tuple:
+        """
+            Returns the generations of model and identity, pass it to set after reading the instance
+
+            :param model: The sqlalchemy model
+            :param identity: The primary keys of the instance
+        """
+        name = self.model_name(model)
+        return (self.counter(self.digest('model', name)),
+                self.counter(self.digest('identity', name, identity)))
+
+    def get(self, model, identity: tuple, variant):
+        """
+            Returns the serialized instance or None if not cached
+
+            :param model: The sqlalchemy model
+            :param identity: The primary keys of the instance
+            :param variant: The key of the serialization (blueprint and fields)
+        """
+        value = self.load(self.digest(self.model_name(model), identity, variant), self.generation(model, identity))
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode('utf-8')
+
+    def set(self, model, identity: tuple, variant, value: str, generation: tuple):
+        """
+            Caches the serialized instance unless it was invalidated since generation
+
+            :param model: The sqlalchemy model
+            :param identity: The primary keys of the instance
+            :param variant: The key of the serialization (blueprint and fields)
+            :param value: The serialized instance
+            :param generation: The generations of the model and identity before the instance was read
+        """
+        if self.store(self.digest(self.model_name(model), identity, variant), value.encode('utf-8'), generation,
+                      lambda: self.generation(model, identity)):
+            self.evictions += 1
+
+    def invalidate(self, model, identities: list=None):
+        """
+            Invalidates the cached instances of model in all processes
+
+            :param model: The sqlalchemy model
+            :param identities: The primary keys of the instances, all instances of the model if None
+        """
+        name = self.model_name(model)
+        with self.locked():
+            if identities is None:
+                self.increase(self.digest('model', name))
+                self.invalidations += 1
+            else:
+                for identity in identities:
+                    self.increase(self.digest('identity', name, tuple(identity)))
+                    self.invalidations += 1
+
+
+class SharedCountCache(SharedMemory):
+    """
+        Replacement of :class:`tornado_restless.cache.CountCache` shared by forked worker processes
+    """
+
+    COUNT = Struct('<dq')
+
+    def __init__(self, path: str=None, slots: int=65536, generations: int=4096):
+        super().__init__(path, slots=slots, slot_size=self.SLOT.size + self.COUNT.size, generations=generations)
+
+    def generation(self, model) -> tuple:
+        """
+            Returns the generations of model, pass it to set after counting
+
+            :param model: The sqlalchemy model
+        """
+        return self.counter(self.digest('model', SharedInstanceCache.model_name(model))), 0
+
+    def get(self, model, key):
+        """
+            Returns the cached count or None if missing or expired
+
+            :param model: The sqlalchemy model
+            :param key: The key of the filters, see SessionedModelWrapper.count_key
+        """
+        value = self.load(self.digest(SharedInstanceCache.model_name(model), key), self.generation(model))
+        if value is None:
+            return None
+
+        expires, count = self.COUNT.unpack(value)
+        if expires < time():
+            return None
+        return count
+
+    def set(self, model, key, count: int, ttl: float, generation: tuple):
+        """
+            Caches the count for ttl seconds unless model was invalidated since generation
+
+            :param model: The sqlalchemy model
+            :param key: The key of the filters, see SessionedModelWrapper.count_key
+            :param count: The count
+            :param ttl: Time to live in seconds
+            :param generation: The generations of model before counting
+        """
+        self.store(self.digest(SharedInstanceCache.model_name(model), key), self.COUNT.pack(time() + ttl, count),
+                   generation, lambda: self.generation(model))
+
+    def invalidate(self, model):
+        """
+            Invalidates all cached counts of model in all processes
+
+            :param model: The sqlalchemy model
+        """
+        with self.locked():
+            self.increase(self.digest('model', SharedInstanceCache.model_name(model)))
@@ -0,0 +1,285 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Incremental sync and snapshots of collections
+
+    A client keeps a token of the last change it has seen and asks for the instances modified
+     and the primary keys of the instances deleted after it.
+    A client paging through a collection keeps the token of a snapshot, later pages don't see instances
+     inserted after the first one.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime, date, timedelta
+from json import dumps, loads
+
+from sqlalchemy import Table, MetaData, Column, Integer, String, Text, DateTime, func, select, inspect as sqinspect
+
+from .convert import to_dict
+from .errors import IllegalArgumentError
+from .wrapper import ModelWrapper, _keyset_condition
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 00:50'
+
+metadata = MetaData()
+
+tombstones = Table('restless_tombstones', metadata,
+                   Column('id', Integer, primary_key=True),
+                   Column('collection', String(255), nullable=False, index=True),
+                   Column('identity', Text, nullable=False),
+                   Column('deleted_at', DateTime, nullable=False, default=datetime.utcnow))
+
+
+def encode_token(value) -> str:
+    """
+        Returns the url safe token of a JSON value
+    """
+    return urlsafe_b64encode(dumps(value).encode('utf-8')).decode('ascii')
+
+
+def decode_token(token: str):
+    """
+        Returns the JSON value of a token
+
+        :raise ValueError: If the token is invalid
+    """
+    try:
+        return loads(urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (AttributeError, UnicodeError, BinasciiError) as ex:
+        raise ValueError(ex)
+
+
+def coerce(model, key: str, value):
+    """
+        Converts a value of a token back to the python type of the column key of model
+    """
+    try:
+        python_type = getattr(model, key).property.columns[0].type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if python_type is date and isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+class ChangeTracker(object):
+    """
+        Tracks the changes of a model by a column and the tombstones of deleted instances
+
+        The column must be increased by every write of an instance, e.g. an updated_at column with
+         onupdate=func.now() or a version from a global sequence, and must not be null.
+
+        The token of a position is (value of the column, primary keys) of the last instance seen and the id of the
+         last tombstone seen: instances are returned ordered by column and primary keys.
+
+        Neither the column nor the tombstone ids are in commit order: a transaction committing after a later one
+         may carry an older value, which a client holding the token of the later one would skip.
+        Therefore only changes older than window seconds are returned (datetime columns holding UTC, like
+         datetime.utcnow, and the tombstones): a transaction committing within window seconds of setting
+         the column is never skipped. Other columns must be assigned in commit order.
+    """
+
+    def __init__(self, model, column: str, window: float=5):
+        """
+        :param model: The sqlalchemy model
+        :param column: The name of the column increased by every write
+        :param window: Seconds a change is held back until it is returned
+        """
+        wrapper = ModelWrapper(model)
+        if column not in wrapper.columns:
+            raise IllegalArgumentError("Column '%s' not defined for %s" % (column, wrapper.__name__))
+
+        self.model = model
+        self.column = column
+        self.collection = wrapper.__tablename__
+        self.keys = [column] + [key for key in wrapper.primary_key_names if key != column]
+        self.mapper = sqinspect(model)
+        self.window = timedelta(seconds=window)
+
+        try:
+            self.timed = getattr(model, column).property.columns[0].type.python_type is datetime
+        except NotImplementedError:
+            self.timed = False
+
+    def horizon(self) -> datetime:
+        """
+            Returns the time up to which changes are returned
+        """
+        return datetime.utcnow() - self.window
+
+    def create(self, session_maker):
+        """
+            Creates the tombstone table if it does not exist
+
+            :param session_maker: The session maker of the api manager
+        """
+        session = getattr(session_maker, 'session_factory', session_maker)()
+        try:
+            tombstones.create(session.get_bind(mapper=self.mapper), checkfirst=True)
+        finally:
+            session.close()
+
+    def record(self, session, identities: list):
+        """
+            Adds the tombstones of deleted instances, in the transaction of the deletion
+
+            :param session: The session deleting the instances
+            :param identities: Identities (tuple of primary keys) of the deleted instances
+        """
+        if identities:
+            session.execute(tombstones.insert(),
+                            [{'collection': self.collection, 'identity': dumps([to_dict(key) for key in identity]),
+                              'deleted_at': datetime.utcnow()} for identity in identities],
+                            mapper=self.mapper)
+
+    def deleted(self, session, after: int) -> tuple:
+        """
+            Returns the identities deleted after a tombstone, up to the first one newer than the horizon
+
+            :param session: The session
+            :param after: The id of the last tombstone seen
+            :return: (list of identities, id of the last tombstone)
+        """
+        query = select([tombstones.c.id, tombstones.c.identity, tombstones.c.deleted_at]) \
+            .where(tombstones.c.collection == self.collection) \
+            .where(tombstones.c.id > after) \
+            .order_by(tombstones.c.id)
+
+        horizon = self.horizon()
+        identities = []
+        for tombstone, identity, deleted_at in session.execute(query, mapper=self.mapper):
+            if deleted_at > horizon:
+                break
+            identities.append(loads(identity))
+            after = tombstone
+        return identities, after
+
+    def last_tombstone(self, session) -> int:
+        """
+            Returns the id of the last tombstone before the first one newer than the horizon
+
+            :param session: The session
+        """
+        query = select([func.min(tombstones.c.id)]) \
+            .where(tombstones.c.collection == self.collection) \
+            .where(tombstones.c.deleted_at > self.horizon())
+        first = session.execute(query, mapper=self.mapper).scalar()
+        if first is not None:
+            return first - 1
+
+        query = select([func.max(tombstones.c.id)]).where(tombstones.c.collection == self.collection)
+        return session.execute(query, mapper=self.mapper).scalar() or 0
+
+    def filters(self, position: list) -> list:
+        """
+            Returns the filters and orderings selecting the instances changed after position (up to the horizon)
+
+            :param position: Values of keys of the last instance seen, None for all instances
+        """
+        columns = [getattr(self.model, key) for key in self.keys]
+
+        filters = [] if position is None else [_keyset_condition(columns, position)]
+        if self.timed:
+            filters.append(columns[0] <= self.horizon())
+        return filters + [column.asc() for column in columns]
+
+    def encode(self, position: list, tombstone: int) -> str:
+        """
+            Returns the token of a position
+
+            :param position: Values of keys of the last instance seen, None for all instances
+            :param tombstone: The id of the last tombstone seen
+        """
+        if position is not None:
+            position = [to_dict(value) for value in position]
+        return encode_token([position, tombstone])
+
+    def decode(self, token: str) -> tuple:
+        """
+            Returns the position and the id of the last tombstone of a token
+
+            :param token: The token, None for the start of the sync
+            :return: (position, tombstone) or None
+            :raise IllegalArgumentError: If the token is invalid
+        """
+        if token is None:
+            return None
+
+        try:
+            position, tombstone = decode_token(token)
+            if position is not None:
+                position = [coerce(self.model, key, value) for key, value in zip(self.keys, position)]
+            return position, int(tombstone)
+        except (ValueError, TypeError):
+            raise IllegalArgumentError("Invalid since token")
+
+
+class Snapshot(object):
+    """
+        Pins the instances of a model existing at the first page of a paginated request
+
+        The column must be increased by every insert and must not be null, e.g. an autoincrement
+         primary key or a created_at column. The token of a snapshot is the maximal value of the column
+         (high-water mark) and the filters and orderings of the first page: later pages only see instances
+         up to the mark, ordered the same way with the primary keys as tie breaker.
+
+        Instances deleted or moved by an update of an ordered column while paging still shift the pages.
+    """
+
+    def __init__(self, model, column: str):
+        """
+        :param model: The sqlalchemy model
+        :param column: The name of the column increased by every insert
+        """
+        wrapper = ModelWrapper(model)
+        if column not in wrapper.columns:
+            raise IllegalArgumentError("Column '%s' not defined for %s" % (column, wrapper.__name__))
+
+        self.model = model
+        self.column = column
+        self.primary_key_names = wrapper.primary_key_names
+
+    def mark(self, session):
+        """
+            Returns the current maximal value of the column
+
+            :param session: The session
+        """
+        return session.query(func.max(getattr(self.model, self.column))).scalar()
+
+    def filters(self, mark) -> list:
+        """
+            Returns the filter of the instances up to mark and the orderings by primary keys
+
+            :param mark: The maximal value of the column, None if the collection was empty
+        """
+        column = getattr(self.model, self.column)
+        condition = column.is_(None) if mark is None else column <= mark
+        return [condition] + [getattr(self.model, key).asc() for key in self.primary_key_names]
+
+    def encode(self, mark, filters: list, order_by: list) -> str:
+        """
+            Returns the token of a snapshot
+
+            :param mark: The maximal value of the column
+            :param filters: The filters of the first page in restless 3-tuple op string format
+            :param order_by: The orderings of the first page
+        """
+        return encode_token([to_dict(mark), filters, order_by])
+
+    def decode(self, token: str) -> tuple:
+        """
+            Returns the mark, filters and orderings of a token
+
+            :raise IllegalArgumentError: If the token is invalid
+        """
+        try:
+            mark, filters, order_by = decode_token(token)
+            if not isinstance(filters, list) or not isinstance(order_by, list):
+                raise ValueError(token)
+            return coerce(self.model, self.column, mark), filters, order_by
+        except (ValueError, TypeError):
+            raise IllegalArgumentError("Invalid snapshot token")
@@ -3,15 +3,18 @@
 """
 
 """
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from importlib import import_module
 import inspect
+import itertools
 import logging
 
-from sqlalchemy import inspect as sqinspect
+from sqlalchemy import inspect as sqinspect, func, and_, or_, cast, literal, text, String, Text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.exc import NoInspectionAvailable
 from sqlalchemy.ext.associationproxy import AssociationProxy
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import ColumnProperty, Query
+from sqlalchemy.orm import ColumnProperty, Query, load_only, aliased
 from sqlalchemy.orm.attributes import QueryableAttribute
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.interfaces import MapperProperty
@@ -19,6 +22,8 @@ from sqlalchemy.orm.properties import RelationshipProperty
 from sqlalchemy.sql.operators import is_ordering_modifier
 from sqlalchemy.util import memoized_property
 
+from .errors import IllegalArgumentError
+
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
 __date__ = '27.04.13 - 00:14'
@@ -69,6 +74,17 @@ def _is_ordering_expression(expression):
     return False
 
 
+def _keyset_condition(columns: list, values: tuple):
+    """
+        Returns the condition (columns) > (values) in lexicographic order
+
+        (a, b) > (x, y) <=> a > x or (a = x and b > y)
+    """
+    return or_(*[and_(*([column == value for column, value in zip(columns[:i], values[:i])] +
+                        [columns[i] > values[i]]))
+                 for i in range(len(columns))])
+
+
 class ModelWrapper(object):
     """
         Wrapper around sqlalchemy model for having some easier functions
@@ -113,6 +129,14 @@ class ModelWrapper(object):
 
     primary_keys.__doc__ = get_primary_keys.__func__.__doc__
 
+    @memoized_property
+    def primary_key_names(self) -> list:
+        """
+            Returns the names of the primary keys in the order of the instance identity
+        """
+        mapper = sqinspect(self.model)
+        return [mapper.get_property_by_column(column).key for column in mapper.primary_key]
+
     @staticmethod
     def get_unique_keys(instance) -> dict:
         """
@@ -263,6 +287,12 @@ class SessionedModelWrapper(ModelWrapper):
         super().__init__(model)
         self.session = session
 
+    def query(self) -> Query:
+        """
+            The base query all other functions are applied on
+        """
+        return self.session.query(self.model)
+
     @staticmethod
     def _apply_kwargs(instance: Query, **kwargs) -> Query:
         for expression in kwargs.pop('filters', []):
@@ -271,6 +301,11 @@ class SessionedModelWrapper(ModelWrapper):
             else:
                 instance = instance.filter(expression)
 
+        if kwargs.get('load_only') is not None:
+            instance = instance.options(load_only(*kwargs.pop('load_only')))
+        else:
+            kwargs.pop('load_only', None)
+
         if 'offset' in kwargs:
             offset = kwargs.pop('offset')
             foffset = lambda instance: instance.offset(offset)
@@ -295,9 +330,10 @@ class SessionedModelWrapper(ModelWrapper):
             :param filters: Filters and OrderBy Clauses
             :param kwargs: Additional filters passed to filter_by
             :keyword offset: Offset for request
+            :keyword load_only: Names of the only columns that are loaded
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
@@ -311,14 +347,120 @@ class SessionedModelWrapper(ModelWrapper):
             :param kwargs: Additional filters passed to filter_by
             :keyword limit: Limit for request
             :keyword offset: Offset for request
+            :keyword load_only: Names of the only columns that are loaded
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
         return SessionedModelWrapper._apply_kwargs(instance, filters=filters, **kwargs).all()
 
+    def row(self, columns: list, filters: list=(), **kwargs) -> tuple:
+        """
+            Gets the values of columns of one instance as plain tuple
+
+            No instance is created, so the session and its identity map are bypassed
+
+            :param columns: Names of the columns
+            :param filters: Filters and OrderBy Clauses
+            :param kwargs: Additional filters passed to filter_by
+            :keyword offset: Offset for request
+        """
+        instance = self.query().with_entities(*[getattr(self.model, column) for column in columns])
+
+        return SessionedModelWrapper._apply_kwargs(instance, filters=filters, **kwargs).one()
+
+    def rows(self, columns: list, filters: list=(), **kwargs) -> list:
+        """
+            Gets the values of columns of all instances as plain tuples
+
+            No instances are created, so the session and its identity map are bypassed
+
+            :param columns: Names of the columns
+            :param filters: Filters and OrderBy Clauses
+            :param kwargs: Additional filters passed to filter_by
+            :keyword limit: Limit for request
+            :keyword offset: Offset for request
+        """
+        instance = self.query().with_entities(*[getattr(self.model, column) for column in columns])
+
+        return SessionedModelWrapper._apply_kwargs(instance, filters=filters, **kwargs).all()
+
+    def get_json_functions(self) -> tuple:
+        """
+            Returns the functions to build a JSON object and aggregate a JSON array for the database of the model
+
+            Supported are sqlite (json1 extension) and postgresql, for other databases None is returned
+        """
+        dialect = self.session.get_bind(mapper=sqinspect(self.model)).dialect.name
+        if dialect == 'sqlite':
+            return func.json_object, func.json_group_array
+        elif dialect == 'postgresql':
+            return func.json_build_object, func.json_agg
+        else:
+            return None
+
+    def supports_json(self, columns: list, filters: list=()) -> bool:
+        """
+            Test whether the database can encode the values of columns like convert.to_dict
+
+            That is the case for integer, float and string columns in sqlite and postgresql.
+            Ordered requests are only supported by postgresql: json_group_array of sqlite does not
+             guarantee the order of the aggregated rows.
+
+            :param columns: Names of the columns
+            :param filters: Filters and OrderBy Clauses
+        """
+        if self.get_json_functions() is None:
+            return False
+
+        dialect = self.session.get_bind(mapper=sqinspect(self.model)).dialect.name
+        if dialect != 'postgresql' and any(_is_ordering_expression(expression) for expression in filters):
+            return False
+
+        for column in columns:
+            try:
+                if getattr(self.model, column).type.python_type not in (int, float, str):
+                    return False
+            except (AttributeError, NotImplementedError):
+                return False
+        return True
+
+    def json_array(self, columns: list, filters: list=(), **kwargs) -> str:
+        """
+            Gets the values of columns of all instances as JSON array of objects, encoded by the database
+
+            Check with supports_json first, for unsupported databases None is returned
+
+            :param columns: Names of the columns
+            :param filters: Filters and OrderBy Clauses
+            :param kwargs: Additional filters passed to filter_by
+            :keyword limit: Limit for request
+            :keyword offset: Offset for request
+        """
+        functions = self.get_json_functions()
+        if functions is None:
+            return None
+        json_object, json_array = functions
+
+        # The position of every row in the requested order, aggregated in that order by postgresql
+        orderings = []
+        if self.session.get_bind(mapper=sqinspect(self.model)).dialect.name == 'postgresql':
+            orderings = [expression for expression in filters if _is_ordering_expression(expression)]
+        entities = [getattr(self.model, column).label(column) for column in columns]
+        if orderings:
+            entities.append(func.row_number().over(order_by=orderings).label('_position'))
+
+        instance = self.query().with_entities(*entities)
+        rows = SessionedModelWrapper._apply_kwargs(instance, filters=filters, **kwargs).subquery()
+
+        pairs = itertools.chain.from_iterable((literal(column, String), rows.c[column]) for column in columns)
+        element = json_object(*pairs)
+        if orderings:
+            element = aggregate_order_by(element, rows.c['_position'])
+        return self.session.query(func.coalesce(cast(json_array(element), Text), '[]')).scalar()
+
     def update(self, values: dict, filters: list=(), **kwargs) -> int:
         """
             Updates all instances of the model filtered by filters
@@ -330,7 +472,7 @@ class SessionedModelWrapper(ModelWrapper):
             :keyword offset: Offset for request
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
@@ -347,12 +489,93 @@ class SessionedModelWrapper(ModelWrapper):
             :keyword offset: Offset for request
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
         return SessionedModelWrapper._apply_kwargs(instance, filters=filters, **kwargs).delete()
 
+    def identity_chunks(self, filters: list=(), chunk_size: int=1000, limit: int=None):
+        """
+            Yields the identities (tuple of primary keys) of the instances filtered by filters, chunk by chunk
+
+            Only the primary keys are selected. Without ordering the chunks are read by primary key
+             (keyset pagination), so instances modified or deleted in between do not shift the chunks.
+            With ordering and limit the identities are selected at once in the requested order.
+
+            :param filters: Filters and OrderBy Clauses
+            :param chunk_size: Maximal number of identities per chunk
+            :param limit: Maximal number of identities in total
+        """
+        primary_keys = [getattr(self.model, key) for key in self.primary_key_names]
+        query = self.query().with_entities(*primary_keys)
+
+        if limit is not None and any(_is_ordering_expression(expression) for expression in filters):
+            identities = [tuple(row) for row in SessionedModelWrapper._apply_kwargs(query, filters=filters,
+                                                                                     limit=limit)]
+            for offset in range(0, len(identities), chunk_size):
+                yield identities[offset:offset + chunk_size]
+            return
+
+        query = SessionedModelWrapper._apply_kwargs(query, filters=[expression for expression in filters
+                                                                    if not _is_ordering_expression(expression)])
+        query = query.order_by(*primary_keys)
+
+        last = None
+        while limit is None or limit > 0:
+            size = chunk_size if limit is None else min(chunk_size, limit)
+
+            if last is None:
+                chunk = [tuple(row) for row in query.limit(size)]
+            else:
+                chunk = [tuple(row) for row in query.filter(_keyset_condition(primary_keys, last)).limit(size)]
+
+            if chunk:
+                yield chunk
+            if len(chunk) < size:
+                return
+
+            last = chunk[-1]
+            if limit is not None:
+                limit -= len(chunk)
+
+    def update_identities(self, values: dict, identities: list) -> int:
+        """
+            Updates the instances with one of the identities, the session is not synchronized
+
+            :param values: Dictionary of values
+            :param identities: Identities (tuple of primary keys) of the instances
+        """
+        return self.query().filter(self.identity_condition(identities)).update(values, synchronize_session=False)
+
+    def update_version(self, values: dict, identity: tuple, column: str, versions) -> bool:
+        """
+            Updates the instance of identity if its version column still has one of the values versions
+
+            One UPDATE ... WHERE pk = ? AND column IN (?) setting the values and version + 1,
+             the instance is neither loaded nor refreshed, the session is not synchronized.
+
+            :param values: Dictionary of values
+            :param identity: Identity (tuple of primary keys) of the instance
+            :param column: The name of the integer version column
+            :param versions: The list of expected versions, '*' for any version
+            :return: True if updated, False if the instance was modified meanwhile or does not exist
+        """
+        values = dict(values)
+        values[column] = getattr(self.model, column) + 1
+        query = self.query().filter(self.identity_condition([identity]))
+        if versions != '*':
+            query = query.filter(getattr(self.model, column).in_(versions))
+        return query.update(values, synchronize_session=False) > 0
+
+    def delete_identities(self, identities: list) -> int:
+        """
+            Deletes the instances with one of the identities, the session is not synchronized
+
+            :param identities: Identities (tuple of primary keys) of the instances
+        """
+        return self.query().filter(self.identity_condition(identities)).delete(synchronize_session=False)
+
     def count(self, filters: list=(), **kwargs) -> int:
         """
             Gets the instance count
@@ -361,12 +584,161 @@ class SessionedModelWrapper(ModelWrapper):
             :param kwargs: Additional filters passed to filter_by
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
         return SessionedModelWrapper._apply_kwargs(instance, filters=filters, **kwargs).order_by(False).count()
 
+    def coerce_primary_keys(self, pargs: list) -> list:
+        """
+            Converts the primary keys (e.g. from an url or a JSON body) to the python type of their columns
+
+            :param pargs: ident
+        """
+        rtn = []
+        for column, value in zip(sqinspect(self.model).primary_key, pargs):
+            try:
+                python_type = column.type.python_type
+            except NotImplementedError:
+                python_type = None
+            if isinstance(value, str) and python_type in (int, float):
+                try:
+                    value = python_type(value)
+                except ValueError:
+                    raise NoResultFound("Malformed primary key %r for %s" % (value, self.__collectionname__))
+            elif isinstance(value, (int, float)) and not isinstance(value, bool) and python_type is str:
+                value = str(value)
+            rtn.append(value)
+        return rtn
+
+    def upsert(self, rows: list, version_column: str=None) -> int:
+        """
+            Inserts rows or updates the given values if the primary key already exists
+
+            Uses INSERT ... ON CONFLICT DO UPDATE (postgresql, sqlite with sqlalchemy 1.4+). With other databases
+            the existing primary keys are selected first, then the rows are written with one bulk update and
+            one bulk insert: a row inserted concurrently in between fails with an IntegrityError.
+
+            Models mapped to more than one table (joined table inheritance) are not supported.
+            Columns with an onupdate default are set by updated rows like by UPDATE.
+
+            :param rows: List of dictionaries of column to value, must include the primary keys
+            :param version_column: The name of an integer column increased by every update of a row
+            :return: Number of rows
+            :raise IllegalArgumentError: For unknown columns, models mapped to more than one table and
+                                         onupdate defaults depending on the statement
+        """
+        mapper = sqinspect(self.model)
+        dialect = self.session.get_bind(mapper=mapper).dialect.name
+
+        if len(mapper.tables) > 1:
+            raise IllegalArgumentError("Upsert of %s is not supported: it is mapped to more than one table" %
+                                       self.__name__)
+
+        for values in rows:
+            for key in values:
+                if key not in mapper.columns:
+                    raise IllegalArgumentError("Column '%s' not defined for %s" % (key, self.__name__))
+
+        try:
+            insert = import_module('sqlalchemy.dialects.%s' % dialect).insert
+            if not hasattr(insert(mapper.local_table), 'on_conflict_do_update'):
+                raise AttributeError(insert)
+        except (ImportError, AttributeError):
+            # Later rows of the same identity win
+            merged = OrderedDict()
+            for values in rows:
+                merged.setdefault(tuple(values[key] for key in self.primary_key_names), {}).update(values)
+
+            existing = self.existing_identities(list(merged))
+            updated = [identity for identity, values in merged.items()
+                       if identity in existing and len(values) > len(self.primary_key_names)]
+            self.session.flush()
+            self.session.bulk_update_mappings(mapper, [merged[identity] for identity in updated])
+            if version_column is not None and updated:
+                self.update_identities({version_column: getattr(self.model, version_column) + 1}, updated)
+            self.session.bulk_insert_mappings(mapper, [values for identity, values in merged.items()
+                                                       if identity not in existing])
+            return len(rows)
+
+        self.session.flush()
+
+        # Group rows with the same columns into one executemany
+        groups = {}
+        for values in rows:
+            groups.setdefault(tuple(sorted(values)), []).append(values)
+
+        for keys, group in groups.items():
+            statement = insert(mapper.local_table)
+            update = {mapper.columns[key].name: statement.excluded[mapper.columns[key].name]
+                      for key in keys if key not in self.primary_key_names}
+            if update:
+                # ON CONFLICT DO UPDATE doesn't apply Column.onupdate
+                for column in mapper.local_table.columns:
+                    if column.onupdate is not None and column.name not in update:
+                        update[column.name] = self.onupdate_value(column)
+                if version_column is not None:
+                    column = mapper.columns[version_column]
+                    update[column.name] = column + 1
+                statement = statement.on_conflict_do_update(index_elements=list(mapper.primary_key), set_=update)
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=list(mapper.primary_key))
+            self.session.execute(statement, [{mapper.columns[key].name: values[key] for key in keys}
+                                             for values in group])
+
+        return len(rows)
+
+    def onupdate_value(self, column):
+        """
+            Returns the value or sql expression of the onupdate default of a column
+
+            :raise IllegalArgumentError: If a python function of the default requires the execution context
+        """
+        default = column.onupdate
+        if not getattr(default, 'is_callable', False):
+            return default.arg
+        try:
+            return default.arg(None)
+        except (AttributeError, TypeError):
+            raise IllegalArgumentError("Upsert of %s is not supported: the onupdate default of %s depends on the "
+                                       "statement" % (self.__name__, column.name))
+
+    def count_key(self, filters: list=(), **kwargs) -> tuple:
+        """
+            Returns a hashable key of the count query, e.g. for caching counts
+
+            :param filters: Filters and OrderBy Clauses
+            :param kwargs: Additional filters passed to filter_by
+        """
+        query = SessionedModelWrapper._apply_kwargs(self.query(), filters=filters, **kwargs).order_by(False)
+        compiled = query.statement.compile(dialect=self.session.get_bind(mapper=sqinspect(self.model)).dialect)
+        return str(compiled), repr(sorted(compiled.params.items()))
+
+    def estimate_count(self) -> int:
+        """
+            Returns the number of instances estimated by the statistics of the database
+
+            Supported are sqlite (sqlite_stat1, filled by ANALYZE) and postgresql (pg_class.reltuples),
+            None is returned if no statistic is available
+        """
+        bind = self.session.get_bind(mapper=sqinspect(self.model))
+        table = sqinspect(self.model).local_table
+
+        if bind.dialect.name == 'sqlite':
+            if not self.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")).scalar():
+                return None
+            stat = self.session.execute(text("SELECT stat FROM sqlite_stat1 WHERE tbl = :table"),
+                                        {'table': table.name}).scalar()
+            return int(stat.split(" ", 1)[0]) if stat else None
+        elif bind.dialect.name == 'postgresql':
+            estimate = self.session.execute(text("SELECT reltuples::bigint FROM pg_class "
+                                                 "WHERE oid = CAST(:table AS regclass)"),
+                                            {'table': table.fullname}).scalar()
+            return estimate if estimate is not None and estimate >= 0 else None
+        else:
+            return None
+
     def get(self, *pargs) -> object:
         """
             Gets one instance of the model based on primary_keys
@@ -375,7 +747,7 @@ class SessionedModelWrapper(ModelWrapper):
             :raise NoResultFound: If no element has been received
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
@@ -389,9 +761,138 @@ class SessionedModelWrapper(ModelWrapper):
 
         return rtn
 
+    def count_relation(self, identities: list, relation: str) -> dict:
+        """
+            Counts the related instances of relation for all instances in one grouped query
+
+            The related instances are never loaded.
+
+            :param identities: Identities (tuple of primary keys) of the instances
+            :param relation: Name of the relation
+            :return: Dictionary of identity to count, identities without related instances are missing
+        """
+        if not identities:
+            return {}
+
+        primary_keys = sqinspect(self.model).primary_key
+
+        query = self.session.query(*primary_keys).add_columns(func.count())
+        query = query.join(getattr(self.model, relation)).filter(self.identity_condition(identities))
+        query = query.group_by(*primary_keys)
+        return {tuple(row[:-1]): row[-1] for row in query}
+
+    def capped_relation(self, identities: list, relation: str, limit: int) -> dict:
+        """
+            Queries at most limit related instances of relation for all instances in one windowed query
+
+            The related instances are numbered per instance (row_number over the partition of its primary keys)
+             in the order_by of the relationship or the primary keys of the related model.
+
+            :param identities: Identities (tuple of primary keys) of the instances
+            :param relation: Name of the relation
+            :param limit: The maximum number of related instances per instance
+            :return: Dictionary of identity to list of related instances,
+                     identities without related instances are missing
+        """
+        if not identities:
+            return {}
+
+        mapper = sqinspect(self.model)
+        prop = mapper.relationships[relation]
+        keys = [mapper.get_property_by_column(column).key for column in mapper.primary_key]
+
+        # The parent is aliased, the relation may refer to its own model
+        parent = aliased(self.model)
+        partition = [getattr(parent, key) for key in keys]
+        row_number = func.row_number().over(partition_by=partition, order_by=prop.order_by or prop.mapper.primary_key)
+
+        query = self.session.query(prop.mapper.class_,
+                                   *[column.label('parent_%u' % number) for number, column in enumerate(partition)])
+        query = query.add_columns(row_number.label('row_number')).select_from(parent).join(getattr(parent, relation))
+        subquery = query.filter(self.identity_condition(identities, parent)).subquery()
+
+        parents = [subquery.c['parent_%u' % number] for number in range(len(keys))]
+        query = self.session.query(aliased(prop.mapper.class_, subquery), *parents)
+        query = query.filter(subquery.c.row_number <= limit).order_by(*parents).order_by(subquery.c.row_number)
+
+        rtn = {}
+        for row in query:
+            rtn.setdefault(tuple(row[1:]), []).append(row[0])
+        return rtn
+
+    def identity_condition(self, identities: list, entity=None):
+        """
+            Returns the condition matching all instances with one of the identities
+
+            :param identities: Identities (tuple of primary keys) of the instances
+            :param entity: An alias of the model the condition refers to instead of the model
+        """
+        primary_keys = sqinspect(self.model).primary_key
+        if entity is not None:
+            primary_keys = [getattr(entity, sqinspect(self.model).get_property_by_column(column).key)
+                            for column in primary_keys]
+
+        if len(primary_keys) == 1:
+            return primary_keys[0].in_([identity[0] for identity in identities])
+        else:
+            return or_(*[and_(*[column == value for column, value in zip(primary_keys, identity)])
+                         for identity in identities])
+
+    def existing_identities(self, identities: list, chunk_size: int=500) -> set:
+        """
+            Returns the identities of which an instance exists, without loading the instances
+
+            :param identities: Identities (tuple of primary keys) of the instances
+            :param chunk_size: Maximal number of identities per query, bound parameters are limited by most databases
+        """
+        primary_keys = sqinspect(self.model).primary_key
+
+        rtn = set()
+        for offset in range(0, len(identities), chunk_size):
+            chunk = identities[offset:offset + chunk_size]
+            query = self.session.query(*primary_keys).filter(self.identity_condition(chunk))
+            rtn.update(tuple(row) for row in query)
+        return rtn
+
+    def bulk_update(self, rows: list) -> int:
+        """
+            Updates every row with its own values, rows with the same columns are written in one executemany
+
+            The instances are neither loaded nor refreshed, the session is not synchronized.
+
+            :param rows: List of dictionaries of attribute to value, must include the primary keys
+            :return: Number of rows
+        """
+        for values in rows:
+            for key in values:
+                if key not in self.columns:
+                    raise IllegalArgumentError("Column '%s' not defined for %s" % (key, self.__name__))
+
+        self.session.bulk_update_mappings(sqinspect(self.model), rows)
+        return len(rows)
+
     def __call__(self, **kwargs):
         instance = self.model()
         for key, value in kwargs.items():
             setattr(instance, key, value)
         self.session.add(instance)
         return instance
+
+
+class RelatedModelWrapper(SessionedModelWrapper):
+    """
+        Wrapper around the related model of a relation of one parent instance
+
+        All queries are restricted to the instances related to parent
+    """
+
+    def __init__(self, parent, relation: str, session):
+        super().__init__(getattr(type(parent), relation).property.mapper.class_, session)
+        self.parent = parent
+        self.relation = relation
+
+    def query(self) -> Query:
+        """
+            The base query restricted to the related instances of parent
+        """
+        return self.session.query(self.model).with_parent(self.parent, self.relation)